@@ -0,0 +1,75 @@
+// -----------------------------------------------------------------------------
+// Clientside callbacks for Clensed
+//
+// Anything that only maps one prop to another (tab switching, showing and
+// hiding the sidebar controls) runs here in the browser, so it never takes
+// a round trip or a worker away from the data callbacks.
+// -----------------------------------------------------------------------------
+var SHOW = {'display': 'block'};
+var HIDE = {'display': 'none'};
+
+// Sidebar state for each tab: business unit dropdown disabled, menu open,
+// then the menu column's width and its xs, sm, md, lg and xl sizes
+var TAB_SIDEBAR = {
+    'tab_map': [true, true, '0%', 6, 5, 4, 3, 2],
+    'tab_total': [false, true, '0%', 6, 5, 4, 3, 2],
+    'tab_oprisk_fig': [false, true, '0%', 6, 5, 4, 3, 2],
+    'tab_alldata': [false, true, '0%', 6, 5, 4, 3, 2]
+};
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    raca: {
+        toggle_tabs: function(active_tab) {
+            var sidebar = TAB_SIDEBAR[active_tab];
+            if (!sidebar) {
+                return new Array(8).fill(window.dash_clientside.no_update);
+            }
+            return sidebar;
+        },
+
+        // Only show the L2 and L3 dropdowns once an L1 category is picked
+        show_unless_all: function(value) {
+            return value === 'All' ? HIDE : SHOW;
+        },
+
+        // Only show the legend on the Risk Table tab
+        show_on_risk_table: function(active_tab) {
+            return active_tab === 'tab_total' ? SHOW : HIDE;
+        },
+
+        // Only show Select Business Unit on the Overview tab
+        show_on_overview: function(active_tab) {
+            return active_tab === 'tab_map' ? SHOW : HIDE;
+        },
+
+        // Turn a columnar table page from raca/wire.py back into the list of
+        // row records a DataTable wants
+        expand_columnar: function(page) {
+            if (!page) {
+                // The layout already has the first page
+                return window.dash_clientside.no_update;
+            }
+            var names = Object.keys(page.columns);
+            var rows = new Array(page.length);
+            for (var i = 0; i < page.length; i++) {
+                rows[i] = {};
+            }
+            names.forEach(function(name) {
+                var column = page.columns[name];
+                var i;
+                if (Array.isArray(column)) {
+                    for (i = 0; i < page.length; i++) {
+                        rows[i][name] = column[i];
+                    }
+                } else {
+                    for (i = 0; i < page.length; i++) {
+                        var code = column.codes[i];
+                        rows[i][name] = code < 0 ? null
+                                                 : column.dictionary[code];
+                    }
+                }
+            });
+            return rows;
+        }
+    }
+});
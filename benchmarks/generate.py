@@ -0,0 +1,330 @@
+import argparse
+import datetime
+import json
+import os
+import string
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from raca.schema import BUSINESS_UNITS, COLUMN_MAP  # noqa: E402
+
+# ------------------------------------------------------------------------------
+# Synthetic RACA registers for benchmarking, from a thousand rows to millions
+#
+# The sheet is laid out like clensed.csv: a risk repeats on a row for each of
+# its controls, and a control on a row for each of its actions. Only a risk's
+# first row has its I/L scores.
+#
+# The value pools come from clensed.csv, including its stray spaces and
+# typos: owners, the Risk Category 1 -> 2 -> 3 hierarchy, control
+# attributes, decisions and commentary. Each risk's four I/L scores are drawn
+# together from a scored risk in clensed.csv, so gross and net stay related
+# the way they are there.
+#
+# Generated as well:
+# - risk IDs like AP-P01-R04, numbered within each business unit
+# - control IDs like CID-01 and action IDs like A001 (sometimes 'a002')
+# - action due dates around the reporting date, in the ways people type
+#   them: 31/03/2021, Mar-21, ISO dates, Excel serials, and some text that
+#   isn't a date
+#
+# Business units are the built-in ones plus as many more as the size calls
+# for, of very different sizes, written to a RACA_BUSINESS_UNITS file next to
+# the data. A few risks have a prefix that isn't in it and show up as
+# Unmapped.
+#
+#   python -m benchmarks.generate 1000000 raca-1m.csv [--seed 0]
+# ------------------------------------------------------------------------------
+SAMPLE = os.path.join(ROOT, 'clensed.csv')
+
+# The workbook's own headers, in order. Its second I and L are the net scores.
+HEADERS = [header.split('.')[0] for header in COLUMN_MAP]
+
+SCORES = ['I', 'L', 'I.1', 'L.1']
+CONTROL = ['Control ID', 'Control Owner', 'Control (Title)',
+           'Control Description', 'Control Activity', 'Control Type',
+           'Control Frequency', 'DE & OE?',
+           'Commentary on DE & OE assessment']
+
+# Shape of the register
+RISKS_PER_UNIT = 5000
+RISKS_PER_PROCESS = 4
+CONTROLS_PER_RISK = 1.2         # mean number over 1
+CONTROLS_MAX = 8
+ACTION_SHARE = 0.3              # controls with any actions
+ACTIONS_MAX = 3
+UNMAPPED_SHARE = 0.01
+LOWER_CASE_SHARE = 0.1          # 'made up process 2', 'a002'
+COMPLETED_SHARE = 0.25
+
+# How action due dates are typed, and how often
+DATE_STYLES = {'%d/%m/%Y': 0.55, '%b-%y': 0.15, '%Y-%m-%d': 0.15,
+               'serial': 0.05, 'text': 0.05, 'blank': 0.05}
+NOT_DATES = ['TBC', 'tbc', 'Ongoing', '31-23-2021']
+DUE_MONTHS = 12                 # either side of the reporting date
+
+_EXCEL_EPOCH = datetime.date(1899, 12, 30)
+
+
+def _sample():
+    sample = pd.read_csv(SAMPLE, encoding='utf-8-sig', dtype=str,
+                         keep_default_na=False)
+    risks = sample[sample['Risk ID'] != ''].drop_duplicates('Risk ID')
+    return {
+        'hierarchy': risks[['Risk Category 1', 'Risk Category 2',
+                            'Risk Category 3']].drop_duplicates()
+                     .to_numpy(dtype=object),
+        'scores': risks.loc[(risks[SCORES] != '').all(axis=1),
+                            SCORES].to_numpy(dtype=object),
+        # Every other column as the list of values it takes, repeats and
+        # blanks included, so drawing from it keeps their frequencies
+        'values': {column: sample[column].to_numpy(dtype=object)
+                   for column in sample.columns},
+    }
+
+
+def _draw(rng, values, size):
+    return values[rng.integers(0, len(values), size)]
+
+
+def _numbered(text, numbers, width=0):
+    numbers = pd.Series(numbers).astype(str)
+    if width:
+        numbers = numbers.str.zfill(width)
+    return (text + numbers).to_numpy(dtype=object)
+
+
+def _prefixes(count):
+    # The built-in units first, then AA, AB, ... skipping those
+    prefixes = list(BUSINESS_UNITS)
+    letters = string.ascii_uppercase
+    for first in letters:
+        for second in letters:
+            if len(prefixes) >= count:
+                return prefixes
+            if first + second not in prefixes and first + second != 'ZZ':
+                prefixes.append(first + second)
+    return prefixes
+
+
+def business_units(prefixes):
+    return {prefix: BUSINESS_UNITS.get(prefix, f'Business Unit {prefix}')
+            for prefix in prefixes}
+
+
+def _due_dates(rng, today, size):
+    days = rng.integers(-DUE_MONTHS * 30, DUE_MONTHS * 30, size)
+    dates = pd.Series(pd.Timestamp(today) + pd.to_timedelta(days, unit='D'))
+    styles = rng.choice(list(DATE_STYLES), size,
+                        p=list(DATE_STYLES.values()))
+
+    due = np.full(size, '', dtype=object)
+    for style in DATE_STYLES:
+        rows = styles == style
+        if style == 'serial':
+            due[rows] = [str((date.date() - _EXCEL_EPOCH).days)
+                         for date in dates[rows]]
+        elif style == 'text':
+            due[rows] = _draw(rng, np.array(NOT_DATES, dtype=object),
+                              rows.sum())
+        elif style != 'blank':
+            due[rows] = dates[rows].dt.strftime(style).to_numpy(dtype=object)
+
+    # Completed actions were finished up to a month either side of their due
+    completed = (rng.random(size) < COMPLETED_SHARE) & (styles != 'blank')
+    done = dates + pd.to_timedelta(rng.integers(-30, 30, size), unit='D')
+    completion = np.where(completed,
+                          done.dt.strftime('%d/%m/%Y').to_numpy(dtype=object),
+                          '')
+    return due, completion
+
+
+# ------------------------------------------------------------------------------
+# A raw RACA sheet of rows rows, with the workbook's headers (the net scores
+# as I.1 and L.1, as pandas reads them), and the business units its risk IDs
+# use as {prefix: name}
+# ------------------------------------------------------------------------------
+def generate_raca(rows, seed=0, today=None):
+    if rows < 1:
+        raise ValueError('rows must be at least 1')
+    rng = np.random.default_rng(seed)
+    sample = _sample()
+    values = sample['values']
+    today = today or datetime.date.today()
+
+    # --- The shape: how many controls each risk has and actions each control
+    # has, for just enough risks to fill rows
+    n_risks = rows
+    while True:
+        n_controls = np.minimum(1 + rng.poisson(CONTROLS_PER_RISK, n_risks),
+                                CONTROLS_MAX)
+        control_risk = np.repeat(np.arange(n_risks), n_controls)
+        n_actions = np.where(
+            rng.random(len(control_risk)) < ACTION_SHARE,
+            rng.integers(1, ACTIONS_MAX + 1, len(control_risk)), 0)
+        risk_rows = np.bincount(control_risk, np.maximum(n_actions, 1),
+                                n_risks).cumsum()
+        if risk_rows[-1] >= rows:
+            break
+        n_risks *= 2
+    n_risks = int(np.searchsorted(risk_rows, rows)) + 1
+    kept = control_risk < n_risks
+    control_risk, n_actions = control_risk[kept], n_actions[kept]
+
+    # --- Risks, in business units of very different sizes
+    n_units = max(len(BUSINESS_UNITS), -(-n_risks // RISKS_PER_UNIT))
+    prefixes = _prefixes(n_units) + ['ZZ']
+    weights = 1 / np.arange(1, n_units + 1)
+    weights = np.append(weights / weights.sum() * (1 - UNMAPPED_SHARE),
+                        UNMAPPED_SHARE)
+    unit = np.sort(rng.choice(len(prefixes), n_risks, p=weights))
+    prefix = np.array(prefixes, dtype=object)[unit]
+
+    # Numbered within each unit, each in one of the unit's processes so far
+    first = np.searchsorted(unit, unit)
+    risk_no = np.arange(n_risks) - first + 1
+    process_no = rng.integers(1, risk_no // RISKS_PER_PROCESS + 2)
+    process_id = pd.factorize(pd.Series(unit) * 100000 + process_no)[0] + 1
+
+    risks = pd.DataFrame({
+        'Process (Title)': _numbered('Made up process ', process_id),
+        'Process description': _numbered('Description ', process_id),
+        'Risk ID': (pd.Series(prefix) + '-P' +
+                    pd.Series(process_no).astype(str).str.zfill(2) + '-R' +
+                    pd.Series(risk_no).astype(str).str.zfill(2))
+                   .to_numpy(dtype=object),
+        'Risk Owner': _draw(rng, values['Risk Owner'], n_risks),
+        'Risk(Title)': _numbered('Risk Title ', np.arange(1, n_risks + 1)),
+        'Risk Description': _numbered('Risk ', np.arange(1, n_risks + 1)),
+    })
+    lower = rng.random(n_risks) < LOWER_CASE_SHARE
+    risks.loc[lower, 'Process (Title)'] = (
+        risks.loc[lower, 'Process (Title)'].str.lower())
+    categories = _draw(rng, sample['hierarchy'], n_risks)
+    for i, column in enumerate(['Risk Category 1', 'Risk Category 2',
+                                'Risk Category 3']):
+        risks[column] = categories[:, i]
+    for column in ('Associated KRIs', 'Commentary on Net Risk Assessment',
+                   'Risk Decision'):
+        risks[column] = _draw(rng, values[column], n_risks)
+    scores = _draw(rng, sample['scores'], n_risks)
+
+    # --- Controls
+    total_controls = len(control_risk)
+    controls = {
+        'Control ID': _numbered('CID-', np.arange(1, total_controls + 1), 2),
+        'Control Description': _numbered('Control ',
+                                         np.arange(1, total_controls + 1)),
+    }
+    for column in CONTROL:
+        if column not in controls:
+            controls[column] = _draw(rng, values[column], total_controls)
+
+    # --- Rows, one per action or for a control without any, cut to size
+    row_control = np.repeat(np.arange(total_controls),
+                            np.maximum(n_actions, 1))[:rows]
+    has_action = np.repeat(n_actions > 0, np.maximum(n_actions, 1))[:rows]
+    row_risk = control_risk[row_control]
+
+    sheet = {column: risks[column].to_numpy(dtype=object)[row_risk]
+             for column in risks.columns}
+    for column, column_values in controls.items():
+        sheet[column] = column_values[row_control]
+
+    # Scores on each risk's first row only
+    first_row = np.r_[True, row_risk[1:] != row_risk[:-1]]
+    for i, column in enumerate(SCORES):
+        sheet[column] = np.where(first_row, scores[row_risk, i], '')
+
+    actions = np.flatnonzero(has_action)
+    due, completion = _due_dates(rng, today, len(actions))
+    action_id = _numbered('A', np.arange(1, len(actions) + 1), 3)
+    lower = rng.random(len(actions)) < LOWER_CASE_SHARE
+    action_id[lower] = [value.lower() for value in action_id[lower]]
+    for column, column_values in [
+            ('Issue Description (if applicable)',
+             _draw(rng, values['Issue Description (if applicable)'][
+                 values['Issue Description (if applicable)'] != ''],
+                 len(actions))),
+            ('Action Description',
+             _draw(rng, values['Action Description'][
+                 values['Action Description'] != ''], len(actions))),
+            ('Action Owner',
+             _draw(rng, values['Action Owner'][values['Action Owner'] != ''],
+                   len(actions))),
+            ('Action Due Date', due),
+            ('Completion Date', completion),
+            ('Action ID', action_id)]:
+        sheet[column] = np.full(rows, '', dtype=object)
+        sheet[column][actions] = column_values
+
+    df = pd.DataFrame(sheet)[list(COLUMN_MAP)]
+    used = sorted(set(prefix[np.unique(row_risk)]) - {'ZZ'})
+    return df, business_units(used)
+
+
+# ------------------------------------------------------------------------------
+# Write a generated sheet as CSV or xlsx (by the file extension), with the
+# business units next to it as <name>-units.json for RACA_BUSINESS_UNITS.
+# Returns the path of the units file.
+# ------------------------------------------------------------------------------
+def units_path(path):
+    return os.path.splitext(path)[0] + '-units.json'
+
+
+def write_raca(df, units, path):
+    if path.lower().endswith('.xlsx'):
+        import openpyxl
+
+        if len(df) >= 2**20:
+            raise ValueError(f'{len(df)} rows is more than an xlsx sheet '
+                             'holds, write a .csv instead')
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet('RACA')
+        sheet.append(HEADERS)
+        scores = [df.columns.get_loc(column) for column in SCORES]
+        for row in df.itertuples(index=False, name=None):
+            row = list(row)
+            for i in scores:
+                row[i] = int(row[i]) if row[i] else None
+            sheet.append([None if value == '' else value for value in row])
+        workbook.save(path)
+    else:
+        df.to_csv(path, index=False, header=HEADERS)
+
+    with open(units_path(path), 'w') as f:
+        json.dump(units, f, indent=1)
+    return units_path(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.generate',
+        description='write a synthetic RACA register')
+    parser.add_argument('rows', type=int, help='rows in the sheet')
+    parser.add_argument('path', help='file to write, .csv or .xlsx')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed (default: %(default)s)')
+    parser.add_argument('--date', type=datetime.date.fromisoformat,
+                        help='reporting date the action due dates are '
+                             'spread around (default: today)')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    df, units = generate_raca(args.rows, args.seed, args.date)
+    units_file = write_raca(df, units, args.path)
+    print(f'Wrote {len(df)} rows, {df["Risk ID"].nunique()} risks in '
+          f'{len(units)} business units, to {args.path} in '
+          f'{time.perf_counter() - started:.1f}s')
+    print(f'Set RACA_BUSINESS_UNITS={units_file} to name its business units')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
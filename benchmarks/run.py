@@ -0,0 +1,361 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# ------------------------------------------------------------------------------
+# Benchmark suite
+#
+#   python -m benchmarks.run --rows 1000000 [--output results.json]
+#                            [--compare baseline.json]
+#
+# or python path/to/benchmarks/run.py ... from any directory.
+#
+# Generates a synthetic register of --rows rows (see benchmarks/generate.py),
+# or reads --data, and times each stage a request goes through:
+#
+#   ingest.*         parsing the source, writing and memory-mapping the cache
+#   business_unit    splitting the risk IDs into business units
+#   publish          a new version going live, with its default view
+#   options.*        the dropdown option callbacks
+#   update_figure.*  each Overview chart, for All and, for the ones that
+#                    filter, one risk category; .cold builds it from a
+#                    fresh version
+#   table.*          a page of each table through its callback, encoding a
+#                    page in each wire format, and streaming the whole table
+#                    as CSV
+#
+# Callbacks are posted to the app the way the browser does, so they include
+# Dash's own work and the JSON encoding of the response. The charts are
+# built by calling them directly, as their callback hands them the dropdowns
+# in a different order from the one they declare (see register_chart in
+# clensed.py), so through it the filtered charts would never be filtered.
+# The chart cache is off so publishing builds the default view's charts.
+#
+# The results are written as JSON with the machine, versions and commit they
+# came from. --compare reads an earlier results file and flags every stage
+# whose median is --threshold times slower than it was, exiting with 1 if
+# any are, so it can gate a CI job.
+# ------------------------------------------------------------------------------
+HEAVY = ('ingest.parse', 'ingest.cache_write', 'publish', 'table.table.csv',
+         'table.allraca.csv')
+
+# The Overview charts that change with the dropdowns, timed for one risk
+# category as well as for All
+FILTERED_CHARTS = ('barchart1',)
+
+# Changes smaller than this are noise, whatever their ratio
+NOISE_SECONDS = 0.002
+
+
+class Timer:
+
+    def __init__(self, repeat, heavy_repeat):
+        self.repeat = repeat
+        self.heavy_repeat = heavy_repeat
+        self.results = {}
+
+    def __call__(self, name, run, setup=None):
+        repeat = self.heavy_repeat if name in HEAVY else self.repeat
+        seconds = []
+        for _ in range(repeat):
+            args = setup() if setup else ()
+            started = time.perf_counter()
+            result = run(*args)
+            seconds.append(time.perf_counter() - started)
+        self.results[name] = {'median': statistics.median(seconds),
+                              'min': min(seconds), 'max': max(seconds),
+                              'runs': len(seconds)}
+        print(f'{name:<40} {statistics.median(seconds) * 1000:>10.1f} ms')
+        return result
+
+
+# ------------------------------------------------------------------------------
+# Posting a callback to the app, as the browser does
+# ------------------------------------------------------------------------------
+class Callbacks:
+
+    def __init__(self, app):
+        self.client = app.server.test_client()
+        self.dependencies = self.client.get('/_dash-dependencies').get_json()
+
+    def _dependency(self, output):
+        for dependency in self.dependencies:
+            outputs = dependency['output'].strip('.').split('...')
+            if output in outputs:
+                return dependency
+        raise KeyError(output)
+
+    def __call__(self, output, values):
+        dependency = self._dependency(output)
+        spec = dependency['output']
+        if spec.startswith('..'):
+            outputs = [dict(zip(('id', 'property'), item.rsplit('.', 1)))
+                       for item in spec.strip('.').split('...')]
+        else:
+            outputs = dict(zip(('id', 'property'), spec.rsplit('.', 1)))
+        inputs = [dict(item, value=values.get(
+                      f'{item["id"]}.{item["property"]}'))
+                  for item in dependency['inputs']]
+        state = [dict(item, value=values.get(
+                     f'{item["id"]}.{item["property"]}'))
+                 for item in dependency.get('state', [])]
+        response = self.client.post('/_dash-update-component', json={
+            'output': spec, 'outputs': outputs, 'inputs': inputs,
+            'state': state,
+            'changedPropIds': [f'{item["id"]}.{item["property"]}'
+                               for item in dependency['inputs'][:1]]})
+        if response.status_code != 200:
+            raise RuntimeError(f'{output} returned {response.status_code}: '
+                               f'{response.data[:200]!r}')
+        return response.data
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ------------------------------------------------------------------------------
+# The suite. The app's settings are read from the environment when raca is
+# first imported, so configure() has to come before anything imports it,
+# benchmarks.generate included.
+# ------------------------------------------------------------------------------
+def configure(path, storage, work_dir):
+    os.environ.update({
+        'RACA_DATA': path,
+        'RACA_CACHE_DIR': os.path.join(work_dir, 'cache'),
+        'RACA_STORAGE': storage,
+        'RACA_FIGURE_CACHE': 'off',
+        'RACA_WATCH': '0',
+        'RACA_PRELOAD': '0',
+        'RACA_MEMORY_MB': '0',
+    })
+    os.environ.pop('RACA_DATASETS', None)
+    # Generated data names its business units in a file next to it
+    units = os.path.splitext(path)[0] + '-units.json'
+    if os.path.exists(units) or not os.path.exists(path):
+        os.environ['RACA_BUSINESS_UNITS'] = units
+
+
+def run_suite(path, repeat=5, heavy_repeat=1, storage='memory'):
+    import pandas as pd
+
+    from raca import fastjson
+    from raca.cache import read_cache, source_meta, write_cache
+    from raca.dataset import Dataset
+    from raca.ingest import load_source
+    from raca.prepare import parse_risk_ids
+    from raca.storage import get_engine
+    from raca.stream import csv_text, encode_stream
+    from raca.wire import COLUMNAR, encode, table_columns
+    import clensed
+
+    timer = Timer(repeat, heavy_repeat)
+
+    # --- Ingestion
+    df = timer('ingest.parse', lambda: load_source(path))
+    meta = source_meta(path)
+    timer('ingest.cache_write', lambda: write_cache(path, df, meta))
+    df = timer('ingest.cache_read', lambda: read_cache(path))
+
+    # --- Business units, from the risk IDs as they are in the sheet
+    risk_ids = df['risk_id'].astype(object)
+    timer('business_unit', lambda: parse_risk_ids(risk_ids))
+
+    # --- A new version going live
+    store = clensed.registry.store()
+
+    def unloaded():
+        store.unload()
+        return (df,)
+    timer('publish', store.publish, setup=unloaded)
+    dataset = clensed.get_dataset()
+    token = clensed.dataset_token(dataset)
+
+    def fresh():
+        # The same data as a version nothing has been worked out for yet
+        return (Dataset(df, dataset.version, dataset.source, dataset.name),)
+
+    # --- Dropdown options
+    call = Callbacks(clensed.app)
+    taxonomy = get_engine(dataset).taxonomy()
+    risk_type = taxonomy['risk_types'][0]['value']
+    risk = taxonomy['risk'][risk_type][0]['value']
+    values = {'dataset-version.data': token, 'risk_types.value': risk_type,
+              'risk.value': risk}
+    for output in ('risk_types.options', 'business_unit_dropdown.options',
+                   'risk.options', 'level3.options'):
+        timer(f'options.{output.split(".")[0]}', lambda: call(output, values))
+    timer('options.taxonomy.cold',
+          lambda dataset: get_engine(dataset).taxonomy(), setup=fresh)
+    timer('options.business_unit.cold',
+          lambda dataset: clensed.dropdown_options(dataset, 'business_unit'),
+          setup=fresh)
+
+    # --- Overview charts, with their arguments in the order they declare
+    # them (risk_types, risk, selected_scale)
+    for chart_id, build_figure in clensed.OVERVIEW_CHARTS.items():
+        selections = [('', ('All', 'All', 'All'))]
+        if chart_id in FILTERED_CHARTS:
+            selections.append(('.filtered', (risk_type, risk, 'All')))
+        figures = {}
+        for name, selection in selections:
+            figures[name] = timer(
+                f'update_figure.{chart_id}{name}',
+                lambda: build_figure(dataset, *selection))
+            timer(f'update_figure.{chart_id}{name}.cold',
+                  lambda dataset: build_figure(dataset, *selection),
+                  setup=fresh)
+        if ('.filtered' in figures and
+                figures[''].to_json() == figures['.filtered'].to_json()):
+            raise RuntimeError(f'{chart_id} is the same filtered as not')
+
+    # --- Tables
+    for table in (clensed.data_table, clensed.all_raca_table):
+        columns = table_columns(table)
+        timer(f'table.{table.id}.page', lambda: call(
+            f'{table.id}{"-page" if clensed.WIRE_FORMAT == COLUMNAR else ""}'
+            '.data', {
+                f'{table.id}.page_current': 1,
+                f'{table.id}.page_size': clensed.PAGE_SIZE,
+                f'{table.id}.sort_by': [{'column_id': 'risk_id',
+                                         'direction': 'desc'}],
+                f'{table.id}.filter_query': '',
+                'dataset-version.data': token}))
+        rows, _ = clensed.table_rows(dataset, table)
+        for wire_format in ('columnar', 'records'):
+            timer(f'table.{table.id}.encode.{wire_format}',
+                  lambda: fastjson.dumps(encode(rows, wire_format)))
+
+        def stream():
+            _, chunks = get_engine(dataset).rows(
+                clensed.TABLE_VIEWS[table.id], columns)
+            return sum(len(part) for part in encode_stream(
+                csv_text(chunks, columns, columns), 'gzip'))
+        timer(f'table.{table.id}.csv', stream)
+
+    return {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'source': path,
+        'rows': len(df),
+        'storage': storage,
+        'repeat': repeat,
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'results': timer.results,
+    }
+
+
+# ------------------------------------------------------------------------------
+# Comparing with an earlier run
+# ------------------------------------------------------------------------------
+def compare(baseline, current, threshold):
+    for key in ('rows', 'storage', 'cpus'):
+        if baseline.get(key) != current.get(key):
+            print(f'Note: the baseline has {key} {baseline.get(key)}, this '
+                  f'run {current.get(key)}')
+    regressions = []
+    print(f'\n{"stage":<40} {"baseline":>10} {"now":>10} {"change":>8}')
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        was, now = before['median'], result['median']
+        slower = now > was * threshold and now - was > NOISE_SECONDS
+        if slower:
+            regressions.append(name)
+        print(f'{name:<40} {was * 1000:>8.1f}ms {now * 1000:>8.1f}ms '
+              f'{(now / was - 1) * 100 if was else 0:>+7.0f}%'
+              f'{"  SLOWER" if slower else ""}')
+    if regressions:
+        print(f'\n{len(regressions)} stages are more than {threshold}x slower '
+              f'than {baseline["commit"] or "the baseline"}')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run',
+                                     description='time the RACA app stages')
+    parser.add_argument('--rows', type=int, default=100000,
+                        help='rows of synthetic data (default: %(default)s)')
+    parser.add_argument('--data',
+                        help='benchmark this RACA source instead')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed for the synthetic data (default: '
+                             '%(default)s)')
+    parser.add_argument('--storage', choices=['memory', 'sqlite'],
+                        default='memory',
+                        help='RACA_STORAGE to run with (default: '
+                             '%(default)s)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='runs of each stage (default: %(default)s)')
+    parser.add_argument('--heavy-repeat', type=int, default=1,
+                        help='runs of the ingest, publish and CSV stages '
+                             '(default: %(default)s)')
+    parser.add_argument('--output', metavar='PATH',
+                        help='results file (default: '
+                             'benchmarks/results/<rows>-<storage>.json, '
+                             'ignored by git)')
+    parser.add_argument('--compare', metavar='PATH',
+                        help='results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='how many times slower a stage may get before '
+                             'it counts as a regression (default: '
+                             '%(default)s)')
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix='raca-bench-')
+    try:
+        path = os.path.abspath(args.data or os.path.join(
+            work_dir, f'raca-{args.rows}.csv'))
+        configure(path, args.storage, work_dir)
+        if args.data is None:
+            from benchmarks.generate import generate_raca, write_raca
+
+            started = time.perf_counter()
+            write_raca(*generate_raca(args.rows, args.seed), path)
+            print(f'Generated {args.rows} rows in '
+                  f'{time.perf_counter() - started:.1f}s')
+        report = run_suite(path, args.repeat, args.heavy_repeat,
+                           args.storage)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if args.data is None:
+        report['source'] = f'synthetic, seed {args.seed}'
+
+    output = args.output or os.path.join(
+        ROOT, 'benchmarks', 'results',
+        f'{report["rows"]}-{args.storage}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=1)
+    print(f'Wrote {output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, report, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
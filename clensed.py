@@ -1,7 +1,13 @@
+import copy
+import logging
+import os
+from urllib.parse import parse_qs, urlencode, urlparse
+
 import dash
-from dash.dependencies import Input, Output
+import flask
+from dash.dependencies import ClientsideFunction, Input, Output, State
+from dash.exceptions import PreventUpdate
 import pandas as pd
-import re
 import plotly.express as px
 import plotly.graph_objects as go
 import dash_table
@@ -10,6 +16,19 @@ import dash_core_components as dcc
 import dash_html_components as html
 from itertools import cycle
 
+from raca import get_dataset, preload, registry, start_watcher
+from raca import fastjson
+from raca.aging import open_actions
+from raca.export import FORMATS, export_path, job_status, start_export
+from raca.figcache import FigureCache, cached_figure, figure_key
+from raca.metrics import CallbackMetrics, instrument_callbacks
+from raca.procmem import process_memory
+from raca.query import PAGE_SIZE
+from raca.storage import get_engine
+from raca.stream import (SIDEBAR_FILTERS, csv_text, encode_stream,
+                         pick_encoding, sidebar_filter_query)
+from raca.wire import COLUMNAR, encode, table_columns
+
 # ------------------------------------------------------------------------------
 # Set Plotly as our defauly plotting backend
 # ------------------------------------------------------------------------------
@@ -28,121 +47,72 @@ color_3 = "#000000"
 palette = cycle(px.colors.qualitative.Dark24)
 
 # ------------------------------------------------------------------------------
-# Import TEST RACA Data /Prepare the RACA Data
+# How often, in seconds, an open page checks for a new version of the RACA
+# data
 # ------------------------------------------------------------------------------
-# Test data
-APP_DATA = "clensed.xlsx"
-
-# import TEST dataframe and do some column renames
-raca_df = pd.read_excel(APP_DATA)
+DATASET_POLL_SECONDS = int(os.environ.get('RACA_POLL', '30'))
 
 # ------------------------------------------------------------------------------
-# Rename our column headers
+# How table pages are sent to the browser: 'columnar' (default, repeated text
+# sent once and expanded by assets/raca.js) or 'records'. See raca/wire.py.
 # ------------------------------------------------------------------------------
+WIRE_FORMAT = os.environ.get('RACA_WIRE_FORMAT', COLUMNAR)
 
-raca_df.rename(columns={'Process (Title)': 'process_title',
-                        'Process description': 'process_description',
-                        'Risk ID': 'risk_id',
-                        'Risk Owner': 'risk_owner',
-                        'Risk(Title)': 'risk_title',
-                        'Risk Description': 'risk_description',
-                        'Risk Category 1': 'risk_types',
-                        'Risk Category 2': 'risk',
-                        'Risk Category 3': 'level3',
-                        'Associated KRIs': 'associated_kris',
-                        'I': 'gross_impact',
-                        'L': 'gross_likelihood',
-                        'Control ID': 'control_id',
-                        'Control Owner': 'control_owner',
-                        'Control (Title)': 'control_title',
-                        'Control Description': 'control_description',
-                        'Control Activity': 'control_activity',
-                        'Control Type': 'control_type',
-                        'Control Frequency': 'control_frequency',
-                        'DE & OE?': 'de_oe',
-                        'Commentary on DE & OE assessment': 'de_oe_commentary',
-                        'I.1': 'net_impact',
-                        'L.1': 'net_likelihood',
-                        'Commentary on Net Risk Assessment':
-                            'net_risk_assesment_commentary',
-                        'Risk Decision': 'risk_decision',
-                        'Issue Description (if applicable)':
-                            'issue_description',
-                        'Action Description': 'action_description',
-                        'Action Owner': 'action_owner',
-                        'Action Due Date': 'action_due_date',
-                        'Completion Date': 'completion_date',
-                        'Action ID': 'action_id'
-                        }, inplace=True)
 # ------------------------------------------------------------------------------
-# calculate our gross and net risk scores
-# it does this by multiplying the impact and likelihood columns
-# the results are appended to teh df dataframe under columns
-# gross_risk and net_risk respectivly
+# Logging is quiet unless RACA_LOG_LEVEL asks for more, e.g. DEBUG to log every
+# callback with its timing and the inputs that triggered it. Callback metrics
+# are always collected and served from /metrics.
 # ------------------------------------------------------------------------------
-raca_df['gross_risk'] = raca_df['gross_impact'] * raca_df['gross_likelihood']
-raca_df['net_risk'] = raca_df['net_impact'] * raca_df['net_likelihood']
+LOG_LEVEL = os.environ.get('RACA_LOG_LEVEL', 'WARNING').upper()
+
+logger = logging.getLogger('clensed')
 
-# convert the two new columns to numeric fields
-raca_df['gross_risk'].apply(pd.to_numeric)
-raca_df['net_risk'].apply(pd.to_numeric)
+callback_metrics = CallbackMetrics()
 
 # ------------------------------------------------------------------------------
-# create our function to work through df['risk_id'] and just extract
-# the alpha prefix from the risk_id. E.g 'GMBH-P01-R01' becomes 'GMBH'
-# 'GMBH' is then appended to the list prefix[]
+# DATASETS
+# A page shows one of the registry's datasets, picked with ?dataset=<name> in
+# the URL or from the dropdown in the navbar. The page keeps a token of the
+# dataset's name and version in the 'dataset-version' store, and every
+# callback looks its dataset up from that.
 # ------------------------------------------------------------------------------
-prefix = []
+def dataset_token(dataset):
+    return {'name': dataset.name, 'version': dataset.version}
 
 
-def business_unit():
-    prefix_search = re.compile(r'^[a-zA-Z]+')
+def token_dataset(token):
+    return get_dataset(token['name'] if token else None)
 
-    dff = raca_df
 
-    for e in dff['risk_id']:
-        zz = prefix_search.findall(str(e))
-        prefix.append(zz)
-    return prefix
+def version_key(dataset):
+    return [dataset.name, dataset.version]
 
 
-business_unit()
+# The dataset asked for by the page. Dash fetches the layout from the page
+# itself, so the page's URL is the referrer.
+def requested_dataset():
+    name = flask.request.args.get('dataset')
+    if name is None and flask.request.referrer:
+        query = parse_qs(urlparse(flask.request.referrer).query)
+        name = query.get('dataset', [None])[0]
 
-# ------------------------------------------------------------------------------
-# This takes our list of lists, 'prefix', from the function above and pulls out
-# all its members into one list 'extract'
-# ------------------------------------------------------------------------------
-extract = [item[0] for item in prefix]
+    if name is not None and name not in registry.names():
+        logger.warning('Unknown dataset %r, serving %s', name,
+                       registry.default)
+        name = None
+    return name
 
-# ------------------------------------------------------------------------------
-# Insert a new column to hold our business unit and populate it with Business
-# Unit Names. We get the business unit names from the 'extract[]' list in the
-# step above
-# ------------------------------------------------------------------------------
-result = []
-for value in extract:
-    if value == 'DP':
-        result.append('Data Privacy')
-    elif value == 'AP':
-        result.append('Accounts Payable')
-    elif value == 'BP':
-        result.append('British Petroleum')
-    elif value == 'CP':
-        result.append('Client Profile')
-    else:
-        print(f"Business Unit {value} has not been added to the function yet")
 
 # ------------------------------------------------------------------------------
-# Apply reuslts to 'business_unit' to create the column in the dataframe
+# Overview charts already built for a filter selection and dataset version.
+# Hit/miss counts are served as JSON from /_raca/figure-cache.
 # ------------------------------------------------------------------------------
-raca_df['business_unit'] = result
+figure_cache = FigureCache()
 
-# ------------------------------------------------------------------------------
-# Build app
-# ------------------------------------------------------------------------------
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
-app.title = "Clensed"
-server = app.server
+
+def overview_figure(output_id):
+    return cached_figure(figure_cache, output_id,
+                         lambda token: version_key(token_dataset(token)))
 
 # ------------------------------------------------------------------------------
 # Define graphs
@@ -167,105 +137,50 @@ graph_line = dcc.Graph(id="graph-line",
 # ------------------------------------------------------------------------------
 # Logo
 LOGO = "assets/raca.png"
-navbar = dbc.Navbar(
-    [
-        html.A(
-            # Use row and col to control vertical alignment of logo / brand
-            dbc.Row(
-                [
-                    dbc.Col(html.Img(src=LOGO, height="40px"), width="106px"),
-                    dbc.Col(dbc.NavbarBrand("Risk and Controls Assesments",
-                                            className="ml-10",
-                                            style={
-                                                'font-size': 40
-                                            }
-                                            )
-                            ),
-                ],
-                align="center",
-                no_gutters=True,
-            ),
-        ),
-        dbc.NavbarToggler(id="navbar-toggler"),
-    ],
-    color=color_2,
-    dark=True,
-)
 
-# ------------------------------------------------------------------------------
-# Define dropdowns
-# ------------------------------------------------------------------------------
-# ------------------------------------------------------------------------------
-# Risk Category 1
-# ------------------------------------------------------------------------------
-risk_types_dropdown = dcc.Dropdown(
-    id='risk_types',
-    multi=False,
-    value='All',
-    clearable=False,
-    searchable=True,
-    persistence=True,
-    persistence_type='session',
-    style={"width": "100%"},
-
-    options=[{'label': k, 'value': k}
-             for k in sorted(raca_df['risk_types'].astype(str).unique())] +
-            [{'label': 'All', 'value': 'All'}],
-)
-# ------------------------------------------------------------------------------
-# Risk Category 2
-# ------------------------------------------------------------------------------
-risk_dropdown = dcc.Dropdown(
-    id='risk',
-    multi=False,
-    value='All',
-    clearable=False,
-    searchable=True,
-    placeholder='Select...',
-    persistence=True,
-    persistence_type='session',
-    style={"width": "100%"},
-
-    options=[{'label': k, 'value': k}
-             for k in sorted(raca_df['risk'].astype(str).unique())]
-)
-# ------------------------------------------------------------------------------
-# Risk Category 2
-# ------------------------------------------------------------------------------
-level3_dropdown = dcc.Dropdown(
-    id='level3',
-    multi=False,
-    value='All',
-    clearable=False,
-    searchable=True,
-    placeholder='Select...',
-    persistence=True,
-    persistence_type='session',
-    style={"width": "100%"},
 
-    options=[],
+# The dataset picker only shows when there is more than one to pick from
+def build_navbar(dataset):
+    names = registry.names()
+    dataset_dropdown = dcc.Dropdown(
+        id='dataset',
+        options=[{'label': name, 'value': name} for name in names],
+        value=dataset.name if dataset is not None else None,
+        clearable=False,
+        searchable=True,
+        style={"width": "250px"},
+    )
+
+    return dbc.Navbar(
+        [
+            html.A(
+                # Use row and col to control vertical alignment of logo / brand
+                dbc.Row(
+                    [
+                        dbc.Col(html.Img(src=LOGO, height="40px"),
+                                width="106px"),
+                        dbc.Col(dbc.NavbarBrand("Risk and Controls Assesments",
+                                                className="ml-10",
+                                                style={
+                                                    'font-size': 40
+                                                }
+                                                )
+                                ),
+                    ],
+                    align="center",
+                    no_gutters=True,
+                ),
+            ),
+            html.Div(dataset_dropdown,
+                     className="ml-auto",
+                     style={"display": "block" if len(names) > 1
+                            else "none"}),
+            dbc.NavbarToggler(id="navbar-toggler"),
+        ],
+        color=color_2,
+        dark=True,
+    )
 
-)
-# ------------------------------------------------------------------------------
-# Dropdown containing business units
-# This can be used to just report on the RACAs from the particular business
-# unit.
-# ------------------------------------------------------------------------------
-business_unit_dropdown = dcc.Dropdown(
-    id="business_unit_dropdown",
-    multi=False,
-    value='All',
-    clearable=False,
-    searchable=True,
-    placeholder='Select ...',
-    persistence=True,
-    persistence_type='session',
-    style={"width": "100%"},
-
-    options=[{'label': k, 'value': k}
-             for k in sorted(raca_df['business_unit'].astype(str).unique())] +
-            [{'label': 'All', 'value': 'All'}],
-)
 
 # ------------------------------------------------------------------------------
 # Define the table for the Risk Colour Legend
@@ -287,60 +202,6 @@ row5 = html.Tr([html.Td("Very Low")],
 
 table_body = [html.Tbody([row1, row2, row3, row4, row5])]
 
-# ------------------------------------------------------------------------------
-# Define overview options card
-# ------------------------------------------------------------------------------
-overview_options_card = dbc.Card(
-    [
-        dbc.Row(
-            [
-                dbc.Col(
-                    [
-                        html.Div(id='overview-container', children=[
-                            dbc.Row([dbc.Label("Level 1 Risks")]),
-                            dbc.Row([risk_types_dropdown]),
-                            html.Br(),
-                        ], style={'display': 'block', 'marginBottom': 50}),
-                        html.Div(id='dropdown-container', children=[
-                            dbc.Row([dbc.Label("Level 2 Risks")]),
-                            dbc.Row([risk_dropdown]),
-                            html.Br(),
-                            dbc.Row([dbc.Label("Level 3 Risks")]),
-                            dbc.Row([level3_dropdown]),
-                            # This is the line that shows or hides the sliders
-                        ], style={'display': 'block', 'marginBottom': 50}),
-                        html.Br(),
-                        html.Br(),
-                        html.Div(id='business-unit-container', children=[
-                            dbc.Row([
-                                dbc.Label("Or Select a Business Unit Below")]),
-                            html.Br(),
-                            dbc.Row([dbc.Label("Select Business Unit")]),
-                            dbc.Row([business_unit_dropdown]),
-                        ], style={'display': 'block', 'marginBottom': 50}),
-                    ], style={"width": "100%", 'marginBottom': 50},
-                ),
-                dbc.Row(
-                    [
-                        dbc.Col(
-                            [
-                                html.Div(id='legend-container', children=[
-                                    dbc.Table(table_header + table_body,
-                                              bordered=True),
-                                ], style={'display': 'block',
-                                          'marginBottom': 50}),
-                            ]
-                        ),
-
-                    ], style={"width": "100%", 'marginBottom': 50},
-                )
-            ], style={"width": "100%"},
-        ),
-    ],
-    body=True,
-    style={"width": "100%"},
-)
-
 #------------------------------------------------------------------------------
 # Define Issues/Actions Card in the Monthl Reporting  Tab
 # ------------------------------------------------------------------------------
@@ -430,8 +291,6 @@ card_monthly_reporting_2 = dbc.Card(
                              'type': 'numeric','editable': False},
                             {'name': 'Total Actions', 'id':'ta',
                              'type': 'numeric','editable': False},
-                            {'name': 'total', 'id':'total', 'type': 'numeric',
-                             'editable': False},
                     ],
                     style_cell = {
                                  'overflow': 'hidden',
@@ -485,8 +344,17 @@ data_table = dash_table.DataTable(
          'editable': False},
     ],
     data=[],
-    filter_action="native",
-    sort_action="native",
+
+    # Paging, filtering and sorting all happen on the server, see
+    # output_dataframe() below
+    page_action="custom",
+    page_current=0,
+    page_size=PAGE_SIZE,
+    filter_action="custom",
+    filter_query='',
+    sort_action="custom",
+    sort_mode="multi",
+    sort_by=[],
     style_cell={
         'overflow': 'hidden',
         'textOverflow': 'ellipsis',
@@ -496,12 +364,11 @@ data_table = dash_table.DataTable(
         'font-family': 'sans-serif',
     },
 
-    # Allow exports to CSV files
-    export_format="csv",
+    # Exports are written on the server, see export_controls() below
 
-    # ----------------------------------------------------------------
+    # --------------------------------------------------------------------------
     # Overflow cells' content into multiple lines
-    # ----------------------------------------------------------------
+    # --------------------------------------------------------------------------
     style_data={
         'whiteSpace': 'normal',
         'height': 'auto'
@@ -691,10 +558,10 @@ data_table = dash_table.DataTable(
         },
     ],
 
-    # ------------------------------------------------------------------
+    # --------------------------------------------------------------------------
     # Freeze Rows - digit represents number of rows frozen 0 being header
     # row
-    # ------------------------------------------------------------------
+    # --------------------------------------------------------------------------
     fixed_rows={'headers': True, 'data': 0},
 
     style_header={
@@ -816,20 +683,29 @@ all_raca_table = dash_table.DataTable(
           'editable': False},
         {'name': 'Action Due Date', 'id': 'action_due_date', 'type': 'text',
          'editable': False},
-        {'name': 'Completion Date', 'id': 'completion_dat', 'type': 'text',
+        {'name': 'Completion Date', 'id': 'completion_date', 'type': 'text',
          'editable': False},
         {'name': 'Action ID', 'id': 'action_id', 'type': 'text',
          'editable': False}
     ],
-    # ------------------------------------------------------------------
+    # --------------------------------------------------------------------------
     # Freeze Rows - digit represents number of rows frozen 0 being header
     # row
-    # ------------------------------------------------------------------
+    # --------------------------------------------------------------------------
     fixed_rows={'headers': True, 'data': 0},
 
-    #data=[],
-    filter_action="native",
-    sort_action="native",
+    data=[],
+
+    # Paging, filtering and sorting all happen on the server, see
+    # output_dataframe() below
+    page_action="custom",
+    page_current=0,
+    page_size=PAGE_SIZE,
+    filter_action="custom",
+    filter_query='',
+    sort_action="custom",
+    sort_mode="multi",
+    sort_by=[],
     style_cell={
         'overflow': 'hidden',
         'textOverflow': 'ellipsis',
@@ -840,8 +716,7 @@ all_raca_table = dash_table.DataTable(
         'minWidth': 95, 'maxWidth': 95, 'width': 95
     },
 
-    # Allow exports to CSV files
-    export_format="csv",
+    # Exports are written on the server, see export_controls() below
 
     style_header={'backgroundColor': 'rgb(7, 22, 51)',
                   'fontWeight': 'bold',
@@ -850,9 +725,9 @@ all_raca_table = dash_table.DataTable(
     style_table={'maxHeight': '600px',
                  'overflowX': 'auto'},
 
-    # ----------------------------------------------------------------
+    # --------------------------------------------------------------------------
     # Overflow cells' content into multiple lines
-    # ----------------------------------------------------------------
+    # --------------------------------------------------------------------------
     style_data={
         'whiteSpace': 'normal',
         'height': 'auto'
@@ -896,82 +771,132 @@ all_raca_table = dash_table.DataTable(
 # ------------------------------------------------------------------------------
 # ------------------------------------------------------------------------------
 # Tab 1 - Overview - First tab conmtaining 4 charts and selection dropdowns
+# figures holds the prerendered default view charts, if we have them
 # ------------------------------------------------------------------------------
+def overview_graph(chart_id, figures):
+    if chart_id in figures:
+        return dcc.Graph(id=chart_id, figure=figures[chart_id])
+    return dcc.Graph(id=chart_id)
 
-tab1_content = dbc.Row(
-    [
-        html.Div([
-            html.Br(),
-            # Setup our Headings on the Overview Tab
-            html.Span('RACA Overview',
-                      style={
-                          "font-size": 22,
-                          "color": color_2,
-                          'font-weight': 'bold'}),
-            html.Br(),
-            html.Span('Overall RACA Statistics',
-                      style={
-                          "font-size": 14,
-                          "color": color_2}),
-        ]
-        ),
 
-        html.Br(),
-        # Setup our initial 4 Charts/Tables
-        html.Div([
-            # Chart 1
+def build_tab1_content(figures):
+    return dbc.Row(
+        [
             html.Div([
-                dcc.Graph(id='barchart1'),
-            ], className='six columns'),
+                html.Br(),
+                # Setup our Headings on the Overview Tab
+                html.Span('RACA Overview',
+                          style={
+                              "font-size": 22,
+                              "color": color_2,
+                              'font-weight': 'bold'}),
+                html.Br(),
+                html.Span('Overall RACA Statistics',
+                          style={
+                              "font-size": 14,
+                              "color": color_2}),
+            ]
+            ),
 
-            # Chart 2
+            html.Br(),
+            # Setup our initial 4 Charts/Tables
             html.Div([
-                dcc.Graph(id='barchart2'),
-            ], className='six columns'),
+                # Chart 1
+                html.Div([
+                    overview_graph('barchart1', figures),
+                ], className='six columns'),
 
-        ], ),
+                # Chart 2
+                html.Div([
+                    overview_graph('barchart2', figures),
+                ], className='six columns'),
 
-        html.Div([
-            # Chart 3
-            html.Div([
-                dcc.Graph(id='piechart1'),
-            ], className='six columns'),
+            ], ),
 
-            # Chart 4
             html.Div([
-                dcc.Graph(id='piechart2'),
-            ], className='six columns'),
+                # Chart 3
+                html.Div([
+                    overview_graph('piechart1', figures),
+                ], className='six columns'),
+
+                # Chart 4
+                html.Div([
+                    overview_graph('piechart2', figures),
+                ], className='six columns'),
+
+            ], ),
+        ],
+        no_gutters=True,
+    )
 
-        ], ),
-    ],
-    no_gutters=True,
-)
 
 # ------------------------------------------------------------------------------
 # Tab 2  - Risk Table - Data table showing Risk section of RACA
 # ------------------------------------------------------------------------------
-tab2_content = dbc.Col(
-    [
-        html.Div([
-            html.Br(),
-            html.Span('Risk Data', style={
-                "font-size": 22,
-                "color": color_2,
-                'font-weight': 'bold'}),
+# ------------------------------------------------------------------------------
+# Export buttons for a server paged table, exporting every row that matches
+# the table's filter in its sort order. The export is written in the
+# background (raca/export.py); the status next to the buttons is polled until
+# it turns into a download link.
+# ------------------------------------------------------------------------------
+EXPORT_POLL_SECONDS = 1
+
+
+def export_controls(table_id):
+    return html.Div(
+        [
+            dbc.Button('Export CSV', id=f'{table_id}-export-csv', size='sm',
+                       color='secondary', className='mr-2'),
+            dbc.Button('Export Excel', id=f'{table_id}-export-xlsx',
+                       size='sm', color='secondary', className='mr-2'),
+            html.Span(id=f'{table_id}-export-status',
+                      style={"font-size": 14, "color": color_2}),
+            dcc.Store(id=f'{table_id}-export-job'),
+            dcc.Interval(id=f'{table_id}-export-poll',
+                         interval=EXPORT_POLL_SECONDS * 1000, disabled=True),
+        ], className="mb-2"
+    )
+
+
+def export_message(status):
+    if status is None:
+        return 'Export not found', True
+    if status['state'] == 'done':
+        return html.A(f"Download {status['filename']} "
+                      f"({status['rows']:,} rows)",
+                      href=f"/_raca/exports/{status['id']}"), True
+    if status['state'] == 'failed':
+        return f"Export failed: {status['error']}", True
+    if status['total'] is None:
+        return 'Preparing export...', False
+    return f"Exporting {status['rows']:,} of {status['total']:,} rows", False
+
+
+def build_tab2_content(table):
+    return dbc.Col(
+        [
+            html.Div([
+                html.Br(),
+                html.Span('Risk Data', style={
+                    "font-size": 22,
+                    "color": color_2,
+                    'font-weight': 'bold'}),
+
+                html.Br(),
+                html.Span('Initial Risk data as well as a cumulative Gross and Net'
+                          ' risk score arrived at by multiplying '
+                          'Gross Impact x Gross Likelihood, and similar for Net',
+                          style={
+                              "font-size": 14,
+                              "color": color_2}),
+            ], className="mb-3"
+            ),
+            export_controls(table.id),
+            dbc.Card(table, body=False)
 
-            html.Br(),
-            html.Span('Initial Risk data as well as a cumulative Gross and Net'
-                      ' risk score arrived at by multiplying '
-                      'Gross Impact x Gross Likelihood, and similar for Net',
-                      style={
-                          "font-size": 14,
-                          "color": color_2}),
-        ], className="mb-3"
-        ),
-        dbc.Card(data_table, body=False)
+        ]
+    )
 
-    ]
-)
 
 # ------------------------------------------------------------------------------
 # Tab 3  -Monthly Reporting - # 2 x Datatables showing Monthly reporting figs
@@ -994,6 +919,18 @@ tab3_content = dbc.Row([
 
                 ],className="mb-3"
                 ),
+                html.Div([
+                    html.Span('Reporting date ', style={
+                        "font-size": 14,
+                        "color": color_2}),
+                    # Defaults to today; pick an earlier month end to
+                    # regenerate a past month's figures
+                    dcc.DatePickerSingle(id='reporting-date',
+                                         display_format='DD/MM/YYYY',
+                                         first_day_of_week=1,
+                                         clearable=True),
+                ], className="mb-3"
+                ),
                 dbc.Row([
                     dbc.Col(
                         [
@@ -1013,294 +950,233 @@ tab3_content = dbc.Row([
 # ------------------------------------------------------------------------------
 # Tab 4 - All RACA Data - Datatable holding the complete RACA dataframe
 # ------------------------------------------------------------------------------
-tab4_content = dbc.Row(
-    [
-        html.Div([
-            html.Br(),
-            html.Span('All RACA Data', style={
-                "font-size": 22,
-                "color": color_2,
-                'font-weight': 'bold'}),
-
-            html.Br(),
-            html.Span('This is all the data that is used in this application ',
-                      style={
-                          "font-size": 14,
-                          "color": color_2}),
-        ],className="mb-3"
-        ),
-        dbc.Row([
-            dbc.Col(
-                [
-                dbc.Card(all_raca_table, body=True)
-                    ]
-                )
-            ],
-        ),
-    ],
-)
-
-# ------------------------------------------------------------------------------
-# Setting up tab layout
-# ------------------------------------------------------------------------------
-tabs = dbc.Tabs(
-    [
-        dbc.Tab(tab1_content,
-                tab_id="tab_map",
-                label="Overview"
-                ),  # style={"width": "100%"}),
-
-        dbc.Tab(tab2_content,
-                tab_id="tab_total",
-                label="Risk Table"),
-        # style={"width": "100%"}),
-
-        dbc.Tab(tab3_content,
-                tab_id="tab_oprisk_fig",
-                label="Monthly Reporting"),
-                #style={"width": "50%"}),
-
-        dbc.Tab(tab4_content,
-                tab_id="tab_alldata",
-                label="All RACA Data"),
-        # style={"width": "100%"}),
-
-    ],
-    id="tabs",
-    active_tab="tab_map",
-    style={"width": "100%"}
-    # style={"height": "auto", "width": "auto"},
-)
-
-# ------------------------------------------------------------------------------
-# Define Application overall layout
-# ------------------------------------------------------------------------------
-app.layout = html.Div(
-    [
-        navbar,
-        dbc.Row(
-            [
-                dbc.Col(
-                    [
-                        dbc.Collapse(
-                            overview_options_card,
-                            id="menu_1",
-                        ),
-                    ], id="menu_col_1", width=6, xs=6, sm=5, md=4, lg=3, xl=2
-
-
-                    ),
+def build_tab4_content(table):
+    return dbc.Row(
+        [
+            html.Div([
+                html.Br(),
+                html.Span('All RACA Data', style={
+                    "font-size": 22,
+                    "color": color_2,
+                    'font-weight': 'bold'}),
+
+                html.Br(),
+                html.Span('This is all the data that is used in this application ',
+                          style={
+                              "font-size": 14,
+                              "color": color_2}),
+            ],className="mb-3"
+            ),
+            export_controls(table.id),
+            dbc.Row([
                 dbc.Col(
                     [
-                        tabs
-                    ]
-                ),
-            ], style={"height": "auto", "width": "99%"},
-        )
-    ],
-    # style={"height": "auto", "width": "auto"},
-)
-
-
-# ------------------------------------------------------------------------------
-# CALLBACKS
-# ------------------------------------------------------------------------------
-# ------------------------------------------------------------------------------
-# Define callback to toggle tabs
-# ------------------------------------------------------------------------------
-@app.callback(
-    [Output("business_unit_dropdown", "disabled"),
-     Output("menu_1", "is_open"),
-     Output("menu_col_1", "width"),
-     Output("menu_col_1", "xs"),
-     Output("menu_col_1", "sm"),
-     Output("menu_col_1", "md"),
-     Output("menu_col_1", "lg"),
-     Output("menu_col_1", "xl")],
-    [Input("tabs", "active_tab")],
-)
-def toggle_tabs(id_tab):
-    if id_tab == "tab_time" or id_tab == "tab_table":
-        return False, False, "0%", 0, 0, 0, 0, 0
-    elif id_tab == "tab_map":
-        return True, True, "0%", 6, 5, 4, 3, 2
-    elif id_tab == "tab_total":
-        return False, True, "0%", 6, 5, 4, 3, 2
-    elif id_tab == "tab_oprisk_fig":
-        return False, True, "0%", 6, 5, 4, 3, 2
-    elif id_tab == "tab_alldata":
-        return False, True, "0%", 6, 5, 4, 3, 2
-
-# ------------------------------------------------------------------------------
-# Callback to hide L1 dropdown boxes if we are on teh risk table tab
-# ------------------------------------------------------------------------------
-# @app.callback(
-#     Output('overview-container', 'style'),
-#     [Input("tabs", "active_tab")])
-# def show_hide_element(id_tab):
-#     if id_tab == 'tab_tab':
-#         return {'display': 'block'}
-#     else:
-#         return {'display': 'none'}
-
-# ------------------------------------------------------------------------------
-# Callback to hide L2 and L3 dropdown boxes if risk_type == 'ALL'
-# ------------------------------------------------------------------------------
-# https://stackoverflow.com/questions/62788398/
-# hide-show-dash-slider-component-by-updating-different-dropdown-component
-@app.callback(
-    Output('dropdown-container', 'style'),
-    [Input('risk_types', 'value')])
-def show_hide_element(visibility_state):
-    if visibility_state == 'All':
-        return {'display': 'none'}
-    else:
-        return {'display': 'block'}
-
-# ------------------------------------------------------------------------------
-# Only Show the Legend when we are on the Risk Table tab
-# ------------------------------------------------------------------------------
-# https://stackoverflow.com/questions/62788398/
-# hide-show-dash-slider-component-by-updating-different-dropdown-component
-@app.callback(
-    Output('legend-container', 'style'),
-    [Input("tabs", "active_tab")])
-def show_hide_element(id_tab):
-    if id_tab == 'tab_total':
-        return {'display': 'block'}
-    else:
-        return {'display': 'none'}
-
-# ------------------------------------------------------------------------------
-# Only Show Select Business unit on Overview page
-# ------------------------------------------------------------------------------
-# https://stackoverflow.com/questions/62788398/
-# hide-show-dash-slider-component-by-updating-different-dropdown-component
-@app.callback(
-    Output('business-unit-container', 'style'),
-    [Input("tabs", "active_tab")])
-def show_hide_element(id_tab):
-    if id_tab == 'tab_map':
-        return {'display': 'block'}
-    else:
-        return {'display': 'none'}
+                    dbc.Card(table, body=True)
+                        ]
+                    )
+                ],
+            ),
+        ],
+    )
 
-# ------------------------------------------------------------------------------
-# disable sidebar dropdown menu if on All data tab
-# ------------------------------------------------------------------------------
-# @app.callback(
-#     Output('alldata-container', 'style'),
-#     [Input("tabs", "active_tab")])
-# def show_hide_sidebar(id_tab):
-#     if id_tab == 'active_tab':
-#         return {'display': 'block'}
-#     else:
-#         return {'display': 'none'}
 
 # ------------------------------------------------------------------------------
-# Set Callback to define our dropdown boxes
+# Setting up tab layout
 # ------------------------------------------------------------------------------
-@app.callback(
-    Output('risk', 'options'),
-    Input('risk_types', 'value'))
-def set_tl2_options(tl1_options):
-    if tl1_options != 'All':
-        raca_options = raca_df[raca_df['risk_types'] == tl1_options]
-        # print(f'DEBUG1: TL 1 Not equal to all: {raca_options}')
-        print(f'DEBUG 1.1: L1 options "NOT ALL": {raca_options}')
+def build_tabs(view):
+    return dbc.Tabs(
+        [
+            dbc.Tab(build_tab1_content(view['figures']),
+                    tab_id="tab_map",
+                    label="Overview"
+                    ),  # style={"width": "100%"}),
+
+            dbc.Tab(build_tab2_content(view['table']),
+                    tab_id="tab_total",
+                    label="Risk Table"),
+            # style={"width": "100%"}),
+
+            dbc.Tab(tab3_content,
+                    tab_id="tab_oprisk_fig",
+                    label="Monthly Reporting"),
+                    #style={"width": "50%"}),
+
+            dbc.Tab(build_tab4_content(view['allraca']),
+                    tab_id="tab_alldata",
+                    label="All RACA Data"),
+            # style={"width": "100%"}),
+
+        ],
+        id="tabs",
+        active_tab="tab_map",
+        style={"width": "100%"}
+        # style={"height": "auto", "width": "auto"},
+    )
+
+
+# ------------------------------------------------------------------------------
+# Define dropdowns and the overview options card
+# These are built per page load from the current RACA data rather than at
+# import, so importing this module never has to read the workbook.
+# dataset is None when Dash only wants the layout to validate callbacks against
+# ------------------------------------------------------------------------------
+def dropdown_options(dataset, column):
+    if dataset is None:
+        return []
+    return [{'label': k, 'value': k}
+            for k in get_engine(dataset).options(column)]
+
+
+def build_overview_options_card(dataset):
+    if dataset is not None:
+        taxonomy = get_engine(dataset).taxonomy()
     else:
-        raca_options = raca_df
-        # print(f'DEBUG2: TL1 equal to all: {raca_options}')
-        print(f'DEBUG 1.2: L1 options "ALL": {raca_options}')
-    return [{'label': i, 'value': i}
-            for i in sorted(raca_options['risk'].astype(str).unique())]
-
-
-@app.callback(
-    Output('level3', 'options'),
-    Input('risk', 'value'))
-def set_tl3_options(tl2_options):
-    if tl2_options != 'All':
-        raca_options = raca_df[raca_df['risk'] == tl2_options]
-        print(f'DEBUG 2.1: TL2 Not equal to all: {raca_options}')
-    else:
-        raca_options = raca_df
-        print(f'DEBUG 2.2: TL2 equal to all: {raca_options}')
-    return [{'label': i, 'value': i}
-            for i in sorted(raca_options['level3'].astype(str).unique())]
-
-
-# ------------------------------------------------------------------------------
-# Define Callback to update data_table  on tab_1 id = table
-# ------------------------------------------------------------------------------
-@app.callback(
-    Output('table', 'data'),
-    Input('level3', 'value'))
-def output_dataframe(data):
-    print(f'DEBUG 3.1: Level 3 value {data}')
-    
-    
-    table_df = raca_df
-    table_df.drop_duplicates(subset=['risk_id'],inplace=True)
-    return table_df.to_dict('records')
-
-
-# ------------------------------------------------------------------------------
-# Define Callback to update all raca data on tab_4 id = allraca
-# ------------------------------------------------------------------------------
-@app.callback(
-    Output('allraca', 'data'),
-    Input('level3', 'value'))
-def output_dataframe(data):
-    print(f'DEBUG 4.1: Level 3 value {data}')
-
-    table_df = raca_df
-
-    return table_df.to_dict('records')
-
+        taxonomy = {'risk_types': [], 'risk': {'All': []}}
+
+    # --------------------------------------------------------------------------
+    # Risk Category 1
+    # --------------------------------------------------------------------------
+    risk_types_dropdown = dcc.Dropdown(
+        id='risk_types',
+        multi=False,
+        value='All',
+        clearable=False,
+        searchable=True,
+        persistence=True,
+        persistence_type='session',
+        style={"width": "100%"},
+
+        options=taxonomy['risk_types'] +
+                [{'label': 'All', 'value': 'All'}],
+    )
+    # --------------------------------------------------------------------------
+    # Risk Category 2
+    # --------------------------------------------------------------------------
+    risk_dropdown = dcc.Dropdown(
+        id='risk',
+        multi=False,
+        value='All',
+        clearable=False,
+        searchable=True,
+        placeholder='Select...',
+        persistence=True,
+        persistence_type='session',
+        style={"width": "100%"},
+
+        options=taxonomy['risk']['All']
+    )
+    # --------------------------------------------------------------------------
+    # Risk Category 2
+    # --------------------------------------------------------------------------
+    level3_dropdown = dcc.Dropdown(
+        id='level3',
+        multi=False,
+        value='All',
+        clearable=False,
+        searchable=True,
+        placeholder='Select...',
+        persistence=True,
+        persistence_type='session',
+        style={"width": "100%"},
+
+        options=[],
+
+    )
+    # --------------------------------------------------------------------------
+    # Dropdown containing business units
+    # This can be used to just report on the RACAs from the particular business
+    # unit.
+    # --------------------------------------------------------------------------
+    business_unit_dropdown = dcc.Dropdown(
+        id="business_unit_dropdown",
+        multi=False,
+        value='All',
+        clearable=False,
+        searchable=True,
+        placeholder='Select ...',
+        persistence=True,
+        persistence_type='session',
+        style={"width": "100%"},
+
+        options=dropdown_options(dataset, 'business_unit') +
+                [{'label': 'All', 'value': 'All'}],
+    )
+
+    # --------------------------------------------------------------------------
+    # Define overview options card
+    # --------------------------------------------------------------------------
+    overview_options_card = dbc.Card(
+        [
+            dbc.Row(
+                [
+                    dbc.Col(
+                        [
+                            html.Div(id='overview-container', children=[
+                                dbc.Row([dbc.Label("Level 1 Risks")]),
+                                dbc.Row([risk_types_dropdown]),
+                                html.Br(),
+                            ], style={'display': 'block', 'marginBottom': 50}),
+                            html.Div(id='dropdown-container', children=[
+                                dbc.Row([dbc.Label("Level 2 Risks")]),
+                                dbc.Row([risk_dropdown]),
+                                html.Br(),
+                                dbc.Row([dbc.Label("Level 3 Risks")]),
+                                dbc.Row([level3_dropdown]),
+                                # This is the line that shows or hides the
+                                # sliders
+                            ], style={'display': 'block', 'marginBottom': 50}),
+                            html.Br(),
+                            html.Br(),
+                            html.Div(id='business-unit-container', children=[
+                                dbc.Row([
+                                    dbc.Label(
+                                        "Or Select a Business Unit Below")]),
+                                html.Br(),
+                                dbc.Row([dbc.Label("Select Business Unit")]),
+                                dbc.Row([business_unit_dropdown]),
+                            ], style={'display': 'block', 'marginBottom': 50}),
+                        ], style={"width": "100%", 'marginBottom': 50},
+                    ),
+                    dbc.Row(
+                        [
+                            dbc.Col(
+                                [
+                                    html.Div(id='legend-container', children=[
+                                        dbc.Table(table_header + table_body,
+                                                  bordered=True),
+                                    ], style={'display': 'block',
+                                              'marginBottom': 50}),
+                                ]
+                            ),
 
-# ------------------------------------------------------------------------------
-# Tab 3 - Update Monthly reporting figures for Actions outstanding by
-# business unit
-# Calculate the number of actions logged against each business unit
-# 1 Look at raca_df['action_id'] and if not a null value note the business
-# function add to the count for the business function.
-# Report data by unique business unit.
-# ------------------------------------------------------------------------------
-# @app.callback(
-#     [Output('dt_card_mr', 'data')],
-#     [Input('', component_property='n_clicks_timestamp')])
-# def display_tweets(submit_button, screen_names):
-#     temp_df = raca_df[['business_unit', 'action_id']]
-#     temp_df = temp_df.dropna()
-#     action_figs = temp_df.count()
-#     data = action_figs.to_dict(orient='records')
-#     print(data)
-#     return data
+                        ], style={"width": "100%", 'marginBottom': 50},
+                    )
+                ], style={"width": "100%"},
+            ),
+        ],
+        body=True,
+        style={"width": "100%"},
+    )
 
+    return overview_options_card
 
 
 # ------------------------------------------------------------------------------
-# CHARTS FROM OVERVIEW PAGE
+# OVERVIEW CHARTS
+# Each chart is built from a Dataset and the three category dropdowns
 # ------------------------------------------------------------------------------
 # ------------------------------------------------------------------------------
 # Barchart 1 - Total Number of Risks by Business Function
 # ------------------------------------------------------------------------------
-@app.callback(Output('barchart1', 'figure'),
-              [Input('level3', 'value'),
-               Input('risk', 'value'),
-               Input('risk_types', 'value')])
-def update_figure(risk_types, risk, level3):
-    # Create a copy of our dataframe so we are not working on the original
-    df_copy = raca_df
+def barchart1_figure(dataset, risk_types, risk, level3):
+    engine = get_engine(dataset)
 
-    print(risk_types)
+    logger.debug('barchart1 for %s', risk_types)
 
     if risk_types == 'All':
 
         # Display all risks grouped by business unit
-        group1 = df_copy.groupby('business_unit')
-        df2 = group1.apply(lambda x: x['risk_id'].sort_values().nunique())
+        df2 = engine.unit_totals()['risks']
 
         # Build our graph
         fig = df2.plot.bar(
@@ -1326,7 +1202,7 @@ def update_figure(risk_types, risk, level3):
 
     else: # risk_types != 'All'
 
-        df_filtered = raca_df[['gross_risk', 'business_unit']]
+        df_filtered = engine.frame('risks', ['gross_risk', 'business_unit'])
 
         fig = px.line(df_filtered, x='business_unit', y='gross_risk')
         fig.update_xaxes(tickangle=45,
@@ -1338,35 +1214,30 @@ def update_figure(risk_types, risk, level3):
 
         return fig
 
+
 # ------------------------------------------------------------------------------
 # Bar Chart 2 - Comparison of Gross and Net Risk by Business Function
 # ------------------------------------------------------------------------------
-@ app.callback(Output('piechart1', 'figure'),
-               [Input('level3', 'value'),
-                Input('risk', 'value'),
-                Input('risk_types', 'value')])
-def update_figure(risk_types, risk, selected_scale):
-    group = raca_df.groupby('business_unit')
+def piechart1_figure(dataset, risk_types, risk, selected_scale):
+    totals = get_engine(dataset).unit_totals()
     # Get our Gross risk by business unit
-    df3 = (group.apply(lambda x: x['gross_risk'].dropna().sum()) /
-           group.apply(lambda x: x['risk_id'].sort_values().nunique()))
+    df3 = totals['gross_risk'] / totals['risks']
 
     # Display all risks grouped by business unit
-    #group = df.groupby('business_unit')
-    df4 = (group.apply(lambda x: x['net_risk'].dropna().sum()) /
-           group.apply(lambda x: x['risk_id'].sort_values().nunique()))
-    df4.astype(int)
+    df4 = totals['net_risk'] / totals['risks']
 
     fig = go.Figure(data=[
-        go.Bar(name='Gross Risk', x=df3.index, y=df3, marker_color='#00DEFF'),
-        go.Bar(name='Net Risk', x=df4.index, y=df4, marker_color='#0082FF')
+        go.Bar(name='Gross Risk', x=df3.index, y=df3,
+               marker_color='#00DEFF'),
+        go.Bar(name='Net Risk', x=df4.index, y=df4,
+               marker_color='#0082FF')
     ])
     # Change the bar mode
     fig.update_layout(barmode='group')
 
     # Build our graph
-    fig.update_layout(title='<b>Comparison of Gross and Net Risk by Business'
-                            ' Function</b>)',
+    fig.update_layout(title='<b>Comparison of Gross and Net Risk by '
+                            'Business Function</b>)',
                       showlegend=True,
                       title_x=0.5,
                       height=800,
@@ -1384,19 +1255,13 @@ def update_figure(risk_types, risk, selected_scale):
 
     return fig
 
+
 # ------------------------------------------------------------------------------
 # Pie Chart 1 - Graph showing Total Number of Risks by Business Function
 # ------------------------------------------------------------------------------
-@ app.callback(Output('barchart2', 'figure'),
-               [Input('level3', 'value'),
-                Input('risk', 'value'),
-                Input('risk_types', 'value')]
-               )
-def update_figure(risk_types, risk, selected_scale):
+def barchart2_figure(dataset, risk_types, risk, selected_scale):
     # Display all risks grouped by business unit
-    group = raca_df.groupby('business_unit')
-    df2 = group.apply(lambda x: x['risk_id'].sort_values().nunique())
-    #df2
+    df2 = get_engine(dataset).unit_totals()['risks']
 
     # Build our graph
     fig = px.pie(df2, values=df2,
@@ -1416,20 +1281,14 @@ def update_figure(risk_types, risk, selected_scale):
 
     return fig
 
+
 # ------------------------------------------------------------------------------
 # Pie Chart 2 - Net Risk Score by Business Function
 # ------------------------------------------------------------------------------
-@ app.callback(Output('piechart2', 'figure'),
-               [Input('level3', 'value'),
-                Input('risk', 'value'),
-                Input('risk_types', 'value')]
-               )
-def update_figure(risk_types, risk, selected_scale):
-    group = raca_df.groupby('business_unit')
-    df3 = (group.apply(lambda x: x['gross_risk'].dropna().sum()) /\
-    group.apply(lambda x: x['risk_id'].sort_values().nunique()))
-    df4 = (group.apply(lambda x: x['net_risk'].dropna().sum()) /\
-    group.apply(lambda x: x['risk_id'].sort_values().nunique()))
+def piechart2_figure(dataset, risk_types, risk, selected_scale):
+    totals = get_engine(dataset).unit_totals()
+    df3 = totals['gross_risk'] / totals['risks']
+    df4 = totals['net_risk'] / totals['risks']
 
     fig = px.pie(df4, values=df3,
                  names=df4.index,
@@ -1450,9 +1309,530 @@ def update_figure(risk_types, risk, selected_scale):
     return fig
 
 
+OVERVIEW_CHARTS = {'barchart1': barchart1_figure,
+                   'piechart1': piechart1_figure,
+                   'barchart2': barchart2_figure,
+                   'piechart2': piechart2_figure}
+
+
+# ------------------------------------------------------------------------------
+# TABLE PAGES
+# The view behind each server paged table (see raca/storage.py): the risks
+# table of the model for the Risk Table, every row of the sheet for All RACA
+# Data
+# ------------------------------------------------------------------------------
+TABLE_VIEWS = {
+    'table': 'risks',
+    'allraca': 'all',
+}
+
+
+# A page of a table as (rows, page_count), cut down to the table's columns.
+# A filter we can't run just shows an empty table.
+def table_rows(dataset, table, page_current=0, page_size=PAGE_SIZE,
+               sort_by=None, filter_query=None):
+    engine = get_engine(dataset)
+    columns = table_columns(table)
+    try:
+        return engine.page(TABLE_VIEWS[table.id], columns, page_current,
+                           page_size, sort_by, filter_query)
+    except ValueError:
+        return pd.DataFrame(columns=columns), 1
+
+
+# ------------------------------------------------------------------------------
+# DEFAULT VIEW
+# Every visitor starts on the same filters (All/All/All) and the first page
+# of each table, so those are built once per dataset version and served in
+# the layout itself. The first paint doesn't wait on any callback, unless
+# the visitor's dropdowns were left on other filters earlier in the session.
+#
+# The charts go through figure_cache under the same key their callbacks use.
+# ------------------------------------------------------------------------------
+DEFAULT_FILTERS = ('All', 'All', 'All')
+
+
+def build_default_view(dataset):
+    figures = {}
+    for chart_id, build_figure in OVERVIEW_CHARTS.items():
+        key = figure_key(chart_id, DEFAULT_FILTERS, version_key(dataset))
+        figures[chart_id] = figure_cache.get_or_build(
+            key, lambda: build_figure(dataset, *DEFAULT_FILTERS))
+
+    tables = {}
+    for table in (data_table, all_raca_table):
+        rows, page_count = table_rows(dataset, table)
+        tables[table.id] = (rows.to_dict('records'), page_count)
+
+    return {'figures': figures, 'tables': tables}
+
+
+def default_view(dataset):
+    return dataset.derived('default_view',
+                           lambda raca_df: build_default_view(dataset))
+
+
+# Build each new version's default view before it goes live
+def warm_default_view(old, new):
+    default_view(new)
+
+
+registry.subscribe(warm_default_view)
+
+
+def with_page(table, page):
+    table = copy.copy(table)
+    table.data, table.page_count = page
+    return table
+
+
+# ------------------------------------------------------------------------------
+# Define Application overall layout
+# ------------------------------------------------------------------------------
+def build_layout(dataset):
+    overview_options_card = build_overview_options_card(dataset)
+
+    if dataset is not None:
+        view = default_view(dataset)
+        tabs = build_tabs({
+            'figures': view['figures'],
+            'table': with_page(data_table, view['tables']['table']),
+            'allraca': with_page(all_raca_table, view['tables']['allraca'])})
+    else:
+        tabs = build_tabs({'figures': {}, 'table': data_table,
+                           'allraca': all_raca_table})
+
+    return html.Div(
+        [
+            # Which version of the RACA data this page is showing, and a timer
+            # to check whether a newer one has been published
+            dcc.Store(id='dataset-version',
+                      data=dataset_token(dataset) if dataset is not None
+                      else None),
+            dcc.Location(id='url', refresh=True),
+            dcc.Interval(id='dataset-poll',
+                         interval=DATASET_POLL_SECONDS * 1000),
+            # The current page of each server paged table, in WIRE_FORMAT
+            dcc.Store(id='table-page'),
+            dcc.Store(id='allraca-page'),
+            build_navbar(dataset),
+            dbc.Row(
+                [
+                    dbc.Col(
+                        [
+                            dbc.Collapse(
+                                overview_options_card,
+                                id="menu_1",
+                            ),
+                        ], id="menu_col_1", width=6, xs=6, sm=5, md=4, lg=3,
+                        xl=2
+
+
+                        ),
+                    dbc.Col(
+                        [
+                            tabs
+                        ]
+                    ),
+                ], style={"height": "auto", "width": "99%"},
+            )
+        ],
+        # style={"height": "auto", "width": "auto"},
+    )
+
+
+def serve_layout():
+    return build_layout(get_dataset(requested_dataset()))
+
+
+# ------------------------------------------------------------------------------
+# CALLBACKS
+# ------------------------------------------------------------------------------
+def register_callbacks(app):
+    callback = instrument_callbacks(app, callback_metrics)
+
+    # --------------------------------------------------------------------------
+    # Tab switching and showing/hiding the sidebar controls only map one prop
+    # to another, so they run in the browser (assets/raca.js) and never wait
+    # behind the data callbacks
+    # --------------------------------------------------------------------------
+    def clientside(function_name, outputs, inputs, **kwargs):
+        app.clientside_callback(
+            ClientsideFunction(namespace='raca', function_name=function_name),
+            outputs, inputs, **kwargs)
+
+    # Toggle tabs
+    clientside('toggle_tabs',
+               [Output("business_unit_dropdown", "disabled"),
+                Output("menu_1", "is_open"),
+                Output("menu_col_1", "width"),
+                Output("menu_col_1", "xs"),
+                Output("menu_col_1", "sm"),
+                Output("menu_col_1", "md"),
+                Output("menu_col_1", "lg"),
+                Output("menu_col_1", "xl")],
+               [Input("tabs", "active_tab")])
+
+    # Hide L2 and L3 dropdown boxes if risk_type == 'ALL'
+    # https://stackoverflow.com/questions/62788398/
+    # hide-show-dash-slider-component-by-updating-different-dropdown-component
+    clientside('show_unless_all',
+               Output('dropdown-container', 'style'),
+               [Input('risk_types', 'value')])
+
+    # Only Show the Legend when we are on the Risk Table tab
+    clientside('show_on_risk_table',
+               Output('legend-container', 'style'),
+               [Input("tabs", "active_tab")])
+
+    # Only Show Select Business unit on Overview page
+    clientside('show_on_overview',
+               Output('business-unit-container', 'style'),
+               [Input("tabs", "active_tab")])
+
+    # --------------------------------------------------------------------------
+    # disable sidebar dropdown menu if on All data tab
+    # --------------------------------------------------------------------------
+    # @app.callback(
+    #     Output('alldata-container', 'style'),
+    #     [Input("tabs", "active_tab")])
+    # def show_hide_sidebar(id_tab):
+    #     if id_tab == 'active_tab':
+    #         return {'display': 'block'}
+    #     else:
+    #         return {'display': 'none'}
+
+    # --------------------------------------------------------------------------
+    # Pick up a newly published version of the RACA data. Everything that is
+    # built from the data takes 'dataset-version' as an input, so it all
+    # refreshes when this changes.
+    # --------------------------------------------------------------------------
+    @callback(
+        Output('dataset-version', 'data'),
+        Input('dataset-poll', 'n_intervals'),
+        State('dataset-version', 'data'),
+        prevent_initial_call=True)
+    def poll_dataset_version(n_intervals, token):
+        current = dataset_token(token_dataset(token))
+        if current == token:
+            raise PreventUpdate
+        return current
+
+    # --------------------------------------------------------------------------
+    # Switch to another dataset. The page is loaded again for it, so it is
+    # served with that dataset's dropdowns and default view.
+    # --------------------------------------------------------------------------
+    @callback(
+        Output('url', 'search'),
+        Input('dataset', 'value'),
+        prevent_initial_call=True)
+    def select_dataset(name):
+        if not name:
+            raise PreventUpdate
+        return '?' + urlencode({'dataset': name})
+
+    # --------------------------------------------------------------------------
+    # Refresh the dropdowns that were filled in when the page was served
+    # --------------------------------------------------------------------------
+    @callback(
+        Output('risk_types', 'options'),
+        Input('dataset-version', 'data'),
+        prevent_initial_call=True)
+    def set_tl1_options(token):
+        return (get_engine(token_dataset(token)).taxonomy()['risk_types'] +
+                [{'label': 'All', 'value': 'All'}])
+
+    @callback(
+        Output('business_unit_dropdown', 'options'),
+        Input('dataset-version', 'data'),
+        prevent_initial_call=True)
+    def set_business_unit_options(token):
+        return (dropdown_options(token_dataset(token), 'business_unit') +
+                [{'label': 'All', 'value': 'All'}])
+
+    # --------------------------------------------------------------------------
+    # Set Callback to define our dropdown boxes
+    # The options for each level are looked up in the taxonomy index built
+    # once per dataset version
+    # --------------------------------------------------------------------------
+    @callback(
+        Output('risk', 'options'),
+        Input('risk_types', 'value'),
+        Input('dataset-version', 'data'))
+    def set_tl2_options(tl1_options, token):
+        taxonomy = get_engine(token_dataset(token)).taxonomy()
+        return taxonomy['risk'].get(tl1_options, [])
+
+    @callback(
+        Output('level3', 'options'),
+        Input('risk', 'value'),
+        Input('dataset-version', 'data'))
+    def set_tl3_options(tl2_options, token):
+        taxonomy = get_engine(token_dataset(token)).taxonomy()
+        return taxonomy['level3'].get(tl2_options, [])
+
+
+    # --------------------------------------------------------------------------
+    # Both tables are paged, filtered and sorted on the server and only the
+    # page being looked at, and only the columns the table shows, are sent to
+    # the browser. A filter we can't run just shows an empty table.
+    #
+    # In the columnar wire format the page goes to the table's '-page' store
+    # and assets/raca.js expands it into the table's data.
+    # --------------------------------------------------------------------------
+    def page_outputs(table):
+        if WIRE_FORMAT == COLUMNAR:
+            return [Output(table.id + '-page', 'data'),
+                    Output(table.id, 'page_count')]
+        return [Output(table.id, 'data'), Output(table.id, 'page_count')]
+
+    def send_page(token, table, page_current, page_size, sort_by,
+                  filter_query):
+        rows, page_count = table_rows(token_dataset(token), table,
+                                      page_current, page_size, sort_by,
+                                      filter_query)
+        return encode(rows, WIRE_FORMAT), page_count
+
+    if WIRE_FORMAT == COLUMNAR:
+        for table in (data_table, all_raca_table):
+            clientside('expand_columnar', Output(table.id, 'data'),
+                       Input(table.id + '-page', 'data'),
+                       prevent_initial_call=True)
+
+    # --------------------------------------------------------------------------
+    # Define Callback to update data_table  on tab_1 id = table
+    # One row per risk, the first row the risk appears on in the sheet
+    # --------------------------------------------------------------------------
+    @callback(
+        page_outputs(data_table),
+        [Input('table', 'page_current'),
+         Input('table', 'page_size'),
+         Input('table', 'sort_by'),
+         Input('table', 'filter_query'),
+         Input('dataset-version', 'data')],
+        prevent_initial_call=True)
+    def output_dataframe(page_current, page_size, sort_by, filter_query,
+                         token):
+        return send_page(token, data_table, page_current, page_size, sort_by,
+                         filter_query)
+
+    # --------------------------------------------------------------------------
+    # Define Callback to update all raca data on tab_4 id = allraca
+    # --------------------------------------------------------------------------
+    @callback(
+        page_outputs(all_raca_table),
+        [Input('allraca', 'page_current'),
+         Input('allraca', 'page_size'),
+         Input('allraca', 'sort_by'),
+         Input('allraca', 'filter_query'),
+         Input('dataset-version', 'data')],
+        prevent_initial_call=True)
+    def output_dataframe(page_current, page_size, sort_by, filter_query,
+                         token):
+        return send_page(token, all_raca_table, page_current, page_size,
+                         sort_by, filter_query)
+
+
+    # --------------------------------------------------------------------------
+    # Export a table's current filter and sort in the background, then poll
+    # the export until its download link is ready
+    # --------------------------------------------------------------------------
+    def register_export(table):
+        @callback(
+            Output(f'{table.id}-export-job', 'data'),
+            [Input(f'{table.id}-export-csv', 'n_clicks'),
+             Input(f'{table.id}-export-xlsx', 'n_clicks')],
+            [State(table.id, 'sort_by'),
+             State(table.id, 'filter_query'),
+             State('dataset-version', 'data')],
+            prevent_initial_call=True)
+        def start_table_export(csv_clicks, xlsx_clicks, sort_by,
+                               filter_query, token):
+            triggered = dash.callback_context.triggered[0]['prop_id']
+            export_format = ('xlsx' if triggered.startswith(
+                f'{table.id}-export-xlsx') else 'csv')
+            columns = [(column['id'], column['name'])
+                       for column in table.columns]
+            return start_export(token_dataset(token), TABLE_VIEWS[table.id],
+                                columns, sort_by, filter_query,
+                                export_format)
+
+        @callback(
+            [Output(f'{table.id}-export-status', 'children'),
+             Output(f'{table.id}-export-poll', 'disabled')],
+            [Input(f'{table.id}-export-job', 'data'),
+             Input(f'{table.id}-export-poll', 'n_intervals')],
+            prevent_initial_call=True)
+        def show_export_status(job_id, n_intervals):
+            return export_message(job_status(job_id))
+
+    for table in (data_table, all_raca_table):
+        register_export(table)
+
+
+    # --------------------------------------------------------------------------
+    # Tab 3 - Update Monthly reporting figures for Actions outstanding by
+    # business unit, aged against the reporting date (today if none is
+    # picked). See raca/aging.py for the buckets.
+    # --------------------------------------------------------------------------
+    @callback(
+        [Output('dt_card_mr', 'data'),
+         Output('dt_card_mr_1', 'data')],
+        [Input('reporting-date', 'date'),
+         Input('dataset-version', 'data')])
+    def update_monthly_reporting(date, token):
+        report = get_engine(token_dataset(token)).aging_report(date)
+        return (open_actions(report).to_dict('records'),
+                report.to_dict('records'))
+
+
+    # --------------------------------------------------------------------------
+    # CHARTS FROM OVERVIEW PAGE
+    # The page is served with the charts for the default filters already in
+    # it (see default_view()). The dropdowns keep their values for the
+    # session though, so on a reload they can come back as something else:
+    # the first call only builds the charts when they did.
+    # --------------------------------------------------------------------------
+    def register_chart(chart_id, build_figure):
+        @overview_figure(chart_id)
+        def figure(level3, risk, risk_types, token):
+            return build_figure(token_dataset(token), level3, risk,
+                                risk_types)
+
+        @callback(Output(chart_id, 'figure'),
+                  [Input('level3', 'value'),
+                   Input('risk', 'value'),
+                   Input('risk_types', 'value'),
+                   Input('dataset-version', 'data')])
+        def update_figure(level3, risk, risk_types, token):
+            if (not dash.callback_context.triggered and
+                    (level3, risk, risk_types) == DEFAULT_FILTERS):
+                raise PreventUpdate
+            return figure(level3, risk, risk_types, token)
+
+    for chart_id, build_figure in OVERVIEW_CHARTS.items():
+        register_chart(chart_id, build_figure)
+
+
+# ------------------------------------------------------------------------------
+# Build app
+# Set RACA_PRELOAD=1 to read the RACA data while the app is being built,
+# e.g. in the gunicorn master with --preload (as gunicorn.conf.py does),
+# instead of on first use
+# ------------------------------------------------------------------------------
+def create_app(preload_data=None):
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    for name in ('clensed', 'raca'):
+        logging.getLogger(name).setLevel(LOG_LEVEL)
+
+    # Serialise callback responses with orjson when we have it
+    fastjson.install()
+
+    app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
+    app.title = "Clensed"
+
+    # Give Dash a data-free copy of the layout to validate callbacks against,
+    # otherwise it calls serve_layout() here and reads the workbook
+    app.validation_layout = build_layout(None)
+    app.layout = serve_layout
+
+    register_callbacks(app)
+
+    @app.server.route('/_raca/figure-cache')
+    def figure_cache_stats():
+        return flask.jsonify(figure_cache.stats())
+
+    # The datasets this worker has loaded, and the worker's memory (see
+    # raca/procmem.py)
+    @app.server.route('/_raca/datasets')
+    def dataset_stats():
+        return flask.jsonify({**registry.stats(), 'pid': os.getpid(),
+                              'memory': process_memory()})
+
+    # --------------------------------------------------------------------------
+    # A table's rows as streamed CSV, e.g. for tooling that wants the whole
+    # dataset: /_raca/data.csv?dataset=<name>&table=allraca&business_unit=...
+    # takes the sidebar's filters (see raca/stream.py) and sends the
+    # table's column ids as the header, or its titles with headers=names.
+    # The whole download comes from the version current when it started.
+    # --------------------------------------------------------------------------
+    @app.server.route('/_raca/data.csv')
+    def stream_table_csv():
+        args = flask.request.args
+        tables = {table.id: table for table in (data_table, all_raca_table)}
+        table = tables.get(args.get('table', all_raca_table.id))
+        try:
+            dataset = get_dataset(args.get('dataset') or None)
+        except KeyError:
+            dataset = None
+        if table is None or dataset is None:
+            flask.abort(404)
+
+        columns = table_columns(table)
+        headers = ([column['name'] for column in table.columns]
+                   if args.get('headers') == 'names' else columns)
+        try:
+            total, chunks = get_engine(dataset).rows(
+                TABLE_VIEWS[table.id], columns,
+                filter_query=sidebar_filter_query(
+                    {name: args.get(name) for name in SIDEBAR_FILTERS}))
+        except ValueError as e:
+            flask.abort(400, str(e))
+
+        encoding = pick_encoding(flask.request.accept_encodings)
+        response = flask.Response(
+            encode_stream(csv_text(chunks, columns, headers), encoding),
+            mimetype='text/csv')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Content-Disposition'] = (
+            f'attachment; filename="{dataset.name}-{table.id}.csv"')
+        response.headers['X-RACA-Version'] = str(dataset.version)
+        response.headers['X-RACA-Rows'] = str(total)
+        return response
+
+    @app.server.route('/_raca/exports/<job_id>/status')
+    def export_status(job_id):
+        status = job_status(job_id)
+        if status is None:
+            flask.abort(404)
+        return flask.jsonify(status)
+
+    @app.server.route('/_raca/exports/<job_id>')
+    def download_export(job_id):
+        status = job_status(job_id)
+        if status is None or status['state'] != 'done':
+            flask.abort(404)
+        response = flask.send_file(
+            export_path(job_id, status['format']),
+            mimetype=FORMATS[status['format']])
+        response.headers['Content-Disposition'] = (
+            f'attachment; filename="{status["filename"]}"')
+        return response
+
+    # Watch the RACA sources for changes. Threads don't survive a fork, so
+    # start them in whichever process ends up serving requests.
+    @app.server.before_first_request
+    def start_watchers():
+        for store in registry.stores():
+            start_watcher(store)
+
+    if preload_data is None:
+        preload_data = os.environ.get('RACA_PRELOAD', '') == '1'
+    if preload_data:
+        preload()
+
+    return app
+
+
+app = create_app()
+server = app.server
+
 
 # ------------------------------------------------------------------------------
 # Run app and display the result
 # ------------------------------------------------------------------------------
 if __name__ == "__main__":
-    app.run_server(debug=True)
\ No newline at end of file
+    app.run_server(debug=True)
@@ -0,0 +1,48 @@
+import gc
+import os
+
+# ------------------------------------------------------------------------------
+# Recommended gunicorn settings: gunicorn -c gunicorn.conf.py clensed:server
+#
+# The master reads the dataset once, from the columnar cache (see
+# raca/cache.py), before it forks the workers, so every worker starts with
+# it already loaded and shares its pages with the master and the other
+# workers instead of holding its own copy. The dataset is read-only in every
+# process (raca/views.py), so nothing writes to those pages; gc.freeze()
+# keeps the garbage collector from writing to the objects it would otherwise
+# visit, which would give each worker a private copy of their pages.
+#
+# When the workbook changes each worker loads the new version on its own.
+# Only one of them parses it, but reading the cache copies the data into
+# each worker, so from the first reload on every worker holds its own copy.
+# Plan the workers' memory for that.
+#
+# python -m raca worker-memory measures what each worker costs.
+# ------------------------------------------------------------------------------
+os.environ.setdefault('RACA_PRELOAD', '1')
+preload_app = os.environ['RACA_PRELOAD'] == '1'
+
+bind = os.environ.get('RACA_BIND', '0.0.0.0:8050')
+workers = int(os.environ.get('WEB_CONCURRENCY', '4'))
+
+# Threads share their worker's memory, so add threads before workers
+worker_class = 'gthread'
+threads = int(os.environ.get('RACA_THREADS', '4'))
+
+# Long enough for a worker's first load when it isn't preloaded
+timeout = 120
+
+# Restarting a worker would have it load the dataset again
+max_requests = 0
+
+
+def pre_fork(server, worker):
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    # Without preload_app each worker reads the data as it starts rather than
+    # on its first request
+    if not preload_app:
+        from raca import preload
+        preload()
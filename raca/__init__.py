@@ -0,0 +1,14 @@
+# ------------------------------------------------------------------------------
+# raca - data access layer for the Clensed RACA dashboard
+#
+# Everything that reads, prepares or holds the RACA dataset lives in this
+# package so that clensed.py only has to deal with layout and callbacks.
+# ------------------------------------------------------------------------------
+from raca.dataset import APP_DATA, Dataset, DatasetStore, load_raca
+from raca.registry import (DatasetRegistry, get_dataset, get_raca_df,
+                           preload, registry, store)
+from raca.watcher import start_watcher
+
+__all__ = ['APP_DATA', 'Dataset', 'DatasetRegistry', 'DatasetStore',
+           'get_dataset', 'get_raca_df', 'load_raca', 'preload', 'registry',
+           'start_watcher', 'store']
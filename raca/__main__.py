@@ -0,0 +1,255 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from raca import fastjson
+from raca.aging import aging_report, build_action_dates, reporting_date
+from raca.cache import cache_path, source_meta, valid_cache, write_cache
+from raca.compact import memory_report
+from raca.dataset import APP_DATA, Dataset, load_raca, parse_raca
+from raca.delta import get_unit_totals
+from raca.ingest import load_source
+from raca.storage import VIEWS, sqlite_file
+from raca.workbooks import WorkbookErrors, is_multi_source, load_workbooks
+from raca.wire import encode_columnar, table_columns, wire_report
+
+
+# ------------------------------------------------------------------------------
+# Command line tools for the RACA data, run with `python -m raca <command>`
+# ------------------------------------------------------------------------------
+def build_cache(args):
+    # The cache is per file. The workbooks of a directory or glob each get
+    # their own, written as they are parsed by `ingest`.
+    if is_multi_source(args.source):
+        print(f'{args.source} is a directory or glob of workbooks; each is '
+              'cached as it is read, run `python -m raca ingest` on it '
+              'instead', file=sys.stderr)
+        return 1
+    if not os.path.isfile(args.source):
+        print(f'{args.source} is not a file', file=sys.stderr)
+        return 1
+
+    if not args.force and valid_cache(args.source):
+        print(f'Cache for {args.source} is up to date: '
+              f'{cache_path(args.source)}')
+        return 0
+
+    started = time.perf_counter()
+    meta = source_meta(args.source)
+    df = parse_raca(args.source)
+    path = write_cache(args.source, df, meta)
+    print(f'Cached {len(df)} rows from {args.source} to {path} in '
+          f'{time.perf_counter() - started:.2f}s')
+    return 0
+
+
+def build_sqlite(args):
+    started = time.perf_counter()
+    dataset = Dataset(load_raca(args.source), 0, args.source)
+    path = sqlite_file(dataset)
+    print(f'SQLite file for {args.source}: {path} '
+          f'({time.perf_counter() - started:.2f}s)')
+    return 0
+
+
+def _print_report(report):
+    with pd.option_context('display.max_rows', None,
+                           'display.max_colwidth', 80,
+                           'display.width', 200):
+        print(report.drop(columns='error'))
+
+
+def ingest_workbooks(args):
+    try:
+        df, report = load_workbooks(args.source, workers=args.workers)
+    except WorkbookErrors as e:
+        _print_report(e.report)
+        print(e, file=sys.stderr)
+        return 1
+
+    _print_report(report)
+    print(f'{len(df)} rows from {len(report)} workbooks, '
+          f'{int(report["parsed"].sum())} parsed')
+    return 0
+
+
+def report_memory(args):
+    before = load_source(args.source, compact_data=False)
+    after = load_source(args.source)
+
+    with pd.option_context('display.max_rows', None,
+                           'display.max_columns', None,
+                           'display.width', 200):
+        print(memory_report(before, after))
+    return 0
+
+
+def action_aging(args):
+    actions = build_action_dates(load_raca(args.source))
+    report = aging_report(actions, args.date)
+
+    if args.csv:
+        report.to_csv(args.csv, index=False)
+        print(f'Wrote action aging at {reporting_date(args.date):%Y-%m-%d} '
+              f'to {args.csv}')
+    else:
+        print(f'Action aging at {reporting_date(args.date):%Y-%m-%d}')
+        print(report.to_string(index=False))
+    return 0
+
+
+def report_wire(args):
+    # The tables' columns and views are declared with the rest of the layout
+    from clensed import TABLE_VIEWS, all_raca_table, data_table
+
+    dataset = Dataset(load_raca(args.source), 0, args.source)
+
+    with pd.option_context('display.width', 200):
+        for table in (data_table, all_raca_table):
+            # The frame the table's callback pages through
+            df = VIEWS[TABLE_VIEWS[table.id]](dataset)
+            if args.rows:
+                df = df.iloc[:args.rows]
+            print(f'{table.id} ({len(df)} rows)')
+            print(wire_report(df, table_columns(table)))
+            print()
+    return 0
+
+
+def benchmark_json(args):
+    import plotly.graph_objects as go
+
+    df = load_raca(args.source)
+    totals = get_unit_totals(Dataset(df, 0, args.source))
+    points = np.random.default_rng(0).normal(size=args.points)
+    points[::100] = np.nan
+
+    payloads = {
+        'overview chart': go.Figure(go.Bar(x=totals.index,
+                                           y=totals['risks'])),
+        f'scatter, {args.points} points': go.Figure(
+            go.Scattergl(x=np.arange(args.points), y=points)),
+        f'table records, {len(df)} rows': df.to_dict('records'),
+        f'table columnar, {len(df)} rows': encode_columnar(df),
+    }
+    with pd.option_context('display.width', 200):
+        print(fastjson.benchmark(payloads, args.repeat))
+    return 0
+
+
+def worker_memory(args):
+    from raca.procmem import measure_workers
+
+    env = {'RACA_DATA': args.source} if args.source else None
+    with pd.option_context('display.width', 200):
+        for preload in ((True, False) if args.compare else (True,)):
+            table = measure_workers(args.workers, preload, args.requests,
+                                    env=env)
+            workers = table[table['process'] == 'worker']
+            print(f'{"With" if preload else "Without"} preload, '
+                  f'{len(workers)} workers')
+            print(table)
+            print(f'Per worker: {workers["rss_mb"].mean():.1f} MB RSS, '
+                  f'{workers["uss_mb"].mean():.1f} MB USS. '
+                  f'Total PSS: {table["pss_mb"].sum():.1f} MB')
+            if preload:
+                print('Shared only until the data is first reloaded; after '
+                      'that each worker holds its own copy of it.')
+            print()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m raca',
+                                     description='RACA data tools')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    cmd = commands.add_parser('build-cache',
+                              help='parse the RACA source and write its '
+                                   'columnar cache, e.g. during deployment')
+    cmd.add_argument('source', nargs='?', default=APP_DATA,
+                     help='RACA workbook (default: %(default)s)')
+    cmd.add_argument('--force', action='store_true',
+                     help='rebuild even if the cache is up to date')
+    cmd.set_defaults(func=build_cache)
+
+    cmd = commands.add_parser('build-sqlite',
+                              help='write the SQLite file served with '
+                                   'RACA_STORAGE=sqlite, e.g. during '
+                                   'deployment')
+    cmd.add_argument('source', nargs='?', default=APP_DATA,
+                     help='RACA workbook (default: %(default)s)')
+    cmd.set_defaults(func=build_sqlite)
+
+    cmd = commands.add_parser('ingest',
+                              help='read a directory or glob of RACA '
+                                   'workbooks in parallel and report on each')
+    cmd.add_argument('source', help='directory or glob, e.g. "racas/*.xlsx"')
+    cmd.add_argument('--workers', type=int,
+                     help='processes to parse with (default: one per CPU)')
+    cmd.set_defaults(func=ingest_workbooks)
+
+    cmd = commands.add_parser('memory-report',
+                              help='compare the memory used by the prepared '
+                                   'frame before and after compaction')
+    cmd.add_argument('source', nargs='?', default=APP_DATA,
+                     help='RACA workbook (default: %(default)s)')
+    cmd.set_defaults(func=report_memory)
+
+    cmd = commands.add_parser('action-aging',
+                              help='print the monthly RACA actions summary '
+                                   'for a reporting date')
+    cmd.add_argument('source', nargs='?', default=APP_DATA,
+                     help='RACA workbook (default: %(default)s)')
+    cmd.add_argument('--date',
+                     help='reporting date, e.g. 2021-03-31 (default: today)')
+    cmd.add_argument('--csv', metavar='PATH',
+                     help='write the report to a CSV file instead')
+    cmd.set_defaults(func=action_aging)
+
+    cmd = commands.add_parser('wire-report',
+                              help='compare the bytes and serialization time '
+                                   'of table payloads in each wire format')
+    cmd.add_argument('source', nargs='?', default=APP_DATA,
+                     help='RACA workbook (default: %(default)s)')
+    cmd.add_argument('--rows', type=int,
+                     help='only send this many rows, e.g. one page')
+    cmd.set_defaults(func=report_wire)
+
+    cmd = commands.add_parser('json-benchmark',
+                              help='compare the plotly and fast JSON '
+                                   'encoders on figures and table data')
+    cmd.add_argument('source', nargs='?', default=APP_DATA,
+                     help='RACA workbook (default: %(default)s)')
+    cmd.add_argument('--points', type=int, default=100000,
+                     help='points in the scatter figure (default: '
+                          '%(default)s)')
+    cmd.add_argument('--repeat', type=int, default=5,
+                     help='encodes to average over (default: %(default)s)')
+    cmd.set_defaults(func=benchmark_json)
+
+    cmd = commands.add_parser('worker-memory',
+                              help='start gunicorn with gunicorn.conf.py and '
+                                   'report the memory of each worker')
+    cmd.add_argument('source', nargs='?',
+                     help='RACA workbook (default: RACA_DATA)')
+    cmd.add_argument('--workers', type=int, default=4,
+                     help='gunicorn workers (default: %(default)s)')
+    cmd.add_argument('--requests', type=int, default=50,
+                     help='requests to send before measuring (default: '
+                          '%(default)s)')
+    cmd.add_argument('--compare', action='store_true',
+                     help='measure again without preload_app')
+    cmd.set_defaults(func=worker_memory)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+
+# ------------------------------------------------------------------------------
+# Action aging for the Monthly Reporting tab
+#
+# Every open action (an action_id with no completion date) goes into one
+# bucket by how its due date compares to the reporting date R:
+#
+#   gt-3     overdue more than 3 months        due <  R-3M
+#   lteq-3   overdue between 1 & 3 months      R-3M <= due < R-1M
+#   lteq-13  due within 1 month either side    R-1M <= due < R+1M
+#   lteq13   due between 1 & 3 months          R+1M <= due < R+3M
+#   gt3      due more than 3 months out        R+3M <= due
+#   ddtbc    due date to be confirmed          no due date we can read
+#
+# The dates are kept as text in the frame, exactly as they are in the sheet.
+# They are parsed into datetime64 once per dataset version (see action_dates)
+# so a report for any reporting date is one searchsorted and one bincount.
+# ------------------------------------------------------------------------------
+BUCKETS = ['gt-3', 'lteq-3', 'lteq-13', 'lteq13', 'gt3', 'ddtbc']
+
+# Months either side of the reporting date where the dated buckets change
+BUCKET_EDGES = [-3, -1, 1, 3]
+
+REPORT_COLUMNS = ['business_unit'] + BUCKETS + ['toa', 'ta']
+
+TOTAL = 'Total'
+
+_EXCEL_EPOCH = pd.Timestamp('1899-12-30')
+
+
+# ------------------------------------------------------------------------------
+# Parse date text the way people type it into the sheet: ISO dates (what the
+# xlsx reader gives us for real date cells), Excel serial numbers, 'Mar-21'
+# meaning the end of March 2021, and day first dates like 31/03/2021.
+# Anything else is NaT. Each distinct string is only parsed once.
+# ------------------------------------------------------------------------------
+def parse_dates(text):
+    codes, uniques = pd.factorize(text)
+    strings = pd.Series(uniques, dtype=object).astype(str).str.strip()
+
+    parsed = pd.to_datetime(strings.str[:10], format='%Y-%m-%d',
+                            errors='coerce')
+
+    serial = parsed.isna() & strings.str.fullmatch(r'\d{5}(\.0+)?')
+    parsed[serial] = _EXCEL_EPOCH + pd.to_timedelta(
+        strings[serial].astype(float), unit='D')
+
+    month = parsed.isna() & strings.str.fullmatch(r'[A-Za-z]{3}-\d{2}')
+    parsed[month] = (pd.to_datetime(strings[month], format='%b-%y',
+                                    errors='coerce') +
+                     pd.offsets.MonthEnd(0))
+
+    rest = parsed.isna() & strings.str.contains(r'\d')
+    for i in np.flatnonzero(rest.to_numpy()):
+        parsed.iloc[i] = pd.to_datetime(strings.iloc[i], dayfirst=True,
+                                        errors='coerce')
+
+    values = np.append(parsed.to_numpy(dtype='datetime64[ns]'),
+                       np.datetime64('NaT'))
+    return pd.Series(values[codes], index=text.index)
+
+
+# ------------------------------------------------------------------------------
+# One row per action with its due and completion dates as datetime64. An
+# action that sits against several controls appears on several rows of the
+# sheet, so actions are counted once per business unit.
+# ------------------------------------------------------------------------------
+def build_action_dates(raca_df):
+    actions = raca_df.loc[raca_df['action_id'].notna(),
+                          ['business_unit', 'action_id', 'action_due_date',
+                           'completion_date']]
+    actions = actions.drop_duplicates(subset=['business_unit', 'action_id'])
+
+    return pd.DataFrame({
+        'business_unit': pd.Categorical(
+            actions['business_unit'].astype(str).to_numpy()),
+        'action_id': actions['action_id'].astype(str).to_numpy(),
+        'due': parse_dates(actions['action_due_date']).to_numpy(),
+        # Any completion text at all closes the action, even if we can't
+        # read it as a date
+        'open': actions['completion_date'].isna().to_numpy(),
+    })
+
+
+def action_dates(dataset):
+    return dataset.derived('action_dates', build_action_dates)
+
+
+def reporting_date(date=None):
+    if date is None or date == '':
+        return pd.Timestamp.today().normalize()
+    return pd.Timestamp(date).normalize()
+
+
+def bucket_edges(date=None):
+    date = reporting_date(date)
+    return [date + pd.DateOffset(months=m) for m in BUCKET_EDGES]
+
+
+# ------------------------------------------------------------------------------
+# Bucket index (a position in BUCKETS) for each due date
+# ------------------------------------------------------------------------------
+def aging_buckets(due, date=None):
+    edges = np.array(bucket_edges(date), dtype='datetime64[ns]')
+    due = np.asarray(due, dtype='datetime64[ns]')
+
+    buckets = np.searchsorted(edges, due, side='right')
+    buckets[np.isnat(due)] = BUCKETS.index('ddtbc')
+    return buckets
+
+
+# ------------------------------------------------------------------------------
+# The RACA Actions Summary: open actions per business unit in each bucket,
+# total open actions (toa) and total actions (ta), with a Total row
+# ------------------------------------------------------------------------------
+def aging_report(actions, date=None):
+    units = actions['business_unit'].cat.categories
+    # As wide as an index, the codes are int8 up to 127 units and would wrap
+    # once multiplied by the number of buckets
+    unit_codes = actions['business_unit'].cat.codes.to_numpy().astype(np.intp)
+    is_open = actions['open'].to_numpy()
+    buckets = aging_buckets(actions['due'].to_numpy()[is_open], date)
+
+    counts = np.bincount(unit_codes[is_open] * len(BUCKETS) + buckets,
+                         minlength=len(units) * len(BUCKETS))
+    return report_frame(units, counts.reshape(len(units), len(BUCKETS)),
+                        np.bincount(unit_codes, minlength=len(units)))
+
+
+# ------------------------------------------------------------------------------
+# The report from the open action counts per business unit and bucket (a row
+# per unit) and the total actions per unit
+# ------------------------------------------------------------------------------
+def report_frame(units, counts, actions):
+    report = pd.DataFrame(counts, columns=BUCKETS)
+    report.insert(0, 'business_unit', units)
+    report['toa'] = report[BUCKETS].sum(axis=1)
+    report['ta'] = actions
+
+    total = report[BUCKETS + ['toa', 'ta']].sum()
+    report.loc[len(report)] = [TOTAL] + [int(count) for count in total]
+    return report[REPORT_COLUMNS]
+
+
+# ------------------------------------------------------------------------------
+# Open actions logged against each business unit, from an aging_report()
+# ------------------------------------------------------------------------------
+def open_actions(report):
+    return report[['business_unit', 'toa']].rename(columns={'toa': 'count'})
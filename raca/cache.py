@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import re
+from contextlib import contextmanager
+
+import pandas as pd
+import pyarrow as pa
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# ------------------------------------------------------------------------------
+# Columnar cache of the prepared RACA frame
+#
+# Parsing the workbook is the slowest part of start up, so once a source has
+# been prepared we write the result to an uncompressed Arrow IPC file. Later
+# loads memory-map that file instead of going anywhere near openpyxl.
+#
+# Each cache file has a small JSON sidecar recording what it was built from.
+# The size/mtime stamp is checked first because it is free; when it differs we
+# hash the source and only rebuild if the contents really changed.
+# ------------------------------------------------------------------------------
+# Bump this whenever prepare_raca() changes what it produces
+CACHE_VERSION = 4
+
+CACHE_DIR = os.environ.get(
+    'RACA_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                 '.raca_cache'))
+
+
+def cache_path(source):
+    # Keep the name readable but don't let two workbooks with the same name in
+    # different folders share a cache file
+    where = hashlib.sha1(os.path.abspath(source).encode()).hexdigest()[:8]
+    # A source can be a glob of workbooks
+    name = re.sub(r'[*?\[\]]', '_', os.path.basename(source))
+    return os.path.join(CACHE_DIR, '%s-%s.arrow' % (name, where))
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_stamp(path):
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def _read_meta(path):
+    try:
+        with open(path + '.json') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(path, meta):
+    tmp = path + '.json.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, path + '.json')
+
+
+# ------------------------------------------------------------------------------
+# Is the cache for source still good? Returns the cache file path or None
+# ------------------------------------------------------------------------------
+def valid_cache(source):
+    path = cache_path(source)
+    meta = _read_meta(path)
+    if (meta is None or meta.get('cache_version') != CACHE_VERSION or
+            not os.path.exists(path)):
+        return None
+
+    stamp = source_stamp(source)
+    if (stamp['size'] == meta['size'] and
+            stamp['mtime_ns'] == meta['mtime_ns']):
+        return path
+
+    # The file has been touched; only a change of contents invalidates us
+    if stamp['size'] != meta['size'] or file_sha256(source) != meta['sha256']:
+        return None
+
+    meta.update(stamp)
+    _write_meta(path, meta)
+    return path
+
+
+# ------------------------------------------------------------------------------
+# Arrow needs one type per column. Excel happily gives us dates and strings
+# mixed in the same column (e.g. action_due_date), so store those as text.
+# ------------------------------------------------------------------------------
+def _arrow_safe(df):
+    df = df.copy(deep=False)
+    for column in df.columns:
+        if df[column].dtype == object:
+            inferred = pd.api.types.infer_dtype(df[column], skipna=True)
+            if inferred.startswith('mixed'):
+                df[column] = df[column].where(df[column].isna(),
+                                              df[column].astype(str))
+    return df
+
+
+def read_cache(source):
+    path = valid_cache(source)
+    if path is None:
+        return None
+
+    table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    return table.to_pandas()
+
+
+def source_meta(source):
+    meta = {'cache_version': CACHE_VERSION}
+    meta.update(source_stamp(source))
+    meta['sha256'] = file_sha256(source)
+    return meta
+
+
+def write_cache(source, df, meta=None):
+    if meta is None:
+        meta = source_meta(source)
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = cache_path(source)
+
+    table = pa.Table.from_pandas(_arrow_safe(df), preserve_index=False)
+
+    # Drop the old sidecar first so a crash part way through leaves no valid
+    # cache rather than a stale one. Write next to the real file and swap it
+    # in, so a reader never sees a half written cache.
+    if os.path.exists(path + '.json'):
+        os.remove(path + '.json')
+    tmp = path + '.tmp'
+    with pa.OSFile(tmp, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)
+    _write_meta(path, meta)
+    return path
+
+
+# ------------------------------------------------------------------------------
+# Only one process at a time builds a cache file. On POSIX this is an flock on
+# a file next to the cache; elsewhere there is no lock and each process just
+# builds its own.
+# ------------------------------------------------------------------------------
+@contextmanager
+def _build_lock(path):
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(path + '.lock', 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# ------------------------------------------------------------------------------
+# Return the prepared frame for source, using the cache when it is valid and
+# building (then caching) it with loader(source) when it is not
+#
+# When the source changes every gunicorn worker notices at once. The first to
+# get the lock parses it; the others wait and then read the file it wrote,
+# so the workbook is parsed once rather than once per worker.
+#
+# That saves time, not memory: to_pandas() copies the text and nullable int
+# columns into each process, and only the categorical codes stay in the
+# mapped file (about 4MB of an 84MB frame at 220,000 rows). After a reload
+# every worker holds its own copy of the new version.
+# ------------------------------------------------------------------------------
+def load_cached(source, loader):
+    df = read_cache(source)
+    if df is not None:
+        return df
+
+    with _build_lock(cache_path(source)):
+        df = read_cache(source)
+        if df is None:
+            # Stamp the source before reading it, so if it changes while we
+            # parse the next load sees a mismatch rather than a stale cache
+            meta = source_meta(source)
+            write_cache(source, loader(source), meta)
+            df = read_cache(source)
+    return df
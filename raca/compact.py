@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# ------------------------------------------------------------------------------
+# Compact in-memory representation of the prepared RACA frame
+#
+# The sheet is flattened, so the process, risk and category text repeats on
+# every control and action row. Holding each distinct string once as a
+# categorical, and the 1-5 impact/likelihood scores as small ints, is most of
+# the memory every worker spends on the dataset.
+# ------------------------------------------------------------------------------
+# A text column is made categorical when it has no more than this fraction of
+# distinct values. Free text that is different on every row (descriptions of
+# individual actions, IDs) is left alone since a categorical would only add
+# the codes on top.
+CATEGORY_MAX_UNIQUE = 0.5
+
+SCORE_COLUMNS = ['gross_impact', 'gross_likelihood', 'net_impact',
+                 'net_likelihood', 'gross_risk', 'net_risk']
+
+_INT_TYPES = [('Int8', np.int8), ('Int16', np.int16), ('Int32', np.int32)]
+
+
+# ------------------------------------------------------------------------------
+# The smallest nullable int a score column fits in, or float32 if any of the
+# scores aren't whole numbers. Also used for the process and risk numbers of
+# the risk IDs (raca/prepare.py).
+# ------------------------------------------------------------------------------
+def small_int(series):
+    values = series.dropna()
+    if len(values) == 0:
+        return series.astype('Int8')
+    if not (values == np.floor(values)).all():
+        return series.astype('float32')
+
+    low, high = values.min(), values.max()
+    for dtype, numpy_type in _INT_TYPES + [('Int64', np.int64)]:
+        info = np.iinfo(numpy_type)
+        if info.min <= low and high <= info.max:
+            return series.astype(dtype)
+    # Whole numbers too big for any int
+    return series.astype('float64')
+
+
+def _is_text(series):
+    return (series.dtype == object and
+            pd.api.types.infer_dtype(series, skipna=True) in ('string',
+                                                              'empty'))
+
+
+def compact(df, max_unique=CATEGORY_MAX_UNIQUE):
+    df = df.copy(deep=False)
+
+    for column in df.columns:
+        series = df[column]
+        if column in SCORE_COLUMNS:
+            if not pd.api.types.is_extension_array_dtype(series.dtype):
+                df[column] = small_int(series)
+        elif _is_text(series):
+            present = series.count()
+            if present and series.nunique() <= present * max_unique:
+                df[column] = series.astype('category')
+    return df
+
+
+# ------------------------------------------------------------------------------
+# Concatenate compacted chunks. A plain concat turns categoricals with
+# different categories back into object columns, so union them instead.
+# ------------------------------------------------------------------------------
+def concat_compact(chunks, max_unique=CATEGORY_MAX_UNIQUE):
+    if len(chunks) == 1:
+        return chunks[0]
+
+    columns = {}
+    for column in chunks[0].columns:
+        parts = [chunk[column] for chunk in chunks]
+        if all(part.dtype.name == 'category' for part in parts):
+            columns[column] = pd.Series(union_categoricals(parts))
+        else:
+            columns[column] = pd.concat(
+                [part.astype(object) if part.dtype.name == 'category'
+                 else part for part in parts], ignore_index=True)
+    # Columns that were only categorical in some chunks get another chance
+    return compact(pd.DataFrame(columns), max_unique)
+
+
+# ------------------------------------------------------------------------------
+# Per column memory before and after compaction
+# ------------------------------------------------------------------------------
+def memory_report(before, after):
+    report = pd.DataFrame({
+        'dtype_before': before.dtypes.astype(str),
+        'bytes_before': before.memory_usage(index=False, deep=True),
+        'dtype_after': after.dtypes.astype(str),
+        'bytes_after': after.memory_usage(index=False, deep=True),
+    })
+    report.loc['TOTAL'] = ['', report['bytes_before'].sum(), '',
+                           report['bytes_after'].sum()]
+    report['saving_%'] = (100 * (1 - report['bytes_after'] /
+                                 report['bytes_before'])).round(1)
+    return report
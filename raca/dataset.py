@@ -0,0 +1,175 @@
+import logging
+import os
+import threading
+import time
+
+from raca.cache import load_cached
+from raca.ingest import load_source
+from raca.views import read_only
+from raca.workbooks import is_multi_source, load_workbooks
+
+# ------------------------------------------------------------------------------
+# Where the RACA data comes from. Set RACA_DATA to point the app at another
+# workbook or CSV export, otherwise we use the test data that ships with the
+# repo.
+# RACA_DATA can also be a directory or glob of workbooks, one per business
+# unit say, read as one dataset (see raca/workbooks.py).
+# Set RACA_CACHE=0 to always parse the workbook and skip the columnar cache.
+# ------------------------------------------------------------------------------
+APP_DATA = os.environ.get(
+    'RACA_DATA',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                 'clensed.xlsx'))
+
+USE_CACHE = os.environ.get('RACA_CACHE', '1') != '0'
+
+logger = logging.getLogger(__name__)
+
+
+def parse_raca(path):
+    return load_source(path)
+
+
+def load_raca(path=None, use_cache=None):
+    path = path or APP_DATA
+    if use_cache is None:
+        use_cache = USE_CACHE
+
+    if is_multi_source(path):
+        return load_workbooks(path, use_cache)[0]
+    if use_cache:
+        return load_cached(path, parse_raca)
+    return parse_raca(path)
+
+
+# ------------------------------------------------------------------------------
+# One published version of the prepared RACA data
+#
+# A Dataset never changes once it has been published. Its frame is read-only
+# (see raca/views.py) and when the source changes we build a whole new Dataset
+# and swap it in, so a callback that grabbed the old one carries on with a
+# consistent view until it returns.
+#
+# derived() memoises anything computed from the frame (option lists, indexes,
+# etc.) against this version, so it is thrown away with the version. A store
+# listener can seed() values it already knows, e.g. carried forward from the
+# previous version (see raca/delta.py).
+# ------------------------------------------------------------------------------
+class Dataset:
+
+    def __init__(self, df, version, source, name=None):
+        self.df = read_only(df)
+        self.version = version
+        self.source = source
+        self.name = name
+        self.loaded_at = time.time()
+        self._derived = {}
+        # Reentrant, a derived value can be built from other derived values
+        self._derived_lock = threading.RLock()
+
+    def derived(self, key, build):
+        try:
+            return self._derived[key]
+        except KeyError:
+            pass
+
+        with self._derived_lock:
+            if key not in self._derived:
+                self._derived[key] = build(self.df)
+            return self._derived[key]
+
+    def cached(self, key):
+        return self._derived.get(key)
+
+    def seed(self, key, value):
+        with self._derived_lock:
+            self._derived.setdefault(key, value)
+
+    def seed_from(self, other, keys):
+        # Only for a version whose frame is the same as other's, and only
+        # plain values: anything holding other itself (an engine, a cache
+        # that fills in later) would keep working on the old version
+        for key in keys:
+            value = other.cached(key)
+            if value is not None:
+                self.seed(key, value)
+
+    def __repr__(self):
+        return (f'<Dataset v{self.version} {os.path.basename(self.source)} '
+                f'{len(self.df)} rows>')
+
+
+# ------------------------------------------------------------------------------
+# Holds the current Dataset for a source
+#
+# Readers just read self._current, which is a single reference swap away from
+# the next version. Reloads build the new frame before taking the lock, so
+# readers never wait on a reload.
+#
+# Listeners are called as listener(old, new) with each new Dataset before it
+# is swapped in (old is None for the first load). A listener that fails is
+# logged and doesn't stop the new version being published.
+#
+# unload() drops the current Dataset to free its memory; the next get() reads
+# the source again. Version numbers carry on from where they were, so a
+# reloaded Dataset is never mistaken for the one that was dropped.
+# ------------------------------------------------------------------------------
+class DatasetStore:
+
+    def __init__(self, source, loader=load_raca, name=None):
+        self.source = source
+        self.name = name
+        self._loader = loader
+        self._current = None
+        self._version = 0
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+
+    def _notify(self, old, new):
+        for listener in self._listeners:
+            try:
+                listener(old, new)
+            except Exception:
+                logger.exception('Dataset listener %r failed for %r',
+                                 listener, new)
+
+    def get(self):
+        current = self._current
+        if current is None:
+            with self._lock:
+                # Someone else may have loaded it while we waited for the lock
+                if self._current is None:
+                    self._swap(self._loader(self.source))
+                current = self._current
+        return current
+
+    @property
+    def version(self):
+        return self._version
+
+    @property
+    def loaded(self):
+        return self._current is not None
+
+    def _swap(self, df):
+        old = self._current
+        dataset = Dataset(df, self._version + 1, self.source, self.name)
+        self._notify(old, dataset)
+        self._current = dataset
+        self._version = dataset.version
+        return dataset
+
+    def publish(self, df):
+        with self._lock:
+            return self._swap(df)
+
+    def reload(self):
+        return self.publish(self._loader(self.source))
+
+    def unload(self):
+        with self._lock:
+            old, self._current = self._current, None
+        return old
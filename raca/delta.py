@@ -0,0 +1,195 @@
+import logging
+
+import numpy as np
+import pandas as pd
+from pandas.util import hash_pandas_object
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------------------
+# Row level change detection between dataset versions
+#
+# A new workbook usually only changes a handful of rows. Every version keeps
+# a 64 bit hash of each row's contents against the row's key, so the next
+# version can work out which rows were inserted, updated or deleted, and
+# carry its aggregates forward from those rows alone rather than regrouping
+# the whole sheet.
+#
+# A row is keyed on its risk, control and action IDs. The sheet is allowed to
+# repeat a key, so the nth repeat of a key is told apart by n.
+# ------------------------------------------------------------------------------
+ROW_KEY = ['risk_id', 'control_id', 'action_id']
+
+
+class RowHashes:
+
+    def __init__(self, keys, values):
+        self.keys = keys
+        self.values = values
+
+    def __len__(self):
+        return len(self.keys)
+
+
+def row_hashes(df):
+    key = hash_pandas_object(df[ROW_KEY], index=False).to_numpy()
+    repeat = pd.Series(key).groupby(key, sort=False).cumcount().to_numpy()
+    keys = hash_pandas_object(pd.DataFrame({'key': key, 'repeat': repeat}),
+                              index=False).to_numpy()
+    values = hash_pandas_object(df, index=False).to_numpy()
+    return RowHashes(keys, values)
+
+
+# ------------------------------------------------------------------------------
+# Row positions that changed from one version to the next. inserted and
+# updated are positions in the new frame, deleted and replaced (the old
+# position of each updated row) are positions in the old frame.
+# ------------------------------------------------------------------------------
+class RowDelta:
+
+    def __init__(self, inserted, updated, replaced, deleted, reordered):
+        self.inserted = inserted
+        self.updated = updated
+        self.replaced = replaced
+        self.deleted = deleted
+        self.reordered = reordered
+
+    @property
+    def unchanged(self):
+        return not (len(self.inserted) or len(self.updated) or
+                    len(self.deleted))
+
+    def summary(self):
+        return {'inserted': len(self.inserted), 'updated': len(self.updated),
+                'deleted': len(self.deleted)}
+
+    def __repr__(self):
+        return ('<RowDelta %(inserted)d inserted, %(updated)d updated, '
+                '%(deleted)d deleted>' % self.summary())
+
+
+def diff_rows(old, new):
+    # Where each old row is in the new frame, or -1 if its key has gone
+    where = pd.Index(new.keys).get_indexer(old.keys)
+    kept = where >= 0
+
+    deleted = np.flatnonzero(~kept)
+    changed = kept.copy()
+    changed[kept] = old.values[kept] != new.values[where[kept]]
+    replaced = np.flatnonzero(changed)
+    updated = where[changed]
+
+    inserted_mask = np.ones(len(new), dtype=bool)
+    inserted_mask[where[kept]] = False
+    inserted = np.flatnonzero(inserted_mask)
+
+    reordered = not np.array_equal(where[kept], np.arange(kept.sum()))
+    return RowDelta(inserted, updated, replaced, deleted, reordered)
+
+
+# ------------------------------------------------------------------------------
+# Per business unit totals behind the Overview charts: rows, distinct risks
+# and the summed gross and net risk scores
+#
+# Distinct risks can't be added and taken away directly, so we keep the
+# number of rows each (business unit, risk) pair has and count the pairs
+# that still have any.
+# ------------------------------------------------------------------------------
+class BusinessUnitTotals:
+
+    def __init__(self, sums, risk_rows):
+        self.sums = sums
+        self.risk_rows = risk_rows
+        self._frame = None
+
+    @classmethod
+    def _of_rows(cls, df, positions=None):
+        part = df if positions is None else df.iloc[positions]
+        units = part['business_unit'].astype(str).to_numpy()
+
+        sums = pd.DataFrame({
+            'rows': np.ones(len(part), dtype=np.int64),
+            'gross_risk': part['gross_risk'].astype('float64').fillna(0)
+                                            .to_numpy(),
+            'net_risk': part['net_risk'].astype('float64').fillna(0)
+                                        .to_numpy(),
+        }).groupby(units).sum()
+
+        risks = part['risk_id'].astype(object).to_numpy()
+        risk_rows = pd.Series(np.ones(len(part), dtype=np.int64)).groupby(
+            [units, risks]).sum()
+        return cls(sums, risk_rows)
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls._of_rows(df)
+
+    def apply(self, delta, old_df, new_df):
+        added = self._of_rows(new_df, np.concatenate([delta.inserted,
+                                                      delta.updated]))
+        removed = self._of_rows(old_df, np.concatenate([delta.deleted,
+                                                        delta.replaced]))
+
+        sums = (self.sums.add(added.sums, fill_value=0)
+                .sub(removed.sums, fill_value=0))
+        sums = sums[sums['rows'] > 0].astype({'rows': np.int64})
+
+        risk_rows = (self.risk_rows.add(added.risk_rows, fill_value=0)
+                     .sub(removed.risk_rows, fill_value=0))
+        risk_rows = risk_rows[risk_rows > 0].astype(np.int64)
+        return BusinessUnitTotals(sums.sort_index(), risk_rows.sort_index())
+
+    def frame(self):
+        if self._frame is None:
+            risks = self.risk_rows.groupby(level=0).size()
+            totals = self.sums.copy()
+            totals.insert(1, 'risks',
+                          risks.reindex(totals.index, fill_value=0))
+            totals.index.name = 'business_unit'
+            self._frame = totals
+        return self._frame
+
+
+def get_row_hashes(dataset):
+    return dataset.derived('row_hashes', row_hashes)
+
+
+# ------------------------------------------------------------------------------
+# The totals as a frame indexed on business_unit with rows, risks,
+# gross_risk and net_risk columns
+# ------------------------------------------------------------------------------
+def get_unit_totals(dataset):
+    return dataset.derived('unit_totals',
+                           BusinessUnitTotals.from_frame).frame()
+
+
+# ------------------------------------------------------------------------------
+# DatasetStore listener: called with the outgoing and incoming versions
+# before the new one is swapped in. Hashes the new rows, diffs them against
+# the old ones and seeds the new version's totals from the old version's.
+#
+# A workbook that was saved without any real change gets the plain values
+# the old version had already worked out (CARRIED), as long as the rows are in
+# the same order. Engines, the default view and the sort order caches are
+# left to be built for the new version, as they refer to the Dataset they were
+# built for, and so is the model, which would keep the old frame alive.
+# ------------------------------------------------------------------------------
+CARRIED = ['taxonomy', 'action_dates', 'unit_totals']
+
+
+def carry_forward(old, new):
+    hashes = get_row_hashes(new)
+    if old is None:
+        return
+
+    delta = diff_rows(get_row_hashes(old), hashes)
+    new.seed('row_delta', delta)
+    logger.info('%r from v%s: %r', new, old.version, delta)
+
+    if delta.unchanged and not delta.reordered:
+        new.seed_from(old, CARRIED)
+        return
+
+    totals = old.cached('unit_totals')
+    if totals is not None:
+        new.seed('unit_totals', totals.apply(delta, old.df, new.df))
@@ -0,0 +1,265 @@
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from raca.cache import CACHE_DIR
+from raca.dataset import Dataset, load_raca
+from raca.storage import FrameEngine, SQLiteEngine, fingerprint, get_engine
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------------------
+# Exports of the server paged tables
+#
+# The tables only ever hold the page on screen, so an export can't come from
+# the browser. Instead the filtered and sorted view is written on the server
+# by a pool of separate processes, so a month-end export never holds up a web
+# worker, a chunk of rows at a time: CSV, or XLSX through openpyxl's
+# write-only mode. Neither the whole view nor the whole workbook is ever held
+# in memory.
+#
+# Each job keeps its state in EXPORT_DIR/<job>.json next to its file, so
+# whichever web worker a page polls can say how far it has got and serve the
+# download. Exports are removed EXPORT_KEEP_HOURS after they were started.
+#
+# An export process reads the dataset from the SQLite file with
+# RACA_STORAGE=sqlite, otherwise from the source (by way of the columnar
+# cache), and runs at a lower CPU priority than the web workers. Either way
+# it writes the version the table showed or nothing: the SQLite file is the
+# one for that version, and a source that has changed since (its rows'
+# fingerprint differs) fails the job.
+# ------------------------------------------------------------------------------
+EXPORT_DIR = os.environ.get('RACA_EXPORT_DIR',
+                            os.path.join(CACHE_DIR, 'exports'))
+
+EXPORT_WORKERS = int(os.environ.get('RACA_EXPORT_WORKERS', '1'))
+
+EXPORT_NICE = int(os.environ.get('RACA_EXPORT_NICE', '10'))
+
+EXPORT_KEEP_HOURS = float(os.environ.get('RACA_EXPORT_KEEP_HOURS', '24'))
+
+FORMATS = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.'
+            'sheet',
+}
+
+# Seconds between progress updates to a job's status file
+PROGRESS_SECONDS = 0.5
+
+_JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+def export_path(job_id, export_format):
+    return os.path.join(EXPORT_DIR, f'{job_id}.{export_format}')
+
+
+def _status_path(job_id):
+    return os.path.join(EXPORT_DIR, f'{job_id}.json')
+
+
+def _write_status(status):
+    path = _status_path(status['id'])
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(status, f)
+    os.replace(tmp, path)
+
+
+def job_status(job_id):
+    if not _JOB_ID.match(job_id or ''):
+        return None
+    try:
+        with open(_status_path(job_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# ------------------------------------------------------------------------------
+# Writing an export, in the export process
+# ------------------------------------------------------------------------------
+def _cells(chunk):
+    # Python values with None for empty cells
+    return chunk.astype(object).where(chunk.notna(), None).itertuples(
+        index=False, name=None)
+
+
+def _write_csv(path, headers, chunks, progress):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        pd.DataFrame(columns=headers).to_csv(f, index=False)
+        for chunk in chunks:
+            chunk.to_csv(f, header=False, index=False)
+            progress(len(chunk))
+
+
+def _write_xlsx(path, headers, chunks, progress):
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('RACA')
+    sheet.append(headers)
+    for chunk in chunks:
+        for row in _cells(chunk):
+            sheet.append(row)
+        progress(len(chunk))
+    workbook.save(path)
+
+
+WRITERS = {'csv': _write_csv, 'xlsx': _write_xlsx}
+
+
+class VersionChanged(ValueError):
+    pass
+
+
+CHANGED = ('The data has changed since this export was started, export '
+           'again to get the current version')
+
+
+def _engine(spec):
+    if spec['sqlite']:
+        if not os.path.exists(spec['sqlite']):
+            raise VersionChanged(CHANGED)
+        return SQLiteEngine(spec['sqlite'])
+    dataset = Dataset(load_raca(spec['source']), spec['version'],
+                      spec['source'], spec['name'])
+    if fingerprint(dataset) != spec['fingerprint']:
+        raise VersionChanged(CHANGED)
+    return FrameEngine(dataset)
+
+
+def run_export(status, spec):
+    status.update(state='running', rows=0)
+    _write_status(status)
+    try:
+        columns = [column for column, _ in spec['columns']]
+        total, chunks = _engine(spec).rows(spec['view'], columns,
+                                           spec['sort_by'],
+                                           spec['filter_query'])
+        status['total'] = total
+        _write_status(status)
+
+        written = [time.monotonic()]
+
+        def progress(rows):
+            status['rows'] += rows
+            if time.monotonic() - written[0] >= PROGRESS_SECONDS:
+                _write_status(status)
+                written[0] = time.monotonic()
+
+        # Every declared column, in the table's order
+        chunks = (chunk.reindex(columns=columns) for chunk in chunks)
+        path = export_path(status['id'], status['format'])
+        tmp = f'{path}.tmp'
+        WRITERS[status['format']](tmp, [name for _, name in spec['columns']],
+                                  chunks, progress)
+        os.replace(tmp, path)
+        status.update(state='done', finished=time.time())
+    except Exception as e:
+        logger.exception('Export %s failed', status['id'])
+        status.update(state='failed', error=str(e), finished=time.time())
+    _write_status(status)
+    return status
+
+
+# ------------------------------------------------------------------------------
+# Starting exports, in the web worker
+#
+# The pool is started on the first export in each worker process, with
+# spawn: a web worker has threads running (the source watchers) that a fork
+# would copy in whatever state they happen to be in.
+# ------------------------------------------------------------------------------
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _start_process():
+    if EXPORT_NICE and hasattr(os, 'nice'):
+        os.nice(EXPORT_NICE)
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                EXPORT_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_start_process)
+        return _pool
+
+
+def _prune(keep_hours=EXPORT_KEEP_HOURS):
+    cutoff = time.time() - keep_hours * 3600
+    for entry in os.scandir(EXPORT_DIR):
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def _finished(status, future):
+    # run_export() records its own failures; this is for the process dying
+    error = future.exception()
+    if error is not None:
+        logger.error('Export %s failed: %r', status['id'], error)
+        current = job_status(status['id']) or status
+        current.update(state='failed', error=str(error) or repr(error),
+                       finished=time.time())
+        _write_status(current)
+
+
+# Queue an export of a table view (see raca/storage.py) and return its job id.
+# columns is a list of (column id, header) pairs.
+def start_export(dataset, view, columns, sort_by=None, filter_query=None,
+                 export_format='csv', storage=None):
+    if export_format not in FORMATS:
+        raise ValueError(f'Unknown export format: {export_format}')
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    _prune()
+
+    engine = get_engine(dataset, storage)
+    job_id = uuid.uuid4().hex
+    name = re.sub(r'[^A-Za-z0-9_.-]+', '_',
+                  f'{dataset.name or "raca"}-{view}')
+    status = {
+        'id': job_id,
+        'state': 'queued',
+        'format': export_format,
+        'filename': f'{name}-{time.strftime("%Y%m%d-%H%M%S")}.'
+                    f'{export_format}',
+        'dataset': dataset.name,
+        'version': dataset.version,
+        'rows': 0,
+        'total': None,
+        'error': None,
+        'started': time.time(),
+        'finished': None,
+    }
+    spec = {
+        'source': dataset.source,
+        'name': dataset.name,
+        'version': dataset.version,
+        'sqlite': getattr(engine, 'path', None),
+        'fingerprint': fingerprint(dataset),
+        'view': view,
+        'columns': [list(column) for column in columns],
+        'sort_by': sort_by or [],
+        'filter_query': filter_query or '',
+    }
+    _write_status(status)
+
+    future = _executor().submit(run_export, status, spec)
+    future.add_done_callback(lambda future: _finished(status, future))
+    logger.info('Export %s of %r %s queued', job_id, dataset, view)
+    return job_id
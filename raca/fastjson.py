@@ -0,0 +1,115 @@
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import plotly
+from plotly.utils import PlotlyJSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------------------
+# Fast JSON for callback responses and figures
+#
+# Dash serialises every callback response with plotly's PlotlyJSONEncoder,
+# which walks the response in pure Python and then, if a NaN turns up
+# anywhere, parses and serialises the whole thing a second time to turn it
+# into null. FastJSONEncoder does the same job with orjson, which encodes
+# numpy arrays and NaN natively; anything orjson doesn't know (figures,
+# pandas objects) is handed to the plotly encoder's default(). A response
+# orjson can't write at all, such as a datetime64 array holding NaT, goes to
+# the plotly encoder whole.
+#
+# RACA_JSON picks the encoder: 'orjson' (the default when orjson is
+# installed) or 'plotly' to leave Dash alone.
+# ------------------------------------------------------------------------------
+JSON_ENGINE = os.environ.get('RACA_JSON', 'orjson' if orjson else 'plotly')
+
+_PLOTLY_ENCODER = PlotlyJSONEncoder
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj):
+    if obj is pd.NA or obj is pd.NaT:
+        return None
+    if isinstance(obj, pd.Timestamp):
+        return obj.isoformat()
+    if isinstance(obj, np.ndarray):
+        # Only object arrays get here, orjson does the rest itself
+        return obj.tolist()
+    return _PLOTLY_ENCODER().default(obj)
+
+
+def _orjson_dumps(obj):
+    try:
+        return orjson.dumps(obj, default=_default, option=_OPTIONS).decode()
+    except orjson.JSONEncodeError:
+        return json.dumps(obj, cls=_PLOTLY_ENCODER)
+
+
+class FastJSONEncoder(_PLOTLY_ENCODER):
+
+    def encode(self, o):
+        # orjson only writes compact JSON
+        if self.indent is not None or self.sort_keys:
+            return super().encode(o)
+        return _orjson_dumps(o)
+
+
+def dumps(obj):
+    if JSON_ENGINE == 'orjson':
+        return _orjson_dumps(obj)
+    return json.dumps(obj, cls=_PLOTLY_ENCODER)
+
+
+def loads(text):
+    if JSON_ENGINE == 'orjson':
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+# ------------------------------------------------------------------------------
+# Point Dash at the fast encoder. Dash looks plotly.utils.PlotlyJSONEncoder up
+# on every response, so swapping the attribute is all it takes.
+# ------------------------------------------------------------------------------
+def install(engine=None):
+    engine = engine or JSON_ENGINE
+    if engine == 'orjson' and orjson is None:
+        logger.warning('RACA_JSON=orjson but orjson is not installed, '
+                       'using the plotly encoder')
+        engine = 'plotly'
+
+    plotly.utils.PlotlyJSONEncoder = (FastJSONEncoder if engine == 'orjson'
+                                      else _PLOTLY_ENCODER)
+    return engine
+
+
+# ------------------------------------------------------------------------------
+# Time each encoder on some payloads, as Dash would call them
+# ------------------------------------------------------------------------------
+def benchmark(payloads, repeat=5):
+    encoders = [('plotly', _PLOTLY_ENCODER)]
+    if orjson is not None:
+        encoders.append(('orjson', FastJSONEncoder))
+
+    rows = []
+    for name, payload in payloads.items():
+        for engine, encoder in encoders:
+            started = time.perf_counter()
+            for _ in range(repeat):
+                text = json.dumps(payload, cls=encoder)
+            seconds = (time.perf_counter() - started) / repeat
+            size = len(text.encode('utf-8'))
+            rows.append({'payload': name, 'encoder': engine, 'bytes': size,
+                         'ms': round(seconds * 1000, 2),
+                         'MB/s': round(size / seconds / 1e6, 1)})
+    return pd.DataFrame(rows).set_index(['payload', 'encoder'])
@@ -0,0 +1,219 @@
+import functools
+import glob
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from raca import fastjson
+from raca.cache import CACHE_DIR
+
+# ------------------------------------------------------------------------------
+# Memoised Plotly figures for the Overview charts
+#
+# Every change to the Overview dropdowns fires all four chart callbacks, and
+# people keep coming back to the same few filter combinations. A figure is
+# stored as its Plotly JSON against (output id, filter values, dataset
+# version), so a new version of the data never serves an old chart; the old
+# entries just age out.
+#
+# RACA_FIGURE_CACHE picks the backend: 'memory' (default, per process),
+# 'disk' (shared by every worker on the box) or 'off'. RACA_FIGURE_CACHE_MB
+# caps how much it holds; the least recently used figures go first.
+# ------------------------------------------------------------------------------
+FIGURE_CACHE = os.environ.get('RACA_FIGURE_CACHE', 'memory')
+
+FIGURE_CACHE_MB = float(os.environ.get('RACA_FIGURE_CACHE_MB', '64'))
+
+FIGURE_CACHE_DIR = os.environ.get('RACA_FIGURE_CACHE_DIR',
+                                  os.path.join(CACHE_DIR, 'figures'))
+
+
+def figure_key(output_id, values, version):
+    key = json.dumps([output_id, list(values), version], sort_keys=True,
+                     default=str)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+# ------------------------------------------------------------------------------
+# Backends map a key to the figure JSON. They only have to keep themselves
+# under max_bytes; FigureCache does the counting.
+# ------------------------------------------------------------------------------
+class MemoryBackend:
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key, value):
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key))
+            self._entries[key] = value
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, old = self._entries.popitem(last=False)
+                self._bytes -= len(old)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def info(self):
+        return {'entries': len(self._entries), 'bytes': self._bytes}
+
+
+# ------------------------------------------------------------------------------
+# One file per figure. The file mtime is bumped on every hit so it doubles as
+# the LRU order, and files are written to a temp name and renamed into place
+# so another worker never reads half a figure.
+# ------------------------------------------------------------------------------
+class DiskBackend:
+
+    def __init__(self, max_bytes, directory=FIGURE_CACHE_DIR):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._lock = threading.Lock()
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def _files(self):
+        files = []
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                st = os.stat(path)
+            except OSError:
+                # Evicted by another worker
+                continue
+            files.append((st.st_mtime_ns, st.st_size, path))
+        return files
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                value = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(value)
+        os.replace(tmp, path)
+
+        with self._lock:
+            files = sorted(self._files())
+            total = sum(size for _, size, _ in files)
+            for _, size, old in files:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+                total -= size
+                self.evictions += 1
+
+    def clear(self):
+        for _, _, path in self._files():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def info(self):
+        files = self._files()
+        return {'entries': len(files),
+                'bytes': sum(size for _, size, _ in files),
+                'directory': self.directory}
+
+
+BACKENDS = {'memory': MemoryBackend, 'disk': DiskBackend}
+
+
+class FigureCache:
+
+    def __init__(self, backend=FIGURE_CACHE, max_mb=FIGURE_CACHE_MB):
+        self.enabled = backend != 'off'
+        self.backend_name = backend
+        self.backend = (BACKENDS[backend](int(max_mb * 1024 * 1024))
+                        if self.enabled else None)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get_or_build(self, key, build):
+        if not self.enabled:
+            return build()
+
+        value = self.backend.get(key)
+        self._count(value is not None)
+        if value is None:
+            value = fastjson.dumps(build())
+            self.backend.set(key, value)
+        return fastjson.loads(value)
+
+    def clear(self):
+        if self.enabled:
+            self.backend.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        stats = {'backend': self.backend_name,
+                 'hits': self.hits,
+                 'misses': self.misses,
+                 'hit_rate': (round(self.hits / lookups, 3) if lookups
+                              else None)}
+        if self.enabled:
+            stats.update(self.backend.info())
+            stats['max_bytes'] = self.backend.max_bytes
+            stats['evictions'] = self.backend.evictions
+        return stats
+
+
+# ------------------------------------------------------------------------------
+# Decorator for a figure callback. The last input of every chart callback is
+# the page's dataset-version token; the key swaps it for get_version(token),
+# the version of the dataset the figure is about to be built from, so a page
+# that hasn't polled yet still shares entries with everyone else.
+# ------------------------------------------------------------------------------
+def cached_figure(cache, output_id, get_version):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            key = figure_key(output_id, args[:-1], get_version(args[-1]))
+            return cache.get_or_build(key, lambda: func(*args))
+        return wrapper
+    return decorator
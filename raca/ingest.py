@@ -0,0 +1,178 @@
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+
+from raca.compact import compact, concat_compact
+from raca.prepare import prepare_raca
+from raca.schema import SOURCE_DTYPES, TEXT
+
+# ------------------------------------------------------------------------------
+# Streaming ingestion of a RACA source
+#
+# Sources are read a chunk of rows at a time. Each chunk is typed against
+# SOURCE_DTYPES, run through prepare_raca() and compacted as it arrives, so we
+# only ever hold the compact prepared frame plus one raw chunk rather than the
+# whole untyped sheet while pandas guesses at its dtypes.
+#
+# A reader is any function (path, chunksize) -> iterator of DataFrames with the
+# source headers. Add new formats with register_reader().
+# ------------------------------------------------------------------------------
+CHUNK_ROWS = int(os.environ.get('RACA_CHUNK_ROWS', '50000'))
+
+SOURCE_COLUMNS = list(SOURCE_DTYPES)
+TEXT_COLUMNS = [c for c, dtype in SOURCE_DTYPES.items() if dtype == TEXT]
+
+# Cell values that mean 'nothing here'. These are the strings pandas treats as
+# missing by default, so the CSV and xlsx readers agree with pd.read_excel().
+NA_VALUES = {'', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN',
+             '-nan', '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN',
+             'n/a', 'nan', 'null'}
+
+READERS = {}
+
+
+def register_reader(fmt, reader):
+    READERS[fmt] = reader
+
+
+# ------------------------------------------------------------------------------
+# Work out what a source is from its first bytes, falling back on the
+# extension. xlsx files are zip archives so always start with 'PK'.
+# ------------------------------------------------------------------------------
+def detect_format(path):
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    if magic == b'PK\x03\x04':
+        return 'xlsx'
+
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.csv', '.txt'):
+        return 'csv'
+    if extension in ('.xlsx', '.xlsm'):
+        return 'xlsx'
+    raise ValueError(f'Cannot tell what format {path} is in')
+
+
+# ------------------------------------------------------------------------------
+# CSV - read everything as text so pandas never has to infer a dtype, then
+# type_chunk() converts the score columns. 'utf-8-sig' drops the BOM Excel
+# puts on its CSV exports.
+# ------------------------------------------------------------------------------
+def read_csv_chunks(path, chunksize=CHUNK_ROWS):
+    reader = pd.read_csv(path, encoding='utf-8-sig', dtype=str,
+                         keep_default_na=False, na_values=NA_VALUES,
+                         chunksize=chunksize)
+    for chunk in reader:
+        yield chunk
+
+
+# ------------------------------------------------------------------------------
+# xlsx - openpyxl in read-only mode streams rows out of the sheet XML instead
+# of building the whole workbook in memory
+# ------------------------------------------------------------------------------
+def _dedupe_headers(headers):
+    # Same scheme as pandas: the second 'I' becomes 'I.1' and so on
+    seen = {}
+    result = []
+    for header in headers:
+        header = '' if header is None else str(header)
+        if header in seen:
+            seen[header] += 1
+            result.append(f'{header}.{seen[header]}')
+        else:
+            seen[header] = 0
+            result.append(header)
+    return result
+
+
+def _cell_text(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return None if value in NA_VALUES else value
+    if isinstance(value, datetime.datetime):
+        if value.time() == datetime.time():
+            return value.date().isoformat()
+        return value.isoformat(sep=' ')
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def read_xlsx_chunks(path, chunksize=CHUNK_ROWS):
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        headers = _dedupe_headers(next(rows, ()))
+        width = len(headers)
+        text = [i for i, header in enumerate(headers)
+                if header in TEXT_COLUMNS]
+
+        batch = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            row = list(row[:width]) + [None] * (width - len(row))
+            for i in text:
+                row[i] = _cell_text(row[i])
+            batch.append(row)
+
+            if len(batch) >= chunksize:
+                yield pd.DataFrame.from_records(batch, columns=headers)
+                batch = []
+
+        if batch:
+            yield pd.DataFrame.from_records(batch, columns=headers)
+    finally:
+        workbook.close()
+
+
+register_reader('csv', read_csv_chunks)
+register_reader('xlsx', read_xlsx_chunks)
+
+
+# ------------------------------------------------------------------------------
+# Give a raw chunk exactly the columns and dtypes in SOURCE_DTYPES
+# ------------------------------------------------------------------------------
+def type_chunk(chunk, source=''):
+    missing = [c for c in SOURCE_COLUMNS if c not in chunk.columns]
+    if missing:
+        raise ValueError(f'{source} is missing RACA columns: '
+                         f'{", ".join(missing)}')
+
+    chunk = chunk[SOURCE_COLUMNS]
+    typed = {}
+    for column, dtype in SOURCE_DTYPES.items():
+        if dtype == TEXT:
+            text = chunk[column].astype(object)
+            typed[column] = text.where(text.notna(), np.nan)
+        else:
+            typed[column] = pd.to_numeric(chunk[column],
+                                          errors='coerce').astype(dtype)
+    return pd.DataFrame(typed, index=chunk.index)
+
+
+def iter_prepared_chunks(path, fmt=None, chunksize=CHUNK_ROWS,
+                         compact_data=True):
+    reader = READERS[fmt or detect_format(path)]
+    for chunk in reader(path, chunksize):
+        chunk = prepare_raca(type_chunk(chunk, path))
+        yield compact(chunk) if compact_data else chunk
+
+
+# ------------------------------------------------------------------------------
+# Read a whole RACA source into one prepared frame
+# ------------------------------------------------------------------------------
+def load_source(path, fmt=None, chunksize=CHUNK_ROWS, compact_data=True):
+    chunks = list(iter_prepared_chunks(path, fmt, chunksize, compact_data))
+    if not chunks:
+        raise ValueError(f'{path} has no RACA rows')
+    if compact_data:
+        return concat_compact(chunks)
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks, ignore_index=True, copy=False)
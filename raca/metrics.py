@@ -0,0 +1,196 @@
+import bisect
+import functools
+import logging
+import threading
+import time
+
+import flask
+from dash import callback_context
+from dash.dependencies import Output
+from dash.exceptions import PreventUpdate
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------------------
+# Callback instrumentation
+#
+# Every Dash callback is registered through instrument_callbacks(), which
+# times it, counts the inputs that triggered it and, once Flask has built the
+# response, records how many bytes went back to the browser. The numbers are
+# served as Prometheus histograms from /metrics (see metrics_text()).
+#
+# Metrics are kept per process, so with several gunicorn workers each one
+# reports its own.
+# ------------------------------------------------------------------------------
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+SIZE_BUCKETS = [1000, 10000, 100000, 1000000, 10000000]
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ['+Inf'], self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_sum{{{labels}}} {self.sum}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+class CallbackStats:
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+        self.prevented = 0
+        self.errors = 0
+        self.triggers = {}
+
+
+class CallbackMetrics:
+
+    def __init__(self):
+        self.callbacks = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, name):
+        stats = self.callbacks.get(name)
+        if stats is None:
+            stats = self.callbacks.setdefault(name, CallbackStats())
+        return stats
+
+    def observe_call(self, name, seconds, triggered, outcome):
+        with self._lock:
+            stats = self._stats(name)
+            stats.latency.observe(seconds)
+            for prop_id in triggered:
+                stats.triggers[prop_id] = stats.triggers.get(prop_id, 0) + 1
+            if outcome == 'prevented':
+                stats.prevented += 1
+            elif outcome == 'error':
+                stats.errors += 1
+
+    def observe_size(self, name, size):
+        with self._lock:
+            self._stats(name).size.observe(size)
+
+    def instrument(self, func, name):
+        @functools.wraps(func)
+        def wrapper(*args):
+            triggered = [t['prop_id'] for t in callback_context.triggered
+                         if t['prop_id'] != '.']
+            flask.g.raca_callback = name
+            outcome = 'ok'
+            started = time.perf_counter()
+            try:
+                return func(*args)
+            except PreventUpdate:
+                outcome = 'prevented'
+                raise
+            except Exception:
+                outcome = 'error'
+                raise
+            finally:
+                seconds = time.perf_counter() - started
+                self.observe_call(name, seconds, triggered, outcome)
+                logger.debug('%s %s in %.1fms after %s', name, outcome,
+                             seconds * 1000, ', '.join(triggered) or 'load')
+        return wrapper
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+# ------------------------------------------------------------------------------
+# Prometheus text format for everything recorded so far
+# ------------------------------------------------------------------------------
+def metrics_text(metrics):
+    lines = [
+        '# HELP raca_callback_duration_seconds Dash callback wall time',
+        '# TYPE raca_callback_duration_seconds histogram',
+    ]
+    with metrics._lock:
+        callbacks = sorted(metrics.callbacks.items())
+        for name, stats in callbacks:
+            lines.extend(stats.latency.lines('raca_callback_duration_seconds',
+                                             f'callback="{_label(name)}"'))
+
+        lines += ['# HELP raca_callback_response_bytes Serialized callback '
+                  'response size',
+                  '# TYPE raca_callback_response_bytes histogram']
+        for name, stats in callbacks:
+            lines.extend(stats.size.lines('raca_callback_response_bytes',
+                                          f'callback="{_label(name)}"'))
+
+        lines += ['# HELP raca_callback_prevented_total Callbacks that '
+                  'raised PreventUpdate',
+                  '# TYPE raca_callback_prevented_total counter']
+        lines += [f'raca_callback_prevented_total{{callback="{_label(name)}"}}'
+                  f' {stats.prevented}' for name, stats in callbacks]
+
+        lines += ['# HELP raca_callback_errors_total Callbacks that raised an '
+                  'error',
+                  '# TYPE raca_callback_errors_total counter']
+        lines += [f'raca_callback_errors_total{{callback="{_label(name)}"}}'
+                  f' {stats.errors}' for name, stats in callbacks]
+
+        lines += ['# HELP raca_callback_triggers_total Inputs that triggered '
+                  'a callback',
+                  '# TYPE raca_callback_triggers_total counter']
+        for name, stats in callbacks:
+            for prop_id, count in sorted(stats.triggers.items()):
+                lines.append(f'raca_callback_triggers_total{{callback='
+                             f'"{_label(name)}",input="{_label(prop_id)}"}}'
+                             f' {count}')
+    return '\n'.join(lines) + '\n'
+
+
+# ------------------------------------------------------------------------------
+# A drop in replacement for app.callback that instruments the callback. Each
+# callback is named after its function and outputs, since several callbacks
+# share a function name.
+# ------------------------------------------------------------------------------
+def _outputs(args):
+    for arg in args:
+        if isinstance(arg, Output):
+            yield str(arg)
+        elif isinstance(arg, (list, tuple)):
+            yield from _outputs(arg)
+
+
+def instrument_callbacks(app, metrics):
+    def callback(*args, **kwargs):
+        register = app.callback(*args, **kwargs)
+        outputs = ','.join(_outputs(args + tuple(kwargs.values())))
+
+        def decorator(func):
+            name = f'{func.__name__}:{outputs}'
+            return register(metrics.instrument(func, name))
+        return decorator
+
+    @app.server.after_request
+    def record_response_size(response):
+        name = flask.g.pop('raca_callback', None)
+        if name is not None and response.status_code == 200:
+            metrics.observe_size(name, response.content_length)
+        return response
+
+    @app.server.route('/metrics')
+    def serve_metrics():
+        return flask.Response(metrics_text(metrics),
+                              mimetype='text/plain; version=0.0.4')
+
+    return callback
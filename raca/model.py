@@ -0,0 +1,129 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from raca.schema import ACTION_COLUMNS, CONTROL_COLUMNS, RISK_COLUMNS
+from raca.views import read_only
+
+# ------------------------------------------------------------------------------
+# Normalised risks, controls and actions
+#
+# The sheet is one flat table with a row per action, under its control, under
+# its risk. RacaModel splits it into a table per level, one row per risk_id,
+# control_id and action_id with just that level's columns (see
+# raca/schema.py), indexed on the key so looking one up is a hash probe
+# rather than a scan. Each takes its columns from the first row the key
+# appears on, as the Risk Table always has. The key is kept as a column too,
+# for the tables and charts built from them.
+#
+# links keeps the sheet's structure: for every row of the sheet, the position
+# of its risk, control and action in their tables (-1 for none). The same
+# control can sit under several risks and the same action under several
+# controls, so which controls a risk has (and which actions a control has)
+# comes from links.
+#
+# The flat frame stays as it is. All RACA Data shows the sheet as typed, and
+# the sheet doesn't always agree with itself (a risk scored differently on two
+# of its rows, say), so it can't be put back together from the tables. The
+# model only replaces the per-level views: the risks table is what the Risk
+# Table, the Overview line chart and SQLite's risks table are built from, and
+# it is the only part built up front. The controls and actions tables, links
+# and the key lookups are built the first time something asks for them, so
+# the model costs no more than the Risk Table needs until then.
+# ------------------------------------------------------------------------------
+def _level(df, key, columns):
+    # Pick the rows before copying any columns, so only one row per key is
+    # ever copied
+    first = df[key].notna().to_numpy() & ~df[key].duplicated().to_numpy()
+    table = (df.iloc[np.flatnonzero(first)]
+             [[c for c in columns if c in df.columns]]
+             .reset_index(drop=True))
+    table.index = pd.Index(table[key].to_numpy(dtype=object))
+    return read_only(table)
+
+
+def _positions(table, keys):
+    return table.index.get_indexer(keys.to_numpy(dtype=object)).astype(
+        np.int32)
+
+
+class RacaModel:
+
+    def __init__(self, df):
+        self.risks = _level(df, 'risk_id', RISK_COLUMNS)
+        self._df = df
+        self._built = {}
+        # Reentrant, links is built from the other tables
+        self._lock = threading.RLock()
+        self._children = {}
+
+    def _build(self, name, build):
+        with self._lock:
+            if name not in self._built:
+                self._built[name] = build()
+            return self._built[name]
+
+    @property
+    def controls(self):
+        return self._build('controls', lambda: _level(
+            self._df, 'control_id', CONTROL_COLUMNS))
+
+    @property
+    def actions(self):
+        return self._build('actions', lambda: _level(
+            self._df, 'action_id', ACTION_COLUMNS))
+
+    @property
+    def links(self):
+        return self._build('links', lambda: read_only(pd.DataFrame({
+            'risk': _positions(self.risks, self._df['risk_id']),
+            'control': _positions(self.controls, self._df['control_id']),
+            'action': _positions(self.actions, self._df['action_id']),
+        })))
+
+    def risk(self, risk_id):
+        return self.risks.loc[risk_id]
+
+    def control(self, control_id):
+        return self.controls.loc[control_id]
+
+    def action(self, action_id):
+        return self.actions.loc[action_id]
+
+    # --------------------------------------------------------------------------
+    # Child positions for each parent position, e.g. the controls of every
+    # risk, worked out from links the first time they are asked for
+    # --------------------------------------------------------------------------
+    def _children_of(self, parent, child):
+        children = self._children.get((parent, child))
+        if children is None:
+            pairs = self.links[[parent, child]]
+            pairs = pairs[(pairs[parent] >= 0) &
+                          (pairs[child] >= 0)].drop_duplicates()
+            child_positions = pairs[child].to_numpy()
+            children = {position: child_positions[rows] for position, rows in
+                        pd.Series(child_positions).groupby(
+                            pairs[parent].to_numpy()).indices.items()}
+            self._children[(parent, child)] = children
+        return children
+
+    def controls_for(self, risk_id):
+        positions = self._children_of('risk', 'control').get(
+            self.risks.index.get_loc(risk_id), [])
+        return self.controls.iloc[positions]
+
+    def actions_for(self, control_id):
+        positions = self._children_of('control', 'action').get(
+            self.controls.index.get_loc(control_id), [])
+        return self.actions.iloc[positions]
+
+    # Only what has been built so far
+    def nbytes(self):
+        tables = dict(self._built, risks=self.risks)
+        return {name: int(table.memory_usage(index=True, deep=True).sum())
+                for name, table in tables.items()}
+
+
+def get_model(dataset):
+    return dataset.derived('model', RacaModel)
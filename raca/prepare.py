@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+from raca.compact import small_int
+from raca.schema import COLUMN_MAP, UNMAPPED, load_business_units
+
+# ------------------------------------------------------------------------------
+# Risk IDs look like 'AP-P01-R01': business unit prefix, process number and
+# risk number. The process and risk parts are optional so an ID that only has
+# a prefix (e.g. 'GMBH') still gets its business unit.
+# ------------------------------------------------------------------------------
+RISK_ID_PATTERN = (r'^\s*(?P<bu_prefix>[A-Za-z]+)'
+                   r'(?:-P(?P<process_no>\d+))?'
+                   r'(?:-R(?P<risk_no>\d+))?')
+
+
+# ------------------------------------------------------------------------------
+# Split risk_id into bu_prefix, process_no and risk_no columns plus the
+# business_unit name from the registry.
+#
+# A sheet has far fewer distinct risk IDs than rows (each risk repeats on every
+# control and action row), so we parse each distinct ID once and then spread
+# the results back over the rows with a single take.
+# ------------------------------------------------------------------------------
+def parse_risk_ids(risk_ids, business_units=None):
+    if business_units is None:
+        business_units = load_business_units()
+
+    codes, uniques = pd.factorize(risk_ids)
+    parts = pd.Series(uniques, dtype=object).astype(str).str.extract(
+        RISK_ID_PATTERN)
+    parts['bu_prefix'] = parts['bu_prefix'].str.upper()
+    parts['business_unit'] = (parts['bu_prefix'].map(business_units)
+                              .fillna(UNMAPPED))
+
+    # factorize gives missing IDs the code -1, which picks up the extra
+    # 'nothing' value we add to the end of each column here
+    result = {}
+    for column in ('bu_prefix', 'business_unit'):
+        missing = UNMAPPED if column == 'business_unit' else np.nan
+        values = np.append(parts[column].to_numpy(dtype=object), missing)
+        result[column] = values[codes]
+    for column in ('process_no', 'risk_no'):
+        values = np.append(parts[column].to_numpy(float), np.nan)
+        # As narrow an int as the numbers in this sheet allow
+        result[column] = small_int(pd.Series(values[codes])).array
+
+    return pd.DataFrame(result, index=risk_ids.index,
+                        columns=['bu_prefix', 'process_no', 'risk_no',
+                                 'business_unit'])
+
+
+# ------------------------------------------------------------------------------
+# Prepare a raw RACA frame for the app
+# 1 Rename our column headers
+# 2 calculate our gross and net risk scores by multiplying the impact and
+#   likelihood columns
+# 3 split the risk_id into business unit, process and risk number columns
+# ------------------------------------------------------------------------------
+def prepare_raca(raca_df, business_units=None):
+    raca_df = raca_df.rename(columns=COLUMN_MAP)
+
+    raca_df['gross_risk'] = pd.to_numeric(raca_df['gross_impact'] *
+                                          raca_df['gross_likelihood'])
+    raca_df['net_risk'] = pd.to_numeric(raca_df['net_impact'] *
+                                        raca_df['net_likelihood'])
+
+    risk_id_parts = parse_risk_ids(raca_df['risk_id'], business_units)
+    for column in risk_id_parts.columns:
+        raca_df[column] = risk_id_parts[column]
+
+    return raca_df
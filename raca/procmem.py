@@ -0,0 +1,142 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import pandas as pd
+
+# ------------------------------------------------------------------------------
+# Memory of the web worker processes
+#
+# RSS counts every page a process can see, including the ones it shares with
+# the gunicorn master and the other workers (pages inherited through a fork
+# and not written since, and the categorical codes, which stay in the
+# memory-mapped columnar cache), so adding up the workers' RSS counts the
+# shared pages once per worker. What a worker really costs is its USS, the
+# pages only it has; PSS splits each shared page between the processes
+# sharing it, so the PSS of the master and workers adds up to what they use
+# between them.
+#
+# Read from /proc/<pid>/smaps_rollup, so Linux only.
+# ------------------------------------------------------------------------------
+def process_memory(pid='self'):
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+
+    kb = {}
+    for line in lines:
+        key, _, value = line.partition(':')
+        parts = value.split()
+        if len(parts) == 2 and parts[1] == 'kB':
+            kb[key] = int(parts[0]) * 1024
+    return {
+        'rss': kb.get('Rss', 0),
+        'pss': kb.get('Pss', 0),
+        'uss': kb.get('Private_Clean', 0) + kb.get('Private_Dirty', 0),
+        'shared': kb.get('Shared_Clean', 0) + kb.get('Shared_Dirty', 0),
+    }
+
+
+def child_pids(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def memory_table(master):
+    rows = [{'process': 'master', 'pid': master,
+             **(process_memory(master) or {})}]
+    rows += [{'process': 'worker', 'pid': pid, **(process_memory(pid) or {})}
+             for pid in child_pids(master)]
+    table = pd.DataFrame(rows).set_index('pid')
+    for column in ('rss', 'pss', 'uss', 'shared'):
+        table[column] = (table[column] / 2**20).round(1)
+    return table.rename(columns=lambda column: f'{column}_mb'
+                        if column != 'process' else column)
+
+
+# ------------------------------------------------------------------------------
+# Start gunicorn with the repo's gunicorn.conf.py, wait for its workers to
+# load the data, send them some requests and return the memory of the master
+# and each worker. preload picks RACA_PRELOAD for the run.
+# ------------------------------------------------------------------------------
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _get(url, timeout=120):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.read()
+
+
+def _settle(master, workers, seconds=2, timeout=300):
+    # Until every worker is up and none of them has grown for a while
+    deadline = time.monotonic() + timeout
+    last = None
+    steady = 0
+    while time.monotonic() < deadline:
+        pids = child_pids(master)
+        rss = [(process_memory(pid) or {}).get('rss') for pid in pids]
+        current = (tuple(pids), tuple(rss))
+        if len(pids) == workers and current == last:
+            steady += 1
+            if steady >= seconds * 2:
+                return
+        else:
+            steady = 0
+        last = current
+        time.sleep(0.5)
+    raise TimeoutError('gunicorn workers did not settle')
+
+
+def measure_workers(workers=4, preload=True, requests=50, config=None,
+                    app='clensed:server', env=None):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    port = _free_port()
+    env = {**os.environ, **(env or {}),
+           'RACA_PRELOAD': '1' if preload else '0'}
+    command = [sys.executable, '-m', 'gunicorn',
+               '--config', config or os.path.join(root, 'gunicorn.conf.py'),
+               '--bind', f'127.0.0.1:{port}', '--workers', str(workers), app]
+    server = subprocess.Popen(command, cwd=root, env=env,
+                              stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    try:
+        base = f'http://127.0.0.1:{port}'
+        deadline = time.monotonic() + 300
+        while True:
+            try:
+                _get(f'{base}/_raca/datasets', timeout=5)
+                break
+            except OSError:
+                if server.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError('gunicorn did not start')
+                time.sleep(0.5)
+
+        # Enough requests at once that every worker serves some
+        paths = ['/_dash-layout', '/_raca/data.csv?table=allraca']
+        per_thread = max(1, requests // (workers * 2))
+        threads = [threading.Thread(target=lambda: [
+                       _get(base + paths[i % len(paths)])
+                       for i in range(per_thread)])
+                   for _ in range(workers * 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        _settle(server.pid, workers)
+        return memory_table(server.pid)
+    finally:
+        server.terminate()
+        server.wait(30)
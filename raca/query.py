@@ -0,0 +1,276 @@
+import math
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# ------------------------------------------------------------------------------
+# Server side paging, sorting and filtering for the DataTables
+#
+# The tables run with page_action/sort_action/filter_action='custom', so the
+# browser only ever gets the page it is showing. The DataTable filter_query
+# (e.g. '{risk_id} contains "AP" && {gross_risk} > 11') is parsed here and
+# evaluated as vectorized pandas masks; sort orders and filtered row positions
+# are cached per dataset version so paging through a table is just a slice.
+# ------------------------------------------------------------------------------
+PAGE_SIZE = 50
+
+# How many sort orders to keep per dataset version and table
+SORT_CACHE_SIZE = 8
+
+# And how many filtered views
+FILTER_CACHE_SIZE = 8
+
+_OPERATORS = {'=': 'eq', 'eq': 'eq',
+              '!=': 'ne', 'ne': 'ne',
+              '<': 'lt', 'lt': 'lt',
+              '<=': 'le', 'le': 'le',
+              '>': 'gt', 'gt': 'gt',
+              '>=': 'ge', 'ge': 'ge',
+              'contains': 'contains',
+              'datestartswith': 'datestartswith',
+              'is blank': 'blank', 'is nil': 'blank',
+              'is not blank': 'not blank', 'is not nil': 'not blank'}
+
+# {column} [s|i]operator value - the optional s/i is DataTable's case
+# sensitive/insensitive flag
+_FILTER_PART = re.compile(
+    r'^\s*\{(?P<column>(?:[^}\\]|\\.)+)\}\s*'
+    r'(?P<case>[si]?)(?P<op>is not blank|is not nil|is blank|is nil|'
+    r'datestartswith|contains|>=|<=|!=|=|<|>|eq|ne|lt|le|gt|ge)'
+    r'(?:\s+(?P<value>.*?))?\s*$')
+
+
+def _parse_value(value):
+    if value is None:
+        return None
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'`':
+        return re.sub(r'\\(.)', r'\1', value[1:-1])
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+# ------------------------------------------------------------------------------
+# Split a filter_query at the ' && ' between its terms, but not at one inside
+# a {column} or a quoted value. A quote or brace only opens after a space, so
+# an unquoted value like O'Brien is left alone.
+# ------------------------------------------------------------------------------
+_CLOSE = {'"': '"', "'": "'", '`': '`', '{': '}'}
+
+
+def _split_terms(filter_query):
+    terms = []
+    start = 0
+    close = None
+    i = 0
+    while i < len(filter_query):
+        char = filter_query[i]
+        if char == '\\':
+            i += 2
+            continue
+        if close:
+            if char == close:
+                close = None
+        elif char in _CLOSE and (i == start or filter_query[i - 1].isspace()):
+            close = _CLOSE[char]
+        elif filter_query.startswith(' && ', i):
+            terms.append(filter_query[start:i])
+            i += 4
+            start = i
+            continue
+        i += 1
+    terms.append(filter_query[start:])
+    return terms
+
+
+# ------------------------------------------------------------------------------
+# Turn a filter_query into a list of (column, operator, value, case_sensitive)
+# ------------------------------------------------------------------------------
+def parse_filter_query(filter_query):
+    filters = []
+    for part in _split_terms(filter_query or ''):
+        if not part.strip():
+            continue
+        match = _FILTER_PART.match(part)
+        if match is None:
+            raise ValueError(f'Unsupported filter: {part}')
+        column = re.sub(r'\\(.)', r'\1', match.group('column'))
+        filters.append((column, _OPERATORS[match.group('op')],
+                        _parse_value(match.group('value')),
+                        match.group('case') != 'i'))
+    return filters
+
+
+# ------------------------------------------------------------------------------
+# Apply a test to the text of a column. For categoricals we only test each
+# category once and then look the answer up by code.
+# ------------------------------------------------------------------------------
+def _text_mask(series, test):
+    if series.dtype.name == 'category':
+        categories = pd.Series(series.cat.categories.astype(str))
+        hits = np.append(test(categories).to_numpy(dtype=bool), False)
+        return hits[series.cat.codes.to_numpy()]
+
+    present = series.notna().to_numpy()
+    mask = np.zeros(len(series), dtype=bool)
+    mask[present] = test(series[present].astype(str)).to_numpy(dtype=bool)
+    return mask
+
+
+def _compare(series, operator, value):
+    numeric = pd.api.types.is_numeric_dtype(series.dtype)
+
+    if numeric and isinstance(value, float):
+        values = series.astype('float64')
+    elif numeric:
+        # Text against a number column never matches
+        return np.zeros(len(series), dtype=bool)
+    else:
+        value = value if isinstance(value, str) else f'{value:g}'
+        return _text_mask(series, lambda text: _COMPARE[operator](text, value))
+
+    return _COMPARE[operator](values, value).fillna(False).to_numpy(bool)
+
+
+_COMPARE = {'eq': lambda s, v: s == v,
+            'ne': lambda s, v: s != v,
+            'lt': lambda s, v: s < v,
+            'le': lambda s, v: s <= v,
+            'gt': lambda s, v: s > v,
+            'ge': lambda s, v: s >= v}
+
+
+def filter_mask(df, filter_query):
+    mask = None
+    for column, operator, value, case in parse_filter_query(filter_query):
+        if column not in df.columns:
+            raise ValueError(f'Unknown column in filter: {column}')
+        series = df[column]
+
+        if operator == 'blank' or operator == 'not blank':
+            blank = series.isna().to_numpy()
+            if not pd.api.types.is_numeric_dtype(series.dtype):
+                blank |= _text_mask(series, lambda text: text.str.strip()
+                                    == '')
+            part = blank if operator == 'blank' else ~blank
+        elif operator == 'contains' or operator == 'datestartswith':
+            text = '' if value is None else (
+                value if isinstance(value, str) else f'{value:g}')
+            if not case:
+                text = text.lower()
+
+            def test(strings, text=text, operator=operator, case=case):
+                strings = strings if case else strings.str.lower()
+                if operator == 'contains':
+                    return strings.str.contains(text, regex=False)
+                return strings.str.startswith(text)
+            part = _text_mask(series, test)
+        else:
+            if value is None:
+                raise ValueError(f'Filter on {column} needs a value')
+            if (not case and isinstance(value, str) and
+                    not pd.api.types.is_numeric_dtype(series.dtype)):
+                lowered = value.lower()
+                part = _text_mask(series, lambda text, op=operator:
+                                  _COMPARE[op](text.str.lower(), lowered))
+            else:
+                part = _compare(series, operator, value)
+
+        mask = part if mask is None else mask & part
+    return mask
+
+
+# ------------------------------------------------------------------------------
+# The last few values built for one table view of a dataset version, kept in
+# an OrderedDict under (name, view) so they go with the version
+# ------------------------------------------------------------------------------
+_sort_lock = threading.Lock()
+
+
+def _recent(dataset, name, view, key, build, size):
+    values = dataset.derived((name, view), lambda _: OrderedDict())
+
+    with _sort_lock:
+        if key in values:
+            values.move_to_end(key)
+            return values[key]
+
+    value = build()
+
+    with _sort_lock:
+        values[key] = value
+        while len(values) > size:
+            values.popitem(last=False)
+    return value
+
+
+# ------------------------------------------------------------------------------
+# Row positions of df in sort_by order, cached per dataset version
+# ------------------------------------------------------------------------------
+def _sort_order(dataset, view, df, sort_by):
+    key = tuple((s['column_id'], s['direction']) for s in sort_by)
+
+    def build():
+        columns = [column for column, _ in key]
+        for column in columns:
+            if column not in df.columns:
+                raise ValueError(f'Unknown column in sort: {column}')
+        ascending = [direction == 'asc' for _, direction in key]
+        return (df[columns].reset_index(drop=True)
+                .sort_values(columns, ascending=ascending, kind='mergesort',
+                             na_position='last')
+                .index.to_numpy(dtype=np.int64))
+    return _recent(dataset, 'sort_orders', view, key, build, SORT_CACHE_SIZE)
+
+
+# ------------------------------------------------------------------------------
+# Row positions of a filtered and sorted table view, or None for all of df in
+# its own order
+#
+# view names the frame for the caches, e.g. 'risks' for the Risk Table. A
+# filtered view's positions are cached per dataset version like the sort
+# orders, so paging through it is a slice rather than filtering again.
+# ------------------------------------------------------------------------------
+def table_positions(dataset, view, df, sort_by=None, filter_query=None):
+    if not filter_query:
+        return _sort_order(dataset, view, df, sort_by) if sort_by else None
+
+    def build():
+        mask = filter_mask(df, filter_query)
+        order = _sort_order(dataset, view, df, sort_by) if sort_by else None
+        if mask is None:
+            return order
+        positions = (order[mask[order]] if order is not None
+                     else np.flatnonzero(mask))
+        positions.flags.writeable = False
+        return positions
+
+    key = (filter_query, tuple((s['column_id'], s['direction'])
+                               for s in sort_by or []))
+    return _recent(dataset, 'positions', view, key, build,
+                   FILTER_CACHE_SIZE)
+
+
+# ------------------------------------------------------------------------------
+# One page of a table view. Returns (page rows, page_count).
+# ------------------------------------------------------------------------------
+def table_page(dataset, view, df, page_current=0, page_size=PAGE_SIZE,
+               sort_by=None, filter_query=None):
+    page_current = page_current or 0
+    page_size = page_size or PAGE_SIZE
+
+    positions = table_positions(dataset, view, df, sort_by, filter_query)
+
+    total = len(df) if positions is None else len(positions)
+    start = page_current * page_size
+    if positions is None:
+        rows = df.iloc[start:start + page_size]
+    else:
+        rows = df.iloc[positions[start:start + page_size]]
+
+    return rows, max(1, math.ceil(total / page_size))
@@ -0,0 +1,194 @@
+import glob
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from raca.dataset import APP_DATA, DatasetStore, load_raca
+from raca.delta import carry_forward
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------------------
+# Which RACA registers this process serves
+#
+# RACA_DATASETS is either a JSON file of {"name": "path/to/workbook.xlsx"}
+# (relative paths are from the JSON file) or a directory, where every
+# workbook and CSV export in it is a dataset named after its file. Without it
+# we serve RACA_DATA alone, named after its file.
+#
+# RACA_DEFAULT_DATASET is the one a page gets when it doesn't ask for one,
+# otherwise the first listed.
+#
+# RACA_MEMORY_MB is how much memory the loaded frames may take between them.
+# Past that the least recently used datasets are dropped until they fit again,
+# and read back in (from the columnar cache) when they are next asked for.
+# 0 means no limit.
+# ------------------------------------------------------------------------------
+DATASET_EXTENSIONS = ('.xlsx', '.xlsm', '.csv')
+
+MEMORY_MB = float(os.environ.get('RACA_MEMORY_MB', '1024'))
+
+
+def _name(path):
+    # A glob of workbooks is named after its directory
+    if glob.has_magic(path):
+        path = os.path.dirname(path)
+    return os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+
+
+def dataset_sources(config=None):
+    config = config or os.environ.get('RACA_DATASETS')
+    if not config:
+        return {_name(APP_DATA): APP_DATA}
+
+    if os.path.isdir(config):
+        return {_name(entry.name): entry.path
+                for entry in sorted(os.scandir(config),
+                                    key=lambda entry: entry.name)
+                if entry.name.lower().endswith(DATASET_EXTENSIONS) and
+                # Excel's lock file for a workbook that is open
+                not entry.name.startswith('~$')}
+
+    with open(config) as f:
+        sources = json.load(f)
+    base = os.path.dirname(os.path.abspath(config))
+    return {name: os.path.join(base, path) for name, path in sources.items()}
+
+
+def frame_bytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+# ------------------------------------------------------------------------------
+# A DatasetStore per named source, loaded lazily and kept under a memory
+# budget
+#
+# Each store works exactly as it does on its own (versions, listeners,
+# reloads); the registry only decides which of them keep a Dataset in memory.
+# The dataset being asked for is never the one dropped, even if it is bigger
+# than the budget by itself.
+# ------------------------------------------------------------------------------
+class DatasetRegistry:
+
+    def __init__(self, sources, default=None, memory_mb=MEMORY_MB,
+                 loader=load_raca):
+        if not sources:
+            raise ValueError('No RACA datasets configured')
+        self._stores = OrderedDict(
+            (name, DatasetStore(path, loader, name=name))
+            for name, path in sources.items())
+        self.default = default or next(iter(self._stores))
+        if self.default not in self._stores:
+            raise ValueError(f'Unknown default dataset: {self.default}')
+        self.budget = int(memory_mb * 1024 * 1024)
+
+        # Bytes held by each loaded dataset, least recently used first
+        self._used = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+        for store in self._stores.values():
+            store.subscribe(self._measure)
+
+    @classmethod
+    def from_env(cls):
+        return cls(dataset_sources(),
+                   default=os.environ.get('RACA_DEFAULT_DATASET') or None)
+
+    def names(self):
+        return list(self._stores)
+
+    def stores(self):
+        return list(self._stores.values())
+
+    def store(self, name=None):
+        try:
+            return self._stores[name or self.default]
+        except KeyError:
+            raise KeyError(f'Unknown RACA dataset: {name}') from None
+
+    def subscribe(self, listener):
+        for store in self._stores.values():
+            store.subscribe(listener)
+
+    def _measure(self, old, new):
+        size = frame_bytes(new.df)
+        with self._lock:
+            self._used[new.name] = size
+            self._used.move_to_end(new.name)
+
+    def get(self, name=None):
+        store = self.store(name)
+        dataset = store.get()
+        with self._lock:
+            if store.name in self._used:
+                self._used.move_to_end(store.name)
+        self._evict(keep=store.name)
+        return dataset
+
+    def _evict(self, keep):
+        if self.budget <= 0:
+            return
+        while True:
+            with self._lock:
+                if sum(self._used.values()) <= self.budget:
+                    return
+                victim = next((name for name in self._used if name != keep),
+                              None)
+                if victim is None:
+                    logger.warning('Dataset %s alone is over the %.1fMB '
+                                   'budget', keep, self.budget / 2 ** 20)
+                    return
+                size = self._used.pop(victim)
+                self.evictions += 1
+
+            self._stores[victim].unload()
+            logger.info('Dropped dataset %s (%.1fMB) to stay under %.1fMB',
+                        victim, size / 2 ** 20, self.budget / 2 ** 20)
+
+    def stats(self):
+        with self._lock:
+            used = dict(self._used)
+        return {
+            'default': self.default,
+            'budget_bytes': self.budget,
+            'used_bytes': sum(used.values()),
+            'evictions': self.evictions,
+            'datasets': {name: {'source': store.source,
+                                'version': store.version,
+                                'loaded': store.loaded,
+                                'bytes': used.get(name, 0)}
+                         for name, store in self._stores.items()},
+        }
+
+
+# ------------------------------------------------------------------------------
+# The process wide registry. Nothing is read at import time; the first caller
+# for each dataset (or preload()) pays for the read and everyone after that
+# shares the same Dataset until a new version is published.
+#
+# store is the default dataset's store.
+# ------------------------------------------------------------------------------
+registry = DatasetRegistry.from_env()
+registry.subscribe(carry_forward)
+
+store = registry.store()
+
+
+def get_dataset(name=None):
+    return registry.get(name)
+
+
+def get_raca_df(name=None):
+    return registry.get(name).df
+
+
+# ------------------------------------------------------------------------------
+# Load the default dataset up front, e.g. in the gunicorn master with
+# --preload so the workers inherit it instead of each reading the workbook on
+# the first request
+# ------------------------------------------------------------------------------
+def preload():
+    return registry.get()
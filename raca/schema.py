@@ -0,0 +1,131 @@
+import json
+import os
+
+# ------------------------------------------------------------------------------
+# RACA source schema
+#
+# The column map used to rename the headers of the RACA workbook into the
+# snake_case names used throughout the app.
+# ------------------------------------------------------------------------------
+COLUMN_MAP = {'Process (Title)': 'process_title',
+              'Process description': 'process_description',
+              'Risk ID': 'risk_id',
+              'Risk Owner': 'risk_owner',
+              'Risk(Title)': 'risk_title',
+              'Risk Description': 'risk_description',
+              'Risk Category 1': 'risk_types',
+              'Risk Category 2': 'risk',
+              'Risk Category 3': 'level3',
+              'Associated KRIs': 'associated_kris',
+              'I': 'gross_impact',
+              'L': 'gross_likelihood',
+              'Control ID': 'control_id',
+              'Control Owner': 'control_owner',
+              'Control (Title)': 'control_title',
+              'Control Description': 'control_description',
+              'Control Activity': 'control_activity',
+              'Control Type': 'control_type',
+              'Control Frequency': 'control_frequency',
+              'DE & OE?': 'de_oe',
+              'Commentary on DE & OE assessment': 'de_oe_commentary',
+              'I.1': 'net_impact',
+              'L.1': 'net_likelihood',
+              'Commentary on Net Risk Assessment':
+                  'net_risk_assesment_commentary',
+              'Risk Decision': 'risk_decision',
+              'Issue Description (if applicable)':
+                  'issue_description',
+              'Action Description': 'action_description',
+              'Action Owner': 'action_owner',
+              'Action Due Date': 'action_due_date',
+              'Completion Date': 'completion_date',
+              'Action ID': 'action_id'
+              }
+
+# ------------------------------------------------------------------------------
+# Which level of the register each prepared column describes. The sheet
+# repeats a risk's columns on every one of its control rows, and a control's
+# on every one of its action rows. See raca/model.py.
+# ------------------------------------------------------------------------------
+RISK_COLUMNS = ['risk_id', 'process_title', 'process_description',
+                'risk_owner', 'risk_title', 'risk_description', 'risk_types',
+                'risk', 'level3', 'associated_kris', 'gross_impact',
+                'gross_likelihood', 'net_impact', 'net_likelihood',
+                'net_risk_assesment_commentary', 'risk_decision',
+                'issue_description', 'gross_risk', 'net_risk', 'bu_prefix',
+                'process_no', 'risk_no', 'business_unit']
+
+CONTROL_COLUMNS = ['control_id', 'control_owner', 'control_title',
+                   'control_description', 'control_activity', 'control_type',
+                   'control_frequency', 'de_oe', 'de_oe_commentary']
+
+ACTION_COLUMNS = ['action_id', 'action_description', 'action_owner',
+                  'action_due_date', 'completion_date']
+
+# ------------------------------------------------------------------------------
+# The dtype every source column is read into, keyed on the source header.
+# Impact/likelihood scores are numbers, everything else (dates included) is
+# kept as text exactly as it appears in the sheet.
+# ------------------------------------------------------------------------------
+TEXT = 'object'
+SCORE = 'float64'
+
+SOURCE_DTYPES = {'Process (Title)': TEXT,
+                 'Process description': TEXT,
+                 'Risk ID': TEXT,
+                 'Risk Owner': TEXT,
+                 'Risk(Title)': TEXT,
+                 'Risk Description': TEXT,
+                 'Risk Category 1': TEXT,
+                 'Risk Category 2': TEXT,
+                 'Risk Category 3': TEXT,
+                 'Associated KRIs': TEXT,
+                 'I': SCORE,
+                 'L': SCORE,
+                 'Control ID': TEXT,
+                 'Control Owner': TEXT,
+                 'Control (Title)': TEXT,
+                 'Control Description': TEXT,
+                 'Control Activity': TEXT,
+                 'Control Type': TEXT,
+                 'Control Frequency': TEXT,
+                 'DE & OE?': TEXT,
+                 'Commentary on DE & OE assessment': TEXT,
+                 'I.1': SCORE,
+                 'L.1': SCORE,
+                 'Commentary on Net Risk Assessment': TEXT,
+                 'Risk Decision': TEXT,
+                 'Issue Description (if applicable)': TEXT,
+                 'Action Description': TEXT,
+                 'Action Owner': TEXT,
+                 'Action Due Date': TEXT,
+                 'Completion Date': TEXT,
+                 'Action ID': TEXT
+                 }
+
+# ------------------------------------------------------------------------------
+# Business units, keyed on the alpha prefix of the risk_id
+# E.g 'AP-P01-R01' belongs to 'AP', Accounts Payable.
+#
+# Point RACA_BUSINESS_UNITS at a JSON file of {"PREFIX": "Name"} to add units
+# or rename them without touching the code. Risks whose prefix isn't listed
+# are reported under UNMAPPED.
+# ------------------------------------------------------------------------------
+BUSINESS_UNITS = {'AP': 'Accounts Payable',
+                  'BP': 'British Petroleum',
+                  'CP': 'Client Profile',
+                  'DP': 'Data Privacy',
+                  }
+
+UNMAPPED = 'Unmapped'
+
+
+def load_business_units(path=None):
+    units = dict(BUSINESS_UNITS)
+
+    path = path or os.environ.get('RACA_BUSINESS_UNITS')
+    if path:
+        with open(path) as f:
+            units.update({prefix.upper(): name
+                          for prefix, name in json.load(f).items()})
+    return units
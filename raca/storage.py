@@ -0,0 +1,463 @@
+import glob
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from raca.aging import (BUCKETS, action_dates, aging_report, bucket_edges,
+                        report_frame)
+from raca.cache import cache_path
+from raca.delta import get_row_hashes, get_unit_totals
+from raca.model import get_model
+from raca.query import (PAGE_SIZE, parse_filter_query, table_page,
+                        table_positions)
+from raca.taxonomy import LEVELS, build_taxonomy, get_taxonomy
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------------------
+# Where the callbacks' queries run
+#
+# RACA_STORAGE=memory (the default) answers table pages, dropdown options and
+# the Overview and aging aggregates from the dataset's frames. With
+# RACA_STORAGE=sqlite they are parameterised SQL against a SQLite copy of the
+# dataset, indexed on risk_id, business_unit, the three risk categories and
+# the action due dates. Both engines give the same answers; pick with
+# get_engine(dataset).
+#
+# The SQLite file is named after the source and a fingerprint of the data, so
+# every worker serving the same version shares one file, and whichever gets
+# there first builds it. Only the newest few files per source are kept.
+# ------------------------------------------------------------------------------
+STORAGE = os.environ.get('RACA_STORAGE', 'memory')
+
+# Bump this whenever what goes into the SQLite file changes
+STORAGE_VERSION = 2
+
+SQLITE_KEEP = 3
+
+# The frame behind each table view, see table_page()
+VIEWS = {
+    'all': lambda dataset: dataset.df,
+    'risks': lambda dataset: get_model(dataset).risks,
+}
+
+INDEXES = {
+    'raca': ['risk_id', 'business_unit', 'risk_types', 'risk', 'level3',
+             'gross_risk', 'net_risk'],
+    'risks': ['risk_id', 'business_unit', 'risk_types', 'risk', 'level3',
+              'gross_risk', 'net_risk'],
+    'action_dates': ['business_unit', 'due'],
+}
+
+# The tables behind the DataTables, whose indexes are also kept descending so
+# a page sorted either way (nulls last, then by row) is read off an index
+SORTED_TABLES = ['raca', 'risks']
+
+# How due dates are kept in SQLite, so that text order is date order
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Rows at a time from rows(), e.g. for exports
+CHUNK_ROWS = 10000
+
+# How many filtered views' row counts each SQLite engine keeps
+COUNT_CACHE_SIZE = 64
+
+
+# ------------------------------------------------------------------------------
+# The in-memory engine: the pandas code the app has always used
+# ------------------------------------------------------------------------------
+class FrameEngine:
+
+    name = 'memory'
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def page(self, view, columns, page_current=0, page_size=None,
+             sort_by=None, filter_query=None):
+        df = VIEWS[view](self.dataset)
+        rows, page_count = table_page(self.dataset, view, df, page_current,
+                                      page_size, sort_by, filter_query)
+        return rows[[c for c in columns if c in rows.columns]], page_count
+
+    def frame(self, view, columns):
+        return VIEWS[view](self.dataset)[columns]
+
+    # Every row of a filtered and sorted view as (row count, chunks)
+    def rows(self, view, columns, sort_by=None, filter_query=None,
+             chunk_size=CHUNK_ROWS):
+        df = VIEWS[view](self.dataset)
+        positions = table_positions(self.dataset, view, df, sort_by,
+                                    filter_query)
+        if positions is None:
+            positions = np.arange(len(df))
+        # Cut each chunk down to the columns, not the whole frame
+        columns = df.columns.get_indexer(
+            [c for c in columns if c in df.columns])
+
+        def chunks():
+            for start in range(0, len(positions), chunk_size):
+                yield df.iloc[positions[start:start + chunk_size], columns]
+        return len(positions), chunks()
+
+    def options(self, column):
+        values = self.dataset.df[column].dropna().astype(str).unique()
+        return sorted(values)
+
+    def taxonomy(self):
+        return get_taxonomy(self.dataset)
+
+    def unit_totals(self):
+        return get_unit_totals(self.dataset)
+
+    def aging_report(self, date=None):
+        return aging_report(action_dates(self.dataset), date)
+
+
+# ------------------------------------------------------------------------------
+# Writing the SQLite file
+# ------------------------------------------------------------------------------
+def _quote(column):
+    return '"%s"' % column.replace('"', '""')
+
+
+def _sql_type(series):
+    if (pd.api.types.is_bool_dtype(series.dtype) or
+            pd.api.types.is_integer_dtype(series.dtype)):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(series.dtype):
+        return 'REAL'
+    return 'TEXT'
+
+
+def _sql_values(series, sql_type):
+    if sql_type != 'TEXT':
+        # SQLite stores NaN as NULL and whole floats in an INTEGER column as
+        # integers
+        return series.astype('float64').tolist()
+    values = series.astype(object).to_numpy()
+    missing = pd.isna(values)
+    values = np.array([value if isinstance(value, str) else str(value)
+                       for value in values], dtype=object)
+    values[missing] = None
+    return values.tolist()
+
+
+def _write_table(conn, name, df):
+    df = df.reset_index(drop=True)
+    types = [_sql_type(df[column]) for column in df.columns]
+    conn.execute('CREATE TABLE %s (row_no INTEGER PRIMARY KEY, %s)' % (
+        name, ', '.join(f'{_quote(column)} {sql_type}'
+                        for column, sql_type in zip(df.columns, types))))
+
+    columns = [range(len(df))] + [_sql_values(df[column], sql_type)
+                                  for column, sql_type in zip(df.columns,
+                                                              types)]
+    conn.executemany('INSERT INTO %s VALUES (%s)' % (
+        name, ', '.join('?' * len(columns))), zip(*columns))
+
+    for column in INDEXES.get(name, []):
+        if column in df.columns:
+            conn.execute('CREATE INDEX %s ON %s (%s)' % (
+                _quote(f'{name}_{column}'), name, _quote(column)))
+            if name in SORTED_TABLES:
+                conn.execute('CREATE INDEX %s ON %s (%s DESC)' % (
+                    _quote(f'{name}_{column}_desc'), name, _quote(column)))
+
+
+def _due_text(actions):
+    due = pd.Series(actions['due'])
+    return due.dt.strftime(DATE_FORMAT).where(due.notna(), None)
+
+
+def fingerprint(dataset):
+    digest = hashlib.sha1(str(STORAGE_VERSION).encode())
+    digest.update(repr(list(dataset.df.columns)).encode())
+    digest.update(get_row_hashes(dataset).values.tobytes())
+    return digest.hexdigest()[:16]
+
+
+def sqlite_path(source, fingerprint):
+    base = os.path.splitext(cache_path(source))[0]
+    return f'{base}-{fingerprint}.sqlite'
+
+
+def write_sqlite(dataset, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+
+    actions = action_dates(dataset)
+    conn = sqlite3.connect(tmp)
+    try:
+        with conn:
+            _write_table(conn, 'raca', dataset.df)
+            _write_table(conn, 'risks', get_model(dataset).risks)
+            _write_table(conn, 'action_dates', pd.DataFrame({
+                'business_unit': actions['business_unit'].astype(str),
+                'action_id': actions['action_id'],
+                'due': _due_text(actions),
+                'open': actions['open'].astype('int64'),
+            }))
+        conn.execute('ANALYZE')
+    finally:
+        conn.close()
+
+    # Readers only ever see a complete file
+    os.replace(tmp, path)
+    return path
+
+
+def _prune(source, keep):
+    base = os.path.splitext(cache_path(source))[0]
+    paths = sorted(glob.glob(glob.escape(base) + '-*.sqlite'),
+                   key=os.path.getmtime, reverse=True)
+    for path in paths[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def sqlite_file(dataset):
+    path = sqlite_path(dataset.source, fingerprint(dataset))
+    if not os.path.exists(path):
+        logger.info('Writing %r to %s', dataset, path)
+        write_sqlite(dataset, path)
+        _prune(dataset.source, SQLITE_KEEP)
+    return path
+
+
+# ------------------------------------------------------------------------------
+# A DataTable filter as a SQL condition and its parameters, matching
+# raca.query.filter_mask(). kinds maps each column to its SQL type.
+# ------------------------------------------------------------------------------
+_SQL_COMPARE = {'eq': '=', 'ne': '!=', 'lt': '<', 'le': '<=', 'gt': '>',
+                'ge': '>='}
+
+
+def _filter_condition(kinds, column, operator, value, case):
+    if column not in kinds:
+        raise ValueError(f'Unknown column in filter: {column}')
+    text = kinds[column] == 'TEXT'
+    quoted = _quote(column)
+
+    if operator == 'blank' or operator == 'not blank':
+        blank = (f"({quoted} IS NULL OR trim({quoted}) = '')" if text
+                 else f'({quoted} IS NULL)')
+        return (blank if operator == 'blank' else f'NOT {blank}'), []
+
+    if operator == 'contains' or operator == 'datestartswith':
+        target = quoted if text else f'CAST({quoted} AS TEXT)'
+        value = '' if value is None else (
+            value if isinstance(value, str) else f'{value:g}')
+        if not case:
+            target, value = f'lower({target})', value.lower()
+        if operator == 'contains':
+            return f'instr({target}, ?) > 0', [value]
+        return f'substr({target}, 1, ?) = ?', [len(value), value]
+
+    if value is None:
+        raise ValueError(f'Filter on {column} needs a value')
+    compare = _SQL_COMPARE[operator]
+    if not text:
+        if not isinstance(value, float):
+            # Text against a number column never matches
+            return '0', []
+        return f'{quoted} {compare} ?', [value]
+    if not case and isinstance(value, str):
+        return f'lower({quoted}) {compare} ?', [value.lower()]
+    value = value if isinstance(value, str) else f'{value:g}'
+    return f'{quoted} {compare} ?', [value]
+
+
+# ------------------------------------------------------------------------------
+# The SQLite engine. Each thread gets its own read-only connection.
+# ------------------------------------------------------------------------------
+class SQLiteEngine:
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._taxonomy = None
+        self._kinds = {}
+        self._counts = OrderedDict()
+        self._counts_lock = threading.Lock()
+        for table in ('raca', 'risks'):
+            self._kinds[table] = {
+                row[1]: row[2] for row in
+                self._connection().execute(f'PRAGMA table_info({table})')}
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True)
+            conn.execute('PRAGMA query_only = 1')
+            self._local.conn = conn
+        return conn
+
+    def _query(self, sql, params=()):
+        return self._connection().execute(sql, params).fetchall()
+
+    # Rows in a filtered view, counted once per file since it never changes
+    def _count(self, source, params):
+        key = (source, tuple(params))
+        with self._counts_lock:
+            if key in self._counts:
+                self._counts.move_to_end(key)
+                return self._counts[key]
+
+        count = self._query(f'SELECT count(*) FROM {source}', params)[0][0]
+
+        with self._counts_lock:
+            self._counts[key] = count
+            while len(self._counts) > COUNT_CACHE_SIZE:
+                self._counts.popitem(last=False)
+        return count
+
+    def _table(self, view):
+        return {'all': 'raca', 'risks': 'risks'}[view]
+
+    def _frame(self, table, rows, columns):
+        df = pd.DataFrame.from_records(rows, columns=columns)
+        # Whole numbers with gaps stay whole numbers, as in the frame
+        return df.astype({column: 'Int64' for column in columns
+                          if self._kinds[table][column] == 'INTEGER'})
+
+    # The FROM ... WHERE and ORDER BY of a filtered and sorted view, and the
+    # parameters for the WHERE
+    def _view(self, view, sort_by, filter_query):
+        table = self._table(view)
+        kinds = self._kinds[table]
+
+        conditions, params = [], []
+        for term in parse_filter_query(filter_query):
+            condition, values = _filter_condition(kinds, *term)
+            conditions.append(condition)
+            params += values
+        where = (' WHERE ' + ' AND '.join(conditions)) if conditions else ''
+
+        order = []
+        for sort in sort_by or []:
+            if sort['column_id'] not in kinds:
+                raise ValueError(f"Unknown column in sort: {sort['column_id']}")
+            quoted = _quote(sort['column_id'])
+            direction = 'ASC' if sort['direction'] == 'asc' else 'DESC'
+            # NULLS LAST rather than "column IS NULL" first, which would keep
+            # SQLite from walking the column's index
+            order.append(f'{quoted} {direction} NULLS LAST')
+        order.append('row_no')
+        return table, table + where, ', '.join(order), params
+
+    def page(self, view, columns, page_current=0, page_size=None,
+             sort_by=None, filter_query=None):
+        page_current = page_current or 0
+        page_size = page_size or PAGE_SIZE
+        table, source, order, params = self._view(view, sort_by,
+                                                  filter_query)
+
+        total = self._count(source, params)
+        columns = [c for c in columns if c in self._kinds[table]]
+        rows = self._query(
+            'SELECT %s FROM %s ORDER BY %s LIMIT ? OFFSET ?' % (
+                ', '.join(map(_quote, columns)), source, order),
+            params + [page_size, page_current * page_size])
+        return (self._frame(table, rows, columns),
+                max(1, -(-total // page_size)))
+
+    def rows(self, view, columns, sort_by=None, filter_query=None,
+             chunk_size=CHUNK_ROWS):
+        table, source, order, params = self._view(view, sort_by,
+                                                  filter_query)
+        total = self._count(source, params)
+        columns = [c for c in columns if c in self._kinds[table]]
+
+        def chunks():
+            cursor = self._connection().execute(
+                'SELECT %s FROM %s ORDER BY %s' % (
+                    ', '.join(map(_quote, columns)), source, order), params)
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        return
+                    yield self._frame(table, rows, columns)
+            finally:
+                cursor.close()
+        return total, chunks()
+
+    def frame(self, view, columns):
+        table = self._table(view)
+        columns = [c for c in columns if c in self._kinds[table]]
+        rows = self._query('SELECT %s FROM %s ORDER BY row_no' % (
+            ', '.join(map(_quote, columns)), table))
+        return self._frame(table, rows, columns)
+
+    def options(self, column):
+        if column not in self._kinds['raca']:
+            raise ValueError(f'Unknown column: {column}')
+        quoted = _quote(column)
+        return [str(row[0]) for row in self._query(
+            f'SELECT DISTINCT {quoted} FROM raca WHERE {quoted} IS NOT NULL '
+            f'ORDER BY {quoted}')]
+
+    def taxonomy(self):
+        if self._taxonomy is None:
+            rows = self._query('SELECT DISTINCT %s FROM raca' %
+                               ', '.join(map(_quote, LEVELS)))
+            # Missing categories read as NaN, as they do from the frame
+            levels = pd.DataFrame.from_records(rows, columns=LEVELS)
+            self._taxonomy = build_taxonomy(levels.fillna(np.nan))
+        return self._taxonomy
+
+    def unit_totals(self):
+        rows = self._query(
+            'SELECT business_unit, count(*), count(DISTINCT risk_id), '
+            'total(gross_risk), total(net_risk) FROM raca '
+            'GROUP BY business_unit ORDER BY business_unit')
+        totals = pd.DataFrame.from_records(
+            rows, columns=['business_unit', 'rows', 'risks', 'gross_risk',
+                           'net_risk']).set_index('business_unit')
+        return totals.astype({'rows': np.int64, 'risks': np.int64})
+
+    def aging_report(self, date=None):
+        edges = [edge.strftime(DATE_FORMAT) for edge in bucket_edges(date)]
+        # A bucket for each gap between the edges, as in aging_buckets()
+        buckets = (['due < ?'] +
+                   ['due >= ? AND due < ?'] * (len(edges) - 1) +
+                   ['due >= ?', 'due IS NULL'])
+        params = ([edges[0]] +
+                  [edge for pair in zip(edges, edges[1:]) for edge in pair] +
+                  [edges[-1]])
+        rows = self._query(
+            'SELECT business_unit, %s, count(*) FROM action_dates '
+            'GROUP BY business_unit ORDER BY business_unit' % ', '.join(
+                f'count(CASE WHEN open AND {bucket} THEN 1 END)'
+                for bucket in buckets),
+            params)
+
+        counts = np.array([row[1:-1] for row in rows],
+                          dtype=np.int64).reshape(len(rows), len(BUCKETS))
+        return report_frame([row[0] for row in rows], counts,
+                            np.array([row[-1] for row in rows],
+                                     dtype=np.int64))
+
+
+# The SQLite engine is kept per version, for its connections. A FrameEngine
+# is only the Dataset it is given, so it is made on each call and never
+# outlives or outruns its version.
+def get_engine(dataset, storage=None):
+    storage = storage or STORAGE
+    if storage == 'sqlite':
+        return dataset.derived(
+            'sqlite_engine', lambda df: SQLiteEngine(sqlite_file(dataset)))
+    return FrameEngine(dataset)
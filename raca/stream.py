@@ -0,0 +1,85 @@
+import zlib
+
+import pandas as pd
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# ------------------------------------------------------------------------------
+# Streaming a table view as CSV
+#
+# For tooling that wants the whole dataset rather than a page of it. The rows
+# come from the storage engine's rows() a chunk at a time and each chunk is
+# turned into CSV, compressed and sent before the next is read, so neither
+# the CSV nor the response is ever held in memory whole.
+#
+# Responses are compressed with brotli (when it is installed) or gzip,
+# whichever the client accepts first, flushing at the end of every chunk so
+# the client sees rows as they are written.
+# ------------------------------------------------------------------------------
+ENCODINGS = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+# The Overview sidebar's filters, as query parameters of the same name
+SIDEBAR_FILTERS = ['risk_types', 'risk', 'level3', 'business_unit']
+
+
+# ------------------------------------------------------------------------------
+# The sidebar's selections as a DataTable filter_query, so they run through
+# the same filtering as the tables. Anything missing or 'All' is left out.
+# Each value is quoted with its quotes and backslashes escaped, so it is
+# matched whole even if it has ' && ' in it.
+# ------------------------------------------------------------------------------
+def sidebar_filter_query(selections):
+    parts = []
+    for column in SIDEBAR_FILTERS:
+        value = selections.get(column)
+        if value and value != 'All':
+            quoted = value.replace('\\', '\\\\').replace('"', '\\"')
+            parts.append(f'{{{column}}} s= "{quoted}"')
+    return ' && '.join(parts)
+
+
+def pick_encoding(accept_encodings):
+    # accept_encodings is werkzeug's Accept, e.g. request.accept_encodings
+    for encoding in ENCODINGS:
+        if accept_encodings[encoding] > 0:
+            return encoding
+    return None
+
+
+def csv_text(chunks, columns, headers):
+    yield pd.DataFrame(columns=headers).to_csv(index=False)
+    for chunk in chunks:
+        yield chunk.reindex(columns=columns).to_csv(index=False, header=False)
+
+
+def _gzip():
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    return (lambda data: (compressor.compress(data) +
+                          compressor.flush(zlib.Z_SYNC_FLUSH)),
+            compressor.flush)
+
+
+def _brotli():
+    compressor = brotli.Compressor(quality=5)
+    return (lambda data: compressor.process(data) + compressor.flush(),
+            compressor.finish)
+
+
+COMPRESSORS = {'gzip': _gzip, 'br': _brotli}
+
+
+def encode_stream(text, encoding=None):
+    if encoding is None:
+        for part in text:
+            yield part.encode('utf-8')
+        return
+
+    compress, finish = COMPRESSORS[encoding]()
+    for part in text:
+        data = compress(part.encode('utf-8'))
+        if data:
+            yield data
+    yield finish()
@@ -0,0 +1,41 @@
+import pandas as pd
+
+# ------------------------------------------------------------------------------
+# Risk category taxonomy: Risk Category 1 -> 2 -> 3
+#
+# Built once per dataset version so the cascading dropdowns are a dictionary
+# lookup instead of a scan of the whole frame on every change. Each level maps
+# the selected parent value, or 'All', to the ready made option list for the
+# dropdown below it.
+# ------------------------------------------------------------------------------
+ALL = 'All'
+
+LEVELS = ['risk_types', 'risk', 'level3']
+
+
+def _options(values):
+    return [{'label': value, 'value': value} for value in sorted(values)]
+
+
+def _children(pairs, parent, child):
+    children = {ALL: _options(pairs[child].unique())}
+    for value, group in pairs.groupby(parent, sort=False):
+        children[value] = _options(group[child].unique())
+    return children
+
+
+def build_taxonomy(df):
+    # Option values are the category text, as the dropdowns always had it
+    levels = pd.DataFrame({level: df[level].astype(str) for level in LEVELS})
+
+    return {
+        'risk_types': _options(levels['risk_types'].unique()),
+        'risk': _children(levels[['risk_types', 'risk']].drop_duplicates(),
+                          'risk_types', 'risk'),
+        'level3': _children(levels[['risk', 'level3']].drop_duplicates(),
+                            'risk', 'level3'),
+    }
+
+
+def get_taxonomy(dataset):
+    return dataset.derived('taxonomy', build_taxonomy)
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+# ------------------------------------------------------------------------------
+# Read-only frames
+#
+# A published Dataset's frame is shared by every callback and every request
+# thread, so it is frozen: the arrays behind its columns are marked read-only
+# and the frame itself refuses in-place changes. Code that tries to change it
+# (a column assignment, drop_duplicates(inplace=True), ...) fails straight
+# away instead of quietly changing what every other tab sees. Anything taken
+# from it (a selection, a copy, a groupby) is an ordinary frame again.
+#
+# The risk, control and action tables built from it (raca/model.py) are
+# read-only too.
+# ------------------------------------------------------------------------------
+class ReadOnlyFrame(pd.DataFrame):
+
+    @property
+    def _constructor(self):
+        return pd.DataFrame
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('RACA dataset frames are read-only, take a copy() '
+                        'to change one')
+
+    __setitem__ = __delitem__ = insert = _update_inplace = _read_only
+
+
+def _freeze_array(values):
+    if isinstance(values, np.ndarray):
+        values.flags.writeable = False
+        return
+    # Categorical, datetime and nullable integer arrays keep numpy arrays
+    # underneath
+    for name in ('_ndarray', '_data', '_mask'):
+        array = getattr(values, name, None)
+        if isinstance(array, np.ndarray):
+            array.flags.writeable = False
+
+
+def read_only(df):
+    if isinstance(df, ReadOnlyFrame):
+        return df
+    for values in df._mgr.arrays:
+        _freeze_array(values)
+    return ReadOnlyFrame(df)
+
@@ -0,0 +1,89 @@
+import logging
+import os
+import threading
+
+from raca.workbooks import sources_stamp
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------------------
+# How often to look at the RACA source for changes, in seconds. 0 turns the
+# watcher off.
+# ------------------------------------------------------------------------------
+WATCH_INTERVAL = float(os.environ.get('RACA_WATCH', '5'))
+
+
+# ------------------------------------------------------------------------------
+# Poll the source file of a DatasetStore and reload it in the background. A
+# source made of many workbooks changes when any of them does.
+#
+# Excel writes a workbook in several goes, so a change is only acted on once
+# the size/mtime stamp has stayed the same for a whole interval. If the new
+# file can't be read we log it and keep serving the last good version.
+# ------------------------------------------------------------------------------
+class SourceWatcher(threading.Thread):
+
+    def __init__(self, store, interval=WATCH_INTERVAL):
+        super().__init__(name='raca-source-watcher', daemon=True)
+        self.store = store
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._seen = self._stamp()
+
+    def _stamp(self):
+        try:
+            return sources_stamp(self.store.source)
+        except OSError:
+            return None
+
+    def stop(self):
+        self._stop_event.set()
+
+    def check(self, pending=None):
+        stamp = self._stamp()
+        if stamp is None or stamp == self._seen:
+            return None
+        if stamp != pending:
+            # Changed since we last looked; wait for it to settle
+            return stamp
+        if not self.store.loaded:
+            # Dropped to save memory, the next get() reads the new file
+            self._seen = stamp
+            return None
+
+        try:
+            dataset = self.store.reload()
+        except Exception:
+            logger.exception('Could not reload %s, still serving v%s',
+                             self.store.source, self.store.version)
+        else:
+            logger.info('Reloaded %s as %r', self.store.source, dataset)
+        self._seen = stamp
+        return None
+
+    def run(self):
+        pending = None
+        while not self._stop_event.wait(self.interval):
+            pending = self.check(pending)
+
+
+# ------------------------------------------------------------------------------
+# Start one watcher per process. Threads don't survive a fork, so this is
+# called from the worker (e.g. on its first request) rather than at import.
+# ------------------------------------------------------------------------------
+_watchers = {}
+_watchers_lock = threading.Lock()
+
+
+def start_watcher(store, interval=WATCH_INTERVAL):
+    if interval <= 0:
+        return None
+
+    key = (os.getpid(), id(store))
+    with _watchers_lock:
+        watcher = _watchers.get(key)
+        if watcher is None or not watcher.is_alive():
+            watcher = SourceWatcher(store, interval)
+            watcher.start()
+            _watchers[key] = watcher
+    return watcher
@@ -0,0 +1,100 @@
+import json
+import time
+
+import numpy as np
+import pandas as pd
+import plotly
+
+# ------------------------------------------------------------------------------
+# What goes over the wire to the DataTables
+#
+# A table only gets the columns it declares (table_columns), and with
+# WIRE_FORMAT 'columnar' (the default) a page is sent as one list per column
+# instead of one dict per row. Text that repeats down a column, which is most
+# of the RACA sheet, is sent once in a dictionary with each row as an index
+# into it. assets/raca.js turns this back into records in the browser.
+#
+#   {"length": 2,
+#    "columns": {"risk_id": ["AP-P01-R01", "AP-P01-R02"],
+#                "risk_types": {"dictionary": ["Operational Risk"],
+#                               "codes": [0, 0]}}}
+#
+# A code of -1 is an empty cell.
+# ------------------------------------------------------------------------------
+COLUMNAR = 'columnar'
+RECORDS = 'records'
+
+
+def table_columns(table):
+    return [column['id'] for column in table.columns]
+
+
+def project(df, columns):
+    return df[[column for column in columns if column in df.columns]]
+
+
+def _plain(values):
+    # Python scalars with None for missing, as json wants them
+    values = np.array(values, dtype=object)
+    values[pd.isna(values)] = None
+    return values.tolist()
+
+
+def encode_columnar(df):
+    columns = {}
+    for column in df.columns:
+        series = df[column]
+        if series.dtype.name == 'category':
+            codes = series.cat.codes.to_numpy()
+            used = np.unique(codes[codes >= 0])
+            # Only the categories this page uses, renumbered from 0
+            remap = np.full(len(series.cat.categories) + 1, -1)
+            remap[used] = np.arange(len(used))
+            columns[column] = {
+                'dictionary': series.cat.categories[used].tolist(),
+                'codes': remap[codes].tolist()}
+        elif series.dtype == object:
+            codes, uniques = pd.factorize(series)
+            if len(uniques) < len(series):
+                columns[column] = {'dictionary': uniques.tolist(),
+                                   'codes': codes.tolist()}
+            else:
+                columns[column] = _plain(series)
+        else:
+            columns[column] = _plain(series)
+    return {'length': len(df), 'columns': columns}
+
+
+def encode(df, wire_format=COLUMNAR):
+    if wire_format == COLUMNAR:
+        return encode_columnar(df)
+    return df.to_dict('records')
+
+
+# ------------------------------------------------------------------------------
+# Bytes and serialization time of a frame in each format, as Dash would send
+# it (PlotlyJSONEncoder)
+# ------------------------------------------------------------------------------
+def _measure(build, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        payload = json.dumps(build(), cls=plotly.utils.PlotlyJSONEncoder)
+    seconds = (time.perf_counter() - started) / repeat
+    return len(payload.encode('utf-8')), seconds
+
+
+def wire_report(df, columns, repeat=3):
+    projected = project(df, columns)
+    rows = []
+    for name, build in [
+            ('records, all columns', lambda: df.to_dict('records')),
+            ('records, table columns', lambda: projected.to_dict('records')),
+            ('columnar, table columns', lambda: encode_columnar(projected))]:
+        size, seconds = _measure(build, repeat)
+        rows.append({'format': name, 'bytes': size,
+                     'ms': round(seconds * 1000, 2)})
+
+    report = pd.DataFrame(rows).set_index('format')
+    report['vs_records_%'] = (100 * report['bytes'] /
+                              report['bytes'].iloc[0]).round(1)
+    return report
@@ -0,0 +1,203 @@
+import glob
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from raca.cache import read_cache, source_meta, source_stamp, write_cache
+from raca.compact import concat_compact
+from raca.ingest import READERS, detect_format, load_source
+from raca.schema import COLUMN_MAP
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------------------
+# A RACA source made of many workbooks
+#
+# Each business unit can keep its own workbook. Point RACA_DATA (or a
+# dataset in RACA_DATASETS) at a directory of them, or a glob such as
+# 'racas/*-raca.xlsx', and they are read as one dataset: every workbook's
+# headers are checked against the column map, the workbooks are parsed in
+# parallel in a pool of processes, and the prepared frames are concatenated.
+#
+# Each workbook keeps its own columnar cache, so after the first load only
+# the workbooks that have changed since are parsed again.
+#
+# RACA_INGEST_WORKERS sets how many processes parse at once (default one per
+# CPU).
+# ------------------------------------------------------------------------------
+INGEST_WORKERS = int(os.environ.get('RACA_INGEST_WORKERS', '0')) or None
+
+WORKBOOK_EXTENSIONS = ('.xlsx', '.xlsm', '.csv')
+
+
+def is_multi_source(source):
+    return os.path.isdir(source) or glob.has_magic(source)
+
+
+def source_files(source):
+    if os.path.isdir(source):
+        paths = [entry.path for entry in os.scandir(source)]
+    elif glob.has_magic(source):
+        paths = glob.glob(source)
+    else:
+        return [source]
+    return sorted(path for path in paths
+                  if path.lower().endswith(WORKBOOK_EXTENSIONS) and
+                  os.path.isfile(path) and
+                  # Excel's lock file for a workbook that is open
+                  not os.path.basename(path).startswith('~$'))
+
+
+# ------------------------------------------------------------------------------
+# A stamp that changes when any workbook of a source is added, removed or
+# saved, for the source watcher
+# ------------------------------------------------------------------------------
+def sources_stamp(source):
+    if not is_multi_source(source):
+        return source_stamp(source)
+    return {path: source_stamp(path) for path in source_files(source)}
+
+
+# ------------------------------------------------------------------------------
+# Check a workbook's headers against the column map before parsing it.
+# Missing columns are an error; columns we don't know are returned so they
+# can be reported.
+# ------------------------------------------------------------------------------
+def check_schema(path, fmt=None):
+    chunks = READERS[fmt or detect_format(path)](path, 1)
+    try:
+        first = next(chunks, None)
+    finally:
+        chunks.close()
+    if first is None:
+        raise ValueError(f'{path} has no RACA rows')
+
+    headers = [str(header) for header in first.columns]
+    missing = [column for column in COLUMN_MAP if column not in headers]
+    if missing:
+        raise ValueError(f'{path} is missing RACA columns: '
+                         f'{", ".join(missing)}')
+    return [header for header in headers
+            if header and header not in COLUMN_MAP]
+
+
+# ------------------------------------------------------------------------------
+# Parse one workbook, in a pool process. With the cache on the prepared frame
+# goes into the workbook's columnar cache, for the parent to memory-map,
+# rather than back through a pipe.
+# ------------------------------------------------------------------------------
+def parse_workbook(path, use_cache=True):
+    started = time.perf_counter()
+    result = {'path': path, 'rows': 0, 'seconds': 0.0, 'parsed': True,
+              'extra_columns': [], 'error': None, 'frame': None}
+    try:
+        result['extra_columns'] = check_schema(path)
+        meta = source_meta(path)
+        df = load_source(path)
+        if use_cache:
+            write_cache(path, df, meta)
+        else:
+            result['frame'] = df
+        result['rows'] = len(df)
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def _cached(path):
+    started = time.perf_counter()
+    df = read_cache(path)
+    if df is None:
+        return None
+    return {'path': path, 'rows': len(df),
+            'seconds': round(time.perf_counter() - started, 3),
+            'parsed': False, 'extra_columns': [], 'error': None,
+            'frame': df}
+
+
+# Memory-map the cache a pool process wrote. If the workbook was saved again
+# while it was parsed the cache no longer matches it, and that workbook is
+# reported as failed rather than read as nothing.
+def _read_parsed(result):
+    try:
+        result['frame'] = read_cache(result['path'])
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+        return
+    if result['frame'] is None:
+        result['error'] = ('changed while it was parsed, or its cache could '
+                           'not be read back')
+
+
+def _parse_all(paths, use_cache, workers):
+    if len(paths) == 1 or workers == 1:
+        return [parse_workbook(path, use_cache) for path in paths]
+    # spawn, as this can run on a reload thread of a web worker
+    with ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return list(pool.map(parse_workbook, paths,
+                             [use_cache] * len(paths)))
+
+
+class WorkbookErrors(ValueError):
+
+    def __init__(self, source, failed, report):
+        self.report = report
+        super().__init__(
+            f'{len(failed)} of {len(report)} workbooks in {source} could not '
+            'be read:\n' + '\n'.join(f"  {result['path']}: {result['error']}"
+                                     for result in failed))
+
+
+# ------------------------------------------------------------------------------
+# Load every workbook of a source into one prepared frame. Returns the frame
+# and a report with a row per workbook: its rows, how long it took, whether
+# it had to be parsed, columns it has that we don't use, and its error.
+#
+# If any workbook fails the load fails, naming every workbook that did, so a
+# business unit never silently drops out of the dataset.
+# ------------------------------------------------------------------------------
+def load_workbooks(source, use_cache=True, workers=INGEST_WORKERS):
+    started = time.perf_counter()
+    paths = source_files(source)
+    if not paths:
+        raise ValueError(f'No RACA workbooks in {source}')
+
+    results = {}
+    if use_cache:
+        for path in paths:
+            cached = _cached(path)
+            if cached is not None:
+                results[path] = cached
+
+    todo = [path for path in paths if path not in results]
+    if todo:
+        for result in _parse_all(todo, use_cache, workers):
+            if result['error'] is None and use_cache:
+                _read_parsed(result)
+            results[result['path']] = result
+
+    results = [results[path] for path in paths]
+    report = pd.DataFrame(
+        [{key: value for key, value in result.items() if key != 'frame'}
+         for result in results]).set_index('path')
+
+    for result in results:
+        if result['extra_columns']:
+            logger.warning('%s has columns the app does not use: %s',
+                           result['path'], ', '.join(result['extra_columns']))
+
+    failed = [result for result in results if result['error'] is not None]
+    if failed:
+        raise WorkbookErrors(source, failed, report)
+
+    df = concat_compact([result['frame'] for result in results])
+    logger.info('Loaded %d rows from %d workbooks in %s (%d parsed) in '
+                '%.2fs', len(df), len(paths), source, len(todo),
+                time.perf_counter() - started)
+    return df, report
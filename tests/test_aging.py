@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from raca.aging import (BUCKETS, TOTAL, aging_buckets, aging_report,
+                        bucket_edges, build_action_dates, parse_dates,
+                        reporting_date)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('2021-03-31', '2021-03-31'),
+    ('2021-03-31 00:00:00', '2021-03-31'),
+    (' 2021-03-31 ', '2021-03-31'),
+    ('44286', '2021-03-31'),
+    ('44286.0', '2021-03-31'),
+    ('Mar-21', '2021-03-31'),
+    ('Feb-24', '2024-02-29'),
+    ('31/03/2021', '2021-03-31'),
+    ('01/02/2021', '2021-02-01'),
+    ('1.2.2021', '2021-02-01'),
+])
+def test_parse_dates(text, expected):
+    assert parse_dates(pd.Series([text]))[0] == pd.Timestamp(expected)
+
+
+@pytest.mark.parametrize('text', ['TBC', '', 'Mar', '31/13/2021', None,
+                                  np.nan])
+def test_unreadable_dates_are_nat(text):
+    assert pd.isna(parse_dates(pd.Series([text], dtype=object))[0])
+
+
+def test_parse_dates_keeps_rows_and_index():
+    text = pd.Series(['Mar-21', None, '44286', 'Mar-21'],
+                     index=[10, 11, 12, 13])
+
+    parsed = parse_dates(text)
+
+    assert list(parsed.index) == [10, 11, 12, 13]
+    assert parsed[10] == parsed[12] == parsed[13] == pd.Timestamp('2021-03-31')
+    assert pd.isna(parsed[11])
+
+
+def test_reporting_date():
+    assert reporting_date('2021-03-31 15:30') == pd.Timestamp('2021-03-31')
+    assert reporting_date('') == pd.Timestamp.today().normalize()
+
+
+# ------------------------------------------------------------------------------
+# Each edge (R-3M, R-1M, R+1M, R+3M) starts the next bucket: a due date on an
+# edge is in the later bucket, the day before it in the earlier one
+# ------------------------------------------------------------------------------
+@pytest.mark.parametrize('date, edges', [
+    ('2021-03-15', ['2020-12-15', '2021-02-15', '2021-04-15', '2021-06-15']),
+    # Month ends clip to the shorter months
+    ('2021-03-31', ['2020-12-31', '2021-02-28', '2021-04-30', '2021-06-30']),
+])
+def test_bucket_edges(date, edges):
+    assert bucket_edges(date) == [pd.Timestamp(edge) for edge in edges]
+
+    day = pd.Timedelta(days=1)
+    due = [edge - day for edge in bucket_edges(date)] + bucket_edges(date)
+    buckets = [BUCKETS[i] for i in aging_buckets(due, date)]
+
+    assert buckets[:4] == ['gt-3', 'lteq-3', 'lteq-13', 'lteq13']
+    assert buckets[4:] == ['lteq-3', 'lteq-13', 'lteq13', 'gt3']
+
+
+def test_reporting_date_itself_is_due_within_a_month():
+    due = ['2021-03-31', 'NaT', '2019-01-01', '2030-01-01']
+
+    buckets = [BUCKETS[i] for i in aging_buckets(due, '2021-03-31')]
+
+    assert buckets == ['lteq-13', 'ddtbc', 'gt-3', 'gt3']
+
+
+def raca_rows():
+    return pd.DataFrame({
+        'business_unit': ['Cards', 'Cards', 'Cards', 'Loans', 'Loans',
+                          'Loans'],
+        'action_id': ['A1', 'A1', 'A2', 'A3', 'A4', None],
+        'action_due_date': ['Mar-21', 'Mar-21', '2021-01-15', 'TBC',
+                            '44286', '2021-03-31'],
+        'completion_date': [None, None, None, None, '2021-03-01', None],
+    })
+
+
+def test_build_action_dates():
+    actions = build_action_dates(raca_rows())
+
+    # A1 sits on two rows, the row with no action isn't an action
+    assert list(actions['action_id']) == ['A1', 'A2', 'A3', 'A4']
+    assert list(actions['open']) == [True, True, True, False]
+    assert actions['due'][0] == pd.Timestamp('2021-03-31')
+    assert pd.isna(actions['due'][2])
+
+
+def test_aging_report():
+    report = aging_report(build_action_dates(raca_rows()), '2021-03-31')
+
+    assert list(report['business_unit']) == ['Cards', 'Loans', TOTAL]
+    assert report.loc[0, BUCKETS].tolist() == [0, 1, 1, 0, 0, 0]
+    # A4 is complete, so only counted in the total actions
+    assert report.loc[1, BUCKETS].tolist() == [0, 0, 0, 0, 0, 1]
+    assert report[['toa', 'ta']].values.tolist() == [[2, 2], [1, 2], [3, 4]]
+
+
+@pytest.mark.parametrize('units', [30, 200])
+def test_aging_report_with_many_units(units):
+    names = [f'Unit {i:03d}' for i in range(units)]
+    actions = build_action_dates(pd.DataFrame({
+        'business_unit': names,
+        'action_id': [f'A{i}' for i in range(units)],
+        'action_due_date': ['Mar-21'] * units,
+        'completion_date': [None] * units,
+    }))
+
+    report = aging_report(actions, '2021-03-31')
+
+    assert list(report['business_unit']) == names + [TOTAL]
+    assert (report.loc[:units - 1, 'lteq-13'] == 1).all()
+    assert report.loc[units, ['lteq-13', 'toa', 'ta']].tolist() == [units] * 3
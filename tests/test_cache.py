@@ -0,0 +1,85 @@
+import os
+
+import pandas as pd
+import pytest
+
+from raca import cache
+from raca.cache import (cache_path, file_sha256, read_cache, source_meta,
+                        source_stamp, valid_cache, write_cache)
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'CACHE_DIR', str(tmp_path / 'cache'))
+    path = tmp_path / 'raca.csv'
+    path.write_text('risk_id,gross_risk\nAP-P01-R01,12\n')
+    return str(path)
+
+
+def frame():
+    return pd.DataFrame({'risk_id': ['AP-P01-R01'], 'gross_risk': [12.0]})
+
+
+def touch(path, ns):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + ns))
+
+
+def test_cache_round_trips(source):
+    write_cache(source, frame())
+    assert valid_cache(source) == cache_path(source)
+    pd.testing.assert_frame_equal(read_cache(source), frame())
+
+
+def test_meta_stamps_and_hashes_the_source(source):
+    meta = source_meta(source)
+    assert meta['cache_version'] == cache.CACHE_VERSION
+    assert meta['size'] == os.path.getsize(source)
+    assert meta['mtime_ns'] == source_stamp(source)['mtime_ns']
+    assert meta['sha256'] == file_sha256(source)
+
+
+def test_touched_source_keeps_its_cache(source):
+    write_cache(source, frame())
+    touch(source, 10 ** 9)
+    assert valid_cache(source) == cache_path(source)
+    # The new stamp is written back, so the next check doesn't hash again
+    meta = cache._read_meta(cache_path(source))
+    assert meta['mtime_ns'] == source_stamp(source)['mtime_ns']
+
+
+def test_edited_source_invalidates_its_cache(source):
+    write_cache(source, frame())
+    # Same size, different contents: only the hash tells them apart
+    with open(source, 'r+') as f:
+        f.write('RISK_ID')
+    touch(source, 10 ** 9)
+    assert valid_cache(source) is None
+    assert read_cache(source) is None
+
+
+def test_resized_source_invalidates_its_cache(source):
+    write_cache(source, frame())
+    with open(source, 'a') as f:
+        f.write('AP-P02-R02,6\n')
+    assert valid_cache(source) is None
+
+
+def test_new_cache_version_invalidates_the_cache(source, monkeypatch):
+    write_cache(source, frame())
+    monkeypatch.setattr(cache, 'CACHE_VERSION', cache.CACHE_VERSION + 1)
+    assert valid_cache(source) is None
+
+
+def test_missing_cache_file_is_not_valid(source):
+    path = write_cache(source, frame())
+    os.remove(path)
+    assert valid_cache(source) is None
+
+
+def test_cache_path_tells_folders_and_globs_apart(tmp_path):
+    a = cache_path(str(tmp_path / 'a' / 'raca.csv'))
+    b = cache_path(str(tmp_path / 'b' / 'raca.csv'))
+    assert a != b
+    assert os.path.basename(a).startswith('raca.csv-')
+    assert '*' not in os.path.basename(cache_path(str(tmp_path / '*.xlsx')))
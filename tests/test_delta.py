@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from raca.dataset import Dataset
+from raca.delta import (BusinessUnitTotals, carry_forward, diff_rows,
+                        get_unit_totals, row_hashes)
+from raca.model import get_model
+
+
+def frame():
+    return pd.DataFrame({
+        'risk_id': ['R1', 'R1', 'R2', 'R3', 'R3'],
+        'control_id': ['C1', 'C2', 'C3', 'C4', 'C4'],
+        'action_id': ['A1', None, 'A2', 'A3', 'A3'],
+        'business_unit': ['Cards', 'Cards', 'Loans', 'Loans', 'Loans'],
+        'gross_risk': [12.0, 12.0, 6.0, np.nan, 9.0],
+        'net_risk': [4.0, 4.0, 2.0, 3.0, 3.0],
+    })
+
+
+def delta(old, new):
+    return diff_rows(row_hashes(old), row_hashes(new))
+
+
+def positions(delta):
+    return {name: list(getattr(delta, name))
+            for name in ('inserted', 'updated', 'replaced', 'deleted')}
+
+
+def test_same_rows_are_unchanged():
+    result = delta(frame(), frame())
+    assert result.unchanged and not result.reordered
+
+
+def test_inserted_updated_and_deleted_rows():
+    old = frame()
+    new = frame().drop(index=1).reset_index(drop=True)
+    new.loc[1, 'gross_risk'] = 8.0
+    new.loc[len(new)] = ['R4', 'C5', 'A4', 'Cards', 1.0, 1.0]
+    result = delta(old, new)
+    # Old row 2 (R2) is new row 1, and the new R4 row is appended
+    assert positions(result) == {'inserted': [4], 'updated': [1],
+                                 'replaced': [2], 'deleted': [1]}
+    assert result.summary() == {'inserted': 1, 'updated': 1, 'deleted': 1}
+
+
+def test_repeated_keys_are_told_apart():
+    new = frame()
+    # The second of R3's two identical rows changes
+    new.loc[4, 'net_risk'] = 1.0
+    result = delta(frame(), new)
+    assert positions(result) == {'inserted': [], 'updated': [4],
+                                 'replaced': [4], 'deleted': []}
+
+
+def test_reordered_rows_are_not_changes():
+    new = frame().iloc[[2, 0, 1, 3, 4]].reset_index(drop=True)
+    result = delta(frame(), new)
+    assert result.unchanged and result.reordered
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_totals_carried_forward_match_a_rebuild(seed):
+    rng = np.random.default_rng(seed)
+    old = frame().sample(frac=1, random_state=seed).reset_index(drop=True)
+    new = old.drop(index=rng.choice(len(old), 2, replace=False))
+    new = pd.concat([new, pd.DataFrame({
+        'risk_id': ['R1', 'R9'], 'control_id': ['C9', 'C9'],
+        'action_id': ['A9', 'A9'], 'business_unit': ['Cards', 'Savings'],
+        'gross_risk': [5.0, 7.0], 'net_risk': [1.0, np.nan]})],
+        ignore_index=True)
+    new.loc[0, 'gross_risk'] = 20.0
+
+    totals = BusinessUnitTotals.from_frame(old)
+    carried = totals.apply(delta(old, new), old, new)
+    pd.testing.assert_frame_equal(
+        carried.frame(), BusinessUnitTotals.from_frame(new).frame(),
+        check_dtype=False)
+
+
+def test_unchanged_version_is_seeded_from_the_old_one():
+    old = Dataset(frame(), 1, 'raca.csv')
+    totals = get_unit_totals(old)
+    get_model(old)
+    new = Dataset(frame(), 2, 'raca.csv')
+    carry_forward(old, new)
+
+    assert new.cached('row_delta').unchanged
+    assert get_unit_totals(new) is totals
+    # The model refers to the old frame, so it is built again
+    assert new.cached('model') is None
+
+
+def test_changed_version_gets_its_totals_from_the_delta():
+    old = Dataset(frame(), 1, 'raca.csv')
+    get_unit_totals(old)
+    df = frame()
+    df.loc[2, 'business_unit'] = 'Cards'
+    new = Dataset(df, 2, 'raca.csv')
+    carry_forward(old, new)
+
+    assert new.cached('unit_totals') is not None
+    pd.testing.assert_frame_equal(
+        get_unit_totals(new), BusinessUnitTotals.from_frame(df).frame(),
+        check_dtype=False)
@@ -0,0 +1,54 @@
+import os
+import shutil
+
+import pytest
+
+from raca import dataset as dataset_module
+from raca import export
+from raca.dataset import Dataset, load_raca
+from raca.storage import fingerprint
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                      'clensed.csv')
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset_module, 'USE_CACHE', False)
+    monkeypatch.setattr(export, 'EXPORT_DIR', str(tmp_path / 'exports'))
+    os.makedirs(export.EXPORT_DIR)
+    path = str(tmp_path / 'raca.csv')
+    shutil.copy(SAMPLE, path)
+    return path
+
+
+def _export(source, dataset):
+    status = {'id': 'a' * 32, 'format': 'csv'}
+    spec = {'source': source, 'name': 'raca', 'version': dataset.version,
+            'sqlite': None, 'fingerprint': fingerprint(dataset),
+            'view': 'all', 'columns': [['risk_id', 'Risk ID']],
+            'sort_by': [], 'filter_query': ''}
+    return export.run_export(status, spec)
+
+
+def test_export_of_the_version_shown(source):
+    dataset = Dataset(load_raca(source), 1, source, 'raca')
+
+    status = _export(source, dataset)
+
+    assert status['state'] == 'done'
+    assert status['rows'] == len(dataset.df)
+
+
+def test_export_fails_when_the_source_changed(source):
+    dataset = Dataset(load_raca(source), 1, source, 'raca')
+    with open(source) as f:
+        lines = f.readlines()
+    with open(source, 'w') as f:
+        f.writelines(lines[:-1])
+
+    status = _export(source, dataset)
+
+    assert status['state'] == 'failed'
+    assert status['error'] == export.CHANGED
+    assert not os.path.exists(export.export_path(status['id'], 'csv'))
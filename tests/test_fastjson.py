@@ -0,0 +1,73 @@
+import datetime
+import decimal
+import json
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import pytest
+from plotly.utils import PlotlyJSONEncoder
+
+from raca import fastjson
+from raca.fastjson import FastJSONEncoder
+
+pytest.importorskip('orjson')
+
+NAN = float('nan')
+
+PAYLOADS = {
+    'nan': [1.0, NAN, float('inf'), -float('inf')],
+    'nested nan': {'a': [np.float64(NAN), {'b': np.array([NAN])}]},
+    'float array': np.array([1.0, np.nan, np.inf]),
+    'float32 array': np.array([1.5, np.nan], dtype=np.float32),
+    'int array': np.arange(3),
+    'bool array': np.array([True, False]),
+    'object array': np.array(['a', None, 1.0, np.nan], dtype=object),
+    'numpy scalars': [np.int64(3), np.int8(2), np.float32(1.5),
+                      np.float64(NAN), np.bool_(True)],
+    'datetime': datetime.datetime(2021, 3, 31, 12, 30),
+    'aware datetime': datetime.datetime(2021, 3, 31, 12, 30,
+                                        tzinfo=datetime.timezone.utc),
+    'date': datetime.date(2021, 3, 31),
+    'timestamp': pd.Timestamp('2021-03-31 12:30'),
+    'datetime64': np.datetime64('2021-03-31T12:30'),
+    'datetime64 array with NaT': np.array(['2021-03-31', 'NaT'],
+                                          dtype='datetime64[ns]'),
+    'missing': [pd.NaT, pd.NA, None],
+    'series': pd.Series([1.0, np.nan]),
+    'date series': pd.Series(pd.to_datetime(['2021-03-31', None])),
+    'decimal': decimal.Decimal('1.5'),
+    'int keys': {1: 'a'},
+    'figure': go.Figure(go.Bar(x=['a', 'b'], y=np.array([1, np.nan]))),
+    'date figure': go.Figure(go.Scatter(
+        x=pd.to_datetime(['2021-03-31', '2021-04-30']), y=[1, NAN])),
+}
+
+
+@pytest.mark.parametrize('payload', PAYLOADS.values(), ids=PAYLOADS.keys())
+def test_fast_encoder_matches_plotly(payload):
+    expected = json.loads(json.dumps(payload, cls=PlotlyJSONEncoder))
+    assert json.loads(json.dumps(payload, cls=FastJSONEncoder)) == expected
+    assert json.loads(fastjson.dumps(payload)) == expected
+
+
+def test_datetime64_arrays_are_the_same_instants():
+    # orjson writes them to the unit they're in, plotly always to the
+    # nanosecond, so only the text differs
+    for unit in ('ns', 's', 'D'):
+        dates = np.array(['2021-03-31T12:30'], dtype=f'datetime64[{unit}]')
+        assert (pd.to_datetime(json.loads(fastjson.dumps(dates))) ==
+                pd.to_datetime(json.loads(json.dumps(
+                    dates, cls=PlotlyJSONEncoder)))).all()
+
+
+def test_indented_or_sorted_falls_back_to_plotly():
+    payload = {'b': [1.0, NAN], 'a': 1}
+    for options in ({'indent': 2}, {'sort_keys': True}):
+        assert (json.dumps(payload, cls=FastJSONEncoder, **options) ==
+                json.dumps(payload, cls=PlotlyJSONEncoder, **options))
+
+
+def test_unserialisable_still_raises():
+    with pytest.raises(TypeError):
+        fastjson.dumps(object())
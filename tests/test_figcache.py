@@ -0,0 +1,112 @@
+import os
+
+import plotly.graph_objects as go
+import pytest
+
+from raca import figcache
+from raca.figcache import (DiskBackend, FigureCache, MemoryBackend,
+                           cached_figure, figure_key)
+
+
+class Builds:
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, name='bar'):
+        self.calls += 1
+        return go.Figure(go.Bar(x=['A', 'B'], y=[1, 2], name=name))
+
+
+def test_figure_key_covers_output_filters_and_version():
+    key = figure_key('barchart1', ('All', 'All', 'All'), 'v1')
+    assert key == figure_key('barchart1', ['All', 'All', 'All'], 'v1')
+    assert len({key,
+                figure_key('piechart1', ('All', 'All', 'All'), 'v1'),
+                figure_key('barchart1', ('All', 'Fraud', 'All'), 'v1'),
+                figure_key('barchart1', ('All', 'All', 'All'), 'v2')}) == 4
+
+
+def test_second_lookup_is_a_hit():
+    cache = FigureCache('memory')
+    build = Builds()
+    first = cache.get_or_build('key', build)
+    second = cache.get_or_build('key', build)
+    assert build.calls == 1
+    assert first == second == go.Figure(build()).to_plotly_json()
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (1, 1)
+
+
+def test_off_always_builds():
+    cache = FigureCache('off')
+    build = Builds()
+    cache.get_or_build('key', build)
+    cache.get_or_build('key', build)
+    assert build.calls == 2
+    assert cache.stats() == {'backend': 'off', 'hits': 0, 'misses': 0,
+                             'hit_rate': None}
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryBackend(max_bytes=10)
+    backend.set('a', 'aaaa')
+    backend.set('b', 'bbbb')
+    backend.get('a')
+    backend.set('c', 'cccc')
+    assert backend.get('b') is None
+    assert (backend.get('a'), backend.get('c')) == ('aaaa', 'cccc')
+    assert backend.info() == {'entries': 2, 'bytes': 8}
+    assert backend.evictions == 1
+
+
+def test_memory_backend_skips_a_figure_bigger_than_the_cache():
+    backend = MemoryBackend(max_bytes=3)
+    backend.set('a', 'aaaa')
+    assert backend.get('a') is None
+    assert backend.info() == {'entries': 0, 'bytes': 0}
+
+
+def test_disk_backend_is_shared_and_evicts_oldest(tmp_path):
+    backend = DiskBackend(max_bytes=10, directory=str(tmp_path))
+    backend.set('a', 'aaaa')
+    backend.set('b', 'bbbb')
+    # Another worker's backend on the same directory sees them
+    other = DiskBackend(max_bytes=10, directory=str(tmp_path))
+    assert other.get('b') == 'bbbb'
+
+    # The LRU order is the file mtime, which a hit bumps
+    os.utime(tmp_path / 'a.json', ns=(1, 1))
+    os.utime(tmp_path / 'b.json', ns=(2, 2))
+    backend.set('c', 'cccc')
+    assert backend.get('a') is None
+    assert other.get('b') == 'bbbb'
+    assert backend.info()['entries'] == 2
+    assert backend.evictions == 1
+
+
+@pytest.mark.parametrize('backend', ['memory', 'disk'])
+def test_clear_empties_the_cache(backend, tmp_path, monkeypatch):
+    monkeypatch.setitem(figcache.BACKENDS, 'disk', lambda max_bytes:
+                        DiskBackend(max_bytes, str(tmp_path)))
+    cache = FigureCache(backend)
+    cache.get_or_build('key', Builds())
+    cache.clear()
+    assert cache.stats()['entries'] == 0
+
+
+def test_cached_figure_keys_on_the_tokens_version():
+    cache = FigureCache('memory')
+    build = Builds()
+    versions = {'page-1': 'v1', 'page-2': 'v1', 'page-3': 'v2'}
+
+    @cached_figure(cache, 'barchart1', versions.get)
+    def figure(risk_types, token):
+        return build(risk_types)
+
+    figure('All', 'page-1')
+    # Another page on the same version shares the entry
+    figure('All', 'page-2')
+    assert build.calls == 1
+    figure('Fraud', 'page-2')
+    figure('All', 'page-3')
+    assert build.calls == 3
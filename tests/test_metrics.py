@@ -0,0 +1,77 @@
+import dash
+import dash_html_components as html
+import pytest
+from dash.dependencies import Input, Output
+from dash.exceptions import PreventUpdate
+
+from raca.metrics import (CallbackMetrics, Histogram, instrument_callbacks,
+                          metrics_text)
+
+
+def test_histogram_buckets_are_cumulative_and_inclusive():
+    histogram = Histogram([1, 10])
+    for value in (0.5, 1, 5, 50):
+        histogram.observe(value)
+    assert list(histogram.lines('size', 'callback="x"')) == [
+        'size_bucket{callback="x",le="1"} 2',
+        'size_bucket{callback="x",le="10"} 3',
+        'size_bucket{callback="x",le="+Inf"} 4',
+        'size_sum{callback="x"} 56.5',
+        'size_count{callback="x"} 4']
+
+
+def test_labels_are_escaped():
+    metrics = CallbackMetrics()
+    metrics.observe_call('say "hi"', 0.1, ['a\\b.value'], 'prevented')
+    text = metrics_text(metrics)
+    assert 'raca_callback_prevented_total{callback="say \\"hi\\""} 1' in text
+    assert 'input="a\\\\b.value"} 1' in text
+
+
+@pytest.fixture
+def app():
+    app = dash.Dash(__name__)
+    app.layout = html.Div([html.Div(id='source'), html.Div(id='target')])
+    metrics = CallbackMetrics()
+    callback = instrument_callbacks(app, metrics)
+
+    @callback(Output('target', 'children'), [Input('source', 'children')])
+    def echo(value):
+        if value == 'prevent':
+            raise PreventUpdate
+        if value == 'fail':
+            raise ValueError(value)
+        return value * 100
+
+    return app.server.test_client(), metrics
+
+
+def post(client, value):
+    return client.post('/_dash-update-component', json={
+        'output': 'target.children',
+        'outputs': {'id': 'target', 'property': 'children'},
+        'inputs': [{'id': 'source', 'property': 'children', 'value': value}],
+        'changedPropIds': ['source.children']})
+
+
+def test_callbacks_are_timed_sized_and_counted(app):
+    client, metrics = app
+    assert post(client, 'x').status_code == 200
+    assert post(client, 'prevent').status_code == 204
+    assert post(client, 'fail').status_code == 500
+
+    name = 'echo:target.children'
+    stats = metrics.callbacks[name]
+    assert stats.latency.count == 3
+    assert (stats.prevented, stats.errors) == (1, 1)
+    assert stats.triggers == {'source.children': 3}
+    # Only the response that went back is sized
+    assert stats.size.count == 1 and stats.size.sum > 100
+
+    response = client.get('/metrics')
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert (f'raca_callback_duration_seconds_count{{callback="{name}"}} 3'
+            in text)
+    assert (f'raca_callback_triggers_total{{callback="{name}",'
+            'input="source.children"} 3') in text
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+from raca.dataset import Dataset
+from raca.model import RacaModel, get_model
+
+
+def frame():
+    # Two risks sharing control C1, which has two actions; R2 is scored
+    # differently on its second row
+    return pd.DataFrame({
+        'risk_id': ['R1', 'R1', 'R2', 'R2', None],
+        'risk_title': ['One', 'One', 'Two', 'Two', None],
+        'gross_impact': [12.0, 12.0, 6.0, 9.0, np.nan],
+        'control_id': ['C1', 'C1', 'C1', 'C2', 'C3'],
+        'control_title': ['Check', 'Check', 'Check', 'Sign', 'Loose'],
+        'action_id': ['A1', 'A2', 'A1', None, None],
+        'action_description': ['Fix', 'Chase', 'Fix', None, None],
+    })
+
+
+def test_risks_take_the_first_row_of_each_risk():
+    model = RacaModel(frame())
+    assert list(model.risks.index) == ['R1', 'R2']
+    assert model.risk('R2')['gross_impact'] == 6.0
+    assert model.risk('R1')['risk_title'] == 'One'
+
+
+def test_only_risks_are_built_up_front():
+    model = RacaModel(frame())
+    assert model.nbytes().keys() == {'risks'}
+    assert list(model.controls.index) == ['C1', 'C2', 'C3']
+    assert model.nbytes().keys() == {'risks', 'controls'}
+    assert model.controls is model.controls
+
+
+def test_children_follow_the_sheet():
+    model = RacaModel(frame())
+    assert list(model.controls_for('R1').index) == ['C1']
+    assert list(model.controls_for('R2').index) == ['C1', 'C2']
+    assert list(model.actions_for('C1').index) == ['A1', 'A2']
+    assert list(model.actions_for('C2').index) == []
+    assert list(model.links['risk']) == [0, 0, 1, 1, -1]
+    assert list(model.links['action']) == [0, 1, 0, -1, -1]
+
+
+def test_model_is_kept_per_dataset():
+    dataset = Dataset(frame(), 'v1', 'sheet.csv')
+    assert get_model(dataset) is get_model(dataset)
+    other = Dataset(frame(), 'v2', 'sheet.csv')
+    assert get_model(other) is not get_model(dataset)
@@ -0,0 +1,22 @@
+import pandas as pd
+
+from raca.prepare import parse_risk_ids
+from raca.schema import UNMAPPED
+
+
+def test_risk_id_parts():
+    parts = parse_risk_ids(pd.Series(['AP-P01-R04', 'gmbh', None]))
+
+    assert list(parts['bu_prefix'].iloc[:2]) == ['AP', 'GMBH']
+    assert list(parts['process_no'].iloc[:1]) == [1]
+    assert list(parts['risk_no'].iloc[:1]) == [4]
+    assert parts['process_no'].isna().tolist() == [False, True, True]
+    assert list(parts['business_unit']) == ['Accounts Payable', UNMAPPED,
+                                            UNMAPPED]
+
+
+def test_large_risk_numbers():
+    parts = parse_risk_ids(pd.Series(['AP-P01-R40000', 'AP-P70000-R71792']))
+
+    assert list(parts['risk_no']) == [40000, 71792]
+    assert list(parts['process_no']) == [1, 70000]
@@ -0,0 +1,231 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from raca import query
+from raca.dataset import Dataset
+from raca.query import (filter_mask, parse_filter_query, table_page,
+                        table_positions)
+
+
+def frame():
+    return pd.DataFrame({
+        'risk_id': ['AP-P01-R01', 'AP-P02-R02', 'BP-P01-R03', 'BP-P02-R04',
+                    'CP-P01-R05'],
+        'owner': pd.Categorical(['John Doe', 'jane roe', 'John Doe', ' ',
+                                 None]),
+        'gross': [12.0, 6.0, 20.0, np.nan, 9.0],
+        'title': ['Cards && Loans', 'Say "hi"', "O'Brien", 'plain', 'x'],
+        'due': ['2021-03-01', '2021-04-15', '2020-12-31', None,
+                '2021-03-31'],
+    })
+
+
+def rows(filter_query, df=None):
+    mask = filter_mask(frame() if df is None else df, filter_query)
+    return list(np.flatnonzero(mask))
+
+
+@pytest.mark.parametrize('filter_query, expected', [
+    ('{gross} = 12', [0]),
+    ('{gross} eq 12', [0]),
+    ('{gross} != 12', [1, 2, 3, 4]),
+    ('{gross} ne 12', [1, 2, 3, 4]),
+    ('{gross} < 12', [1, 4]),
+    ('{gross} lt 12', [1, 4]),
+    ('{gross} <= 12', [0, 1, 4]),
+    ('{gross} le 12', [0, 1, 4]),
+    ('{gross} > 9', [0, 2]),
+    ('{gross} gt 9', [0, 2]),
+    ('{gross} >= 9', [0, 2, 4]),
+    ('{gross} ge 9', [0, 2, 4]),
+    ('{risk_id} contains P01', [0, 2, 4]),
+    ('{due} datestartswith 2021-03', [0, 4]),
+    ('{owner} is blank', [3, 4]),
+    ('{owner} is nil', [3, 4]),
+    ('{owner} is not blank', [0, 1, 2]),
+    ('{owner} is not nil', [0, 1, 2]),
+    ('{gross} is blank', [3]),
+])
+def test_operators(filter_query, expected):
+    assert rows(filter_query) == expected
+
+
+@pytest.mark.parametrize('filter_query, expected', [
+    ('{owner} = "John Doe"', [0, 2]),
+    ('{owner} s= "john doe"', []),
+    ('{owner} i= "john doe"', [0, 2]),
+    ('{owner} scontains JOHN', []),
+    ('{owner} icontains JOHN', [0, 2]),
+    ('{risk_id} idatestartswith ap', [0, 1]),
+])
+def test_case_flags(filter_query, expected):
+    assert rows(filter_query) == expected
+
+
+@pytest.mark.parametrize('filter_query, expected', [
+    ('{title} = "Cards && Loans"', [0]),
+    ("{title} = 'Cards && Loans'", [0]),
+    ('{title} = `Cards && Loans`', [0]),
+    ('{title} contains "s && L" && {gross} > 10', [0]),
+    ('{title} = "Say \\"hi\\""', [1]),
+    ("{title} = O'Brien", [2]),
+    ("{title} = O'Brien && {gross} = 20", [2]),
+    ('{risk_id} contains "AP" && {gross} > 10', [0]),
+])
+def test_quoted_values(filter_query, expected):
+    assert rows(filter_query) == expected
+
+
+def test_parse_filter_query():
+    assert parse_filter_query('{owner} i= "John Doe" && {gross} >= 9') == [
+        ('owner', 'eq', 'John Doe', False), ('gross', 'ge', 9.0, True)]
+    assert parse_filter_query('') == []
+    assert parse_filter_query(None) == []
+
+
+def test_no_filter_is_no_mask():
+    assert filter_mask(frame(), '') is None
+
+
+def test_text_against_a_number_column_never_matches():
+    assert rows('{gross} = twelve') == []
+
+
+@pytest.mark.parametrize('filter_query, error', [
+    ('gross = 12', 'Unsupported filter'),
+    ('{gross} like 12', 'Unsupported filter'),
+    ('{gross} = 12 && ', None),
+    ('{nope} = 12', 'Unknown column in filter: nope'),
+    ('{gross} >', 'Filter on gross needs a value'),
+])
+def test_bad_filters(filter_query, error):
+    if error is None:
+        # A trailing separator is only an empty term
+        assert rows(filter_query) == [0]
+        return
+    with pytest.raises(ValueError, match=error):
+        filter_mask(frame(), filter_query)
+
+
+@pytest.mark.parametrize('filter_query', [
+    '{owner} = "John Doe"', '{owner} i= "JOHN DOE"', '{owner} != "John Doe"',
+    '{owner} contains o', '{owner} icontains J', '{owner} > j',
+    '{owner} is blank', '{owner} is not blank',
+])
+def test_categorical_mask_matches_text(filter_query):
+    df = frame()
+    text = df.assign(owner=df['owner'].astype(object))
+
+    assert rows(filter_query, df) == rows(filter_query, text)
+
+
+def test_categorical_tests_each_category_once():
+    series = pd.Series(pd.Categorical(['a', 'b', 'a', None, 'b', 'a']))
+    seen = []
+
+    def test(strings):
+        seen.append(len(strings))
+        return strings == 'a'
+    mask = query._text_mask(series, test)
+
+    assert seen == [2]
+    assert list(mask) == [True, False, True, False, False, True]
+
+
+# ------------------------------------------------------------------------------
+# Sort orders, cached per dataset version and view
+# ------------------------------------------------------------------------------
+BY_GROSS = [{'column_id': 'gross', 'direction': 'desc'}]
+BY_OWNER = [{'column_id': 'owner', 'direction': 'asc'},
+            {'column_id': 'risk_id', 'direction': 'desc'}]
+
+
+def test_sort_order():
+    dataset = Dataset(frame(), 1, 'raca.csv')
+
+    assert list(table_positions(dataset, 'all', dataset.df,
+                                BY_GROSS)) == [2, 0, 4, 1, 3]
+    assert list(table_positions(dataset, 'all', dataset.df, BY_GROSS,
+                                '{risk_id} contains AP')) == [0, 1]
+
+
+def test_sort_order_is_cached_per_version_and_view():
+    first = Dataset(frame(), 1, 'raca.csv')
+    second = Dataset(frame(), 2, 'raca.csv')
+
+    order = table_positions(first, 'all', first.df, BY_GROSS)
+
+    assert table_positions(first, 'all', first.df, BY_GROSS) is order
+    assert list(first.cached(('sort_orders', 'all'))) == [(('gross',
+                                                            'desc'),)]
+    assert first.cached(('sort_orders', 'risks')) is None
+    assert second.cached(('sort_orders', 'all')) is None
+    assert table_positions(second, 'all', second.df, BY_GROSS) is not order
+
+
+def test_sort_cache_keeps_the_latest(monkeypatch):
+    monkeypatch.setattr(query, 'SORT_CACHE_SIZE', 2)
+    dataset = Dataset(frame(), 1, 'raca.csv')
+    by_risk = [{'column_id': 'risk_id', 'direction': 'asc'}]
+
+    for sort_by in (BY_GROSS, BY_OWNER, BY_GROSS, by_risk):
+        table_positions(dataset, 'all', dataset.df, sort_by)
+
+    assert list(dataset.cached(('sort_orders', 'all'))) == [
+        (('gross', 'desc'),), (('risk_id', 'asc'),)]
+
+
+def test_unknown_sort_column():
+    dataset = Dataset(frame(), 1, 'raca.csv')
+
+    with pytest.raises(ValueError, match='Unknown column in sort: nope'):
+        table_positions(dataset, 'all', dataset.df,
+                        [{'column_id': 'nope', 'direction': 'asc'}])
+
+
+def test_table_page():
+    dataset = Dataset(frame(), 1, 'raca.csv')
+
+    page, page_count = table_page(dataset, 'all', dataset.df, 1, 2,
+                                  BY_GROSS)
+
+    assert page_count == 3
+    assert list(page['risk_id']) == ['CP-P01-R05', 'AP-P02-R02']
+
+
+def test_filtered_positions_are_cached_per_version_and_view():
+    first = Dataset(frame(), 1, 'raca.csv')
+    second = Dataset(frame(), 2, 'raca.csv')
+
+    positions = table_positions(first, 'all', first.df, BY_GROSS,
+                                '{risk_id} contains AP')
+
+    assert table_positions(first, 'all', first.df, BY_GROSS,
+                           '{risk_id} contains AP') is positions
+    assert list(table_positions(first, 'all', first.df, None,
+                                '{risk_id} contains AP')) == [0, 1]
+    assert first.cached(('positions', 'risks')) is None
+    assert table_positions(second, 'all', second.df, BY_GROSS,
+                           '{risk_id} contains AP') is not positions
+    assert not positions.flags.writeable
+
+
+def test_filter_cache_keeps_the_latest(monkeypatch):
+    monkeypatch.setattr(query, 'FILTER_CACHE_SIZE', 2)
+    dataset = Dataset(frame(), 1, 'raca.csv')
+
+    for filter_query in ('{gross} > 9', '{gross} > 6', '{gross} > 9',
+                         '{gross} > 1'):
+        table_positions(dataset, 'all', dataset.df, None, filter_query)
+
+    assert list(dataset.cached(('positions', 'all'))) == [
+        ('{gross} > 9', ()), ('{gross} > 1', ())]
+
+
+def test_bad_filter_is_not_cached():
+    dataset = Dataset(frame(), 1, 'raca.csv')
+
+    with pytest.raises(ValueError):
+        table_positions(dataset, 'all', dataset.df, None, '{nope} = 1')
+    assert not dataset.cached(('positions', 'all'))
@@ -0,0 +1,84 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from raca.registry import DatasetRegistry, dataset_sources, frame_bytes
+
+MB = 1024 * 1024
+
+
+class Loader:
+
+    def __init__(self, mb=1):
+        self.rows = mb * MB // 8
+        self.loads = []
+
+    def __call__(self, source):
+        self.loads.append(source)
+        return pd.DataFrame({'value': np.zeros(self.rows)})
+
+
+def registry(names, memory_mb, loader):
+    return DatasetRegistry({name: f'{name}.xlsx' for name in names},
+                           memory_mb=memory_mb, loader=loader)
+
+
+def test_sources_from_a_directory(tmp_path):
+    for name in ('b.xlsx', 'a.csv', '~$b.xlsx', 'notes.txt'):
+        (tmp_path / name).write_text('')
+    assert dataset_sources(str(tmp_path)) == {
+        'a': str(tmp_path / 'a.csv'), 'b': str(tmp_path / 'b.xlsx')}
+
+
+def test_sources_from_a_json_file(tmp_path):
+    config = tmp_path / 'datasets.json'
+    config.write_text(json.dumps({'retail': 'racas/retail.xlsx'}))
+    assert dataset_sources(str(config)) == {
+        'retail': str(tmp_path / 'racas' / 'retail.xlsx')}
+
+
+def test_least_recently_used_dataset_is_dropped():
+    loader = Loader()
+    datasets = registry(['a', 'b', 'c'], 2.5, loader)
+    datasets.get('a')
+    datasets.get('b')
+    datasets.get('a')
+    datasets.get('c')
+
+    stats = datasets.stats()
+    assert [name for name, dataset in stats['datasets'].items()
+            if dataset['loaded']] == ['a', 'c']
+    assert stats['evictions'] == 1
+    assert stats['used_bytes'] <= stats['budget_bytes']
+
+    # A dropped dataset is read again, as a new version
+    assert datasets.get('b').version == 2
+    assert loader.loads == ['a.xlsx', 'b.xlsx', 'c.xlsx', 'b.xlsx']
+
+
+def test_dataset_asked_for_is_kept_over_budget():
+    datasets = registry(['a', 'b'], 0.5, Loader())
+    datasets.get('a')
+    dataset = datasets.get('b')
+    assert dataset.df is datasets.get('b').df
+    assert datasets.stats()['datasets']['b']['bytes'] == frame_bytes(
+        dataset.df)
+    assert not datasets.stats()['datasets']['a']['loaded']
+
+
+def test_no_budget_keeps_everything():
+    datasets = registry(['a', 'b', 'c'], 0, Loader())
+    for name in ('a', 'b', 'c'):
+        datasets.get(name)
+    assert datasets.stats()['evictions'] == 0
+
+
+def test_default_and_unknown_datasets():
+    datasets = registry(['a', 'b'], 0, Loader())
+    assert datasets.get().name == 'a'
+    with pytest.raises(KeyError):
+        datasets.get('c')
+    with pytest.raises(ValueError):
+        DatasetRegistry({'a': 'a.xlsx'}, default='b')
@@ -0,0 +1,94 @@
+import os
+
+import pytest
+
+from raca.dataset import Dataset, DatasetStore, load_raca
+from raca.delta import carry_forward
+from raca.storage import FrameEngine, SQLiteEngine, get_engine, write_sqlite
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                      'clensed.csv')
+
+
+@pytest.fixture
+def store():
+    store = DatasetStore(SAMPLE,
+                         loader=lambda path: load_raca(path, use_cache=False))
+    store.subscribe(carry_forward)
+    return store
+
+
+def test_engine_follows_unchanged_reload(store):
+    old = store.get()
+    get_engine(old).page('all', ['risk_id'], sort_by=[
+        {'column_id': 'risk_id', 'direction': 'asc'}])
+    get_engine(old).taxonomy()
+
+    new = store.reload()
+
+    assert new is not old
+    assert get_engine(new).dataset is new
+    # Plain values are carried over, anything tied to the old version isn't
+    assert new.cached('taxonomy') is old.cached('taxonomy')
+    assert new.cached(('sort_orders', 'all')) is None
+
+
+def test_engine_pages_the_new_frame(store):
+    store.get()
+    new = store.reload()
+
+    rows, page_count = get_engine(new).page('all', ['risk_id'], 0, 10)
+
+    assert list(rows['risk_id']) == list(new.df['risk_id'].iloc[:10])
+    assert page_count == -(-len(new.df) // 10)
+
+
+@pytest.fixture
+def engines(tmp_path):
+    dataset = Dataset(load_raca(SAMPLE, use_cache=False), 1,
+                      str(tmp_path / 'raca.csv'), 'raca')
+    path = str(tmp_path / 'raca.sqlite')
+    write_sqlite(dataset, path)
+    return FrameEngine(dataset), SQLiteEngine(path)
+
+
+@pytest.mark.parametrize('view', ['all', 'risks'])
+@pytest.mark.parametrize('sort_by', [
+    [('business_unit', 'asc')],
+    [('business_unit', 'desc')],
+    # With blanks, which go last either way
+    [('gross_risk', 'asc')],
+    [('gross_risk', 'desc')],
+    [('business_unit', 'desc'), ('net_risk', 'asc')],
+    # Not indexed
+    [('risk_title', 'desc')],
+])
+@pytest.mark.parametrize('filter_query', ['', '{risk_id} contains P0'])
+def test_engines_page_alike(engines, view, sort_by, filter_query):
+    sort_by = [{'column_id': column, 'direction': direction}
+               for column, direction in sort_by]
+    pages = [engine.page(view, ['risk_id', 'gross_risk'], 1, 7, sort_by,
+                         filter_query) for engine in engines]
+
+    assert pages[0][1] == pages[1][1]
+    assert (pages[0][0].reset_index(drop=True).astype(object).values.tolist()
+            == pages[1][0].astype(object).values.tolist())
+
+
+def test_sqlite_counts_each_filter_once(engines, monkeypatch):
+    _, engine = engines
+    query = engine._query
+    counts = []
+
+    def counting(sql, params=()):
+        if sql.startswith('SELECT count(*)'):
+            counts.append(params)
+        return query(sql, params)
+    monkeypatch.setattr(engine, '_query', counting)
+
+    pages = [engine.page('all', ['risk_id'], page, 10, None,
+                         '{risk_id} contains P0') for page in range(3)]
+    engine.page('all', ['risk_id'], 0, 10)
+
+    assert counts == [['P0'], []]
+    assert len({page_count for _, page_count in pages}) == 1
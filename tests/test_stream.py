@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from raca.dataset import Dataset, load_raca
+from raca.storage import FrameEngine, SQLiteEngine, write_sqlite
+from raca.stream import sidebar_filter_query
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                      'clensed.csv')
+
+UNITS = ['Cards && Loans', 'Say "hi"', 'Back\\slash\\', 'Cards']
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def engine(request, tmp_path):
+    df = load_raca(SAMPLE, use_cache=False)
+    df['business_unit'] = np.resize(UNITS, len(df))
+    dataset = Dataset(df.copy(), 1, str(tmp_path / 'raca.csv'), 'raca')
+    if request.param == 'memory':
+        return FrameEngine(dataset), df
+    path = str(tmp_path / 'raca.sqlite')
+    write_sqlite(dataset, path)
+    return SQLiteEngine(path), df
+
+
+@pytest.mark.parametrize('unit', UNITS)
+def test_sidebar_value_is_matched_whole(engine, unit):
+    engine, df = engine
+    query = sidebar_filter_query({'business_unit': unit, 'risk': 'All'})
+
+    total, chunks = engine.rows('all', ['business_unit'], filter_query=query)
+
+    assert total == (df['business_unit'] == unit).sum()
+    assert set(pd.concat(chunks)['business_unit']) == {unit}
+
+
+def test_sidebar_selections_are_all_applied(engine):
+    engine, df = engine
+    risk = df.loc[df['business_unit'] == 'Cards && Loans', 'risk'].iloc[-1]
+    query = sidebar_filter_query({'business_unit': 'Cards && Loans',
+                                  'risk': risk, 'level3': None})
+
+    total, _ = engine.rows('all', ['risk_id'], filter_query=query)
+
+    expected = ((df['business_unit'] == 'Cards && Loans') &
+                (df['risk'] == risk)).sum()
+    assert expected > 0
+    assert total == expected
@@ -0,0 +1,62 @@
+import os
+
+import pandas as pd
+import pytest
+
+from raca.dataset import Dataset, load_raca
+from raca.storage import FrameEngine, SQLiteEngine, write_sqlite
+from raca.taxonomy import ALL, build_taxonomy, get_taxonomy
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                      'clensed.csv')
+
+
+def values(options):
+    return [option['value'] for option in options]
+
+
+def scan(df, parent, child, value):
+    # The dropdown options as a scan of the whole frame would give them
+    if value != ALL:
+        df = df[df[parent].astype(str) == value]
+    return sorted(df[child].astype(str).unique())
+
+
+@pytest.fixture(scope='module')
+def df():
+    return load_raca(SAMPLE, use_cache=False)
+
+
+def test_every_level_matches_a_scan(df):
+    taxonomy = build_taxonomy(df)
+    assert values(taxonomy['risk_types']) == sorted(
+        df['risk_types'].astype(str).unique())
+    for parent, child in (('risk_types', 'risk'), ('risk', 'level3')):
+        for value in [ALL] + list(df[parent].astype(str).unique()):
+            assert values(taxonomy[child][value]) == scan(df, parent, child,
+                                                          value), value
+
+
+def test_options_label_their_value():
+    taxonomy = build_taxonomy(pd.DataFrame({
+        'risk_types': ['Operational', 'Operational', 'Credit'],
+        'risk': ['Fraud', 'Conduct', 'Default'],
+        'level3': ['Card fraud', 'Mis-selling', 'Default'],
+    }))
+    assert taxonomy['risk_types'] == [
+        {'label': 'Credit', 'value': 'Credit'},
+        {'label': 'Operational', 'value': 'Operational'}]
+    assert values(taxonomy['risk']['Operational']) == ['Conduct', 'Fraud']
+    assert values(taxonomy['level3']['Fraud']) == ['Card fraud']
+
+
+def test_taxonomy_is_built_once_per_version(df):
+    dataset = Dataset(df, 1, SAMPLE)
+    assert get_taxonomy(dataset) is get_taxonomy(dataset)
+
+
+def test_sqlite_taxonomy_matches_memory(df, tmp_path):
+    dataset = Dataset(df.copy(), 1, SAMPLE)
+    path = str(tmp_path / 'raca.sqlite')
+    write_sqlite(dataset, path)
+    assert SQLiteEngine(path).taxonomy() == FrameEngine(dataset).taxonomy()
@@ -0,0 +1,81 @@
+import json
+import os
+import shutil
+import subprocess
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from raca import fastjson
+from raca.wire import encode, encode_columnar
+
+RACA_JS = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                       'assets', 'raca.js')
+
+
+def frame():
+    return pd.DataFrame({
+        'risk_id': ['AP-P01-R01', 'AP-P01-R02', 'BP-P01-R03', 'BP-P02-R04'],
+        'risk_types': pd.Categorical(
+            ['Operational Risk', None, 'Operational Risk', 'Credit Risk'],
+            categories=['Credit Risk', 'Market Risk', 'Operational Risk']),
+        'risk_owner': ['John Doe', 'John Doe', None, 'Jane Roe'],
+        'gross_risk': [12.0, np.nan, 6.0, 9.0],
+        'risk_no': pd.array([1, 2, None, 4], dtype='Int64'),
+    })
+
+
+def records(df):
+    # What the DataTable would get from the records format
+    return json.loads(fastjson.dumps(encode(df, 'records')))
+
+
+# The contract assets/raca.js expand_columnar implements
+def expand(page):
+    rows = [{} for _ in range(page['length'])]
+    for name, column in page['columns'].items():
+        if isinstance(column, dict):
+            column = [None if code < 0 else column['dictionary'][code]
+                      for code in column['codes']]
+        for row, value in zip(rows, column):
+            row[name] = value
+    return rows
+
+
+def test_columnar_round_trips_to_records():
+    page = json.loads(fastjson.dumps(encode_columnar(frame())))
+    assert page['length'] == 4
+    assert expand(page) == records(frame())
+
+
+def test_columnar_dictionaries_only_hold_what_the_page_uses():
+    columns = encode_columnar(frame().iloc[1:])['columns']
+    assert columns['risk_types'] == {
+        'dictionary': ['Credit Risk', 'Operational Risk'],
+        'codes': [-1, 1, 0]}
+    assert columns['risk_owner'] == {'dictionary': ['John Doe', 'Jane Roe'],
+                                     'codes': [0, -1, 1]}
+    # No repeats, so no dictionary
+    assert columns['risk_id'] == ['AP-P01-R02', 'BP-P01-R03', 'BP-P02-R04']
+
+
+def test_empty_page():
+    page = encode_columnar(frame().iloc[:0])
+    assert page['length'] == 0
+    assert expand(page) == []
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='needs node')
+@pytest.mark.parametrize('rows', [slice(None), slice(1, 3), slice(0, 0)])
+def test_raca_js_expands_columnar_pages(rows):
+    df = frame().iloc[rows]
+    script = (
+        'var window = {};\n' + open(RACA_JS, encoding='utf-8').read() +
+        '\nvar page = JSON.parse(require("fs").readFileSync(0, "utf8"));\n'
+        'console.log(JSON.stringify('
+        'window.dash_clientside.raca.expand_columnar(page)));\n')
+    result = subprocess.run(['node', '-e', script], check=True,
+                            capture_output=True, text=True,
+                            input=fastjson.dumps(encode_columnar(df)))
+    assert json.loads(result.stdout) == records(df)
@@ -0,0 +1,76 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from raca import cache, workbooks
+from raca.workbooks import (WorkbookErrors, check_schema, load_workbooks,
+                            source_files, sources_stamp)
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                      'clensed.csv')
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'CACHE_DIR', str(tmp_path / 'cache'))
+    for name in ('a-raca.csv', 'b-raca.csv'):
+        shutil.copy(SAMPLE, tmp_path / name)
+    return str(tmp_path / '*-raca.csv')
+
+
+def test_workbooks_are_read_as_one(source):
+    df, report = load_workbooks(source, workers=1)
+    assert len(df) == 2 * report['rows'].iloc[0]
+    assert report['parsed'].all()
+
+    df, report = load_workbooks(source, workers=1)
+    assert not report['parsed'].any()
+
+
+def test_source_files_are_sorted_workbooks(tmp_path):
+    for name in ('b.xlsx', 'a.csv', '~$b.xlsx', 'notes.txt'):
+        (tmp_path / name).write_text('')
+    (tmp_path / 'c.xlsx').mkdir()
+    expected = [str(tmp_path / 'a.csv'), str(tmp_path / 'b.xlsx')]
+    assert source_files(str(tmp_path)) == expected
+    assert source_files(str(tmp_path / '*')) == expected
+
+
+def test_stamp_changes_when_a_workbook_is_added(source, tmp_path):
+    before = sources_stamp(source)
+    shutil.copy(SAMPLE, tmp_path / 'c-raca.csv')
+    assert sources_stamp(source) != before
+
+
+def test_schema_reports_missing_and_extra_columns(tmp_path):
+    df = pd.read_csv(SAMPLE, encoding='utf-8-sig', dtype=str)
+    path = tmp_path / 'extra.csv'
+    df.assign(Notes='x').to_csv(path, index=False)
+    assert check_schema(str(path)) == ['Notes']
+
+    df.drop(columns='Risk ID').to_csv(path, index=False)
+    with pytest.raises(ValueError, match='missing RACA columns: Risk ID'):
+        check_schema(str(path))
+
+
+def test_bad_workbook_fails_the_load(source, tmp_path):
+    pd.read_csv(SAMPLE, encoding='utf-8-sig', dtype=str).drop(
+        columns='Risk ID').to_csv(tmp_path / 'c-raca.csv', index=False)
+    with pytest.raises(WorkbookErrors) as e:
+        load_workbooks(source, workers=1)
+    assert e.value.report['error'].notna().tolist() == [False, False, True]
+    assert 'c-raca.csv' in str(e.value)
+
+
+def test_unreadable_cache_is_a_failed_workbook(source, monkeypatch):
+    read_cache = workbooks.read_cache
+    monkeypatch.setattr(workbooks, 'read_cache', lambda path: (
+        None if path.endswith('b-raca.csv') else read_cache(path)))
+
+    with pytest.raises(WorkbookErrors) as e:
+        load_workbooks(source, workers=1)
+    errors = e.value.report['error']
+    assert errors.notna().tolist() == [False, True]
+    assert 'changed while it was parsed' in errors.iloc[1]